@@ -1,28 +1,43 @@
 import sys
 import os
 import math
+import re
+import time
+
+import hw3_pcfg_metrics
+from hw3_pcfg_grammar import (PROB_SUM_TOLERANCE, CompiledGrammar, GrammarBuilder, GrammarError, Lexicon,
+                              UnaryClosure, fileHash, readRules)
 
 # The start symbol for the grammar
 TOP = "TOP"
 
+# Labels that start with this are the intermediate symbols of binarized rules
+# (see PCFG.binarize); they never show up in output trees
+BINARIZED = "@"
+
 '''
 A grammatical Rule has a probability and a parent category, and is
-extended by UnaryRule and BinaryRule
+extended by UnaryRule and BinaryRule. Its rank is the line of the grammar
+file it was read from: of two rules that give a parse the same score, the
+one with the lower rank wins
 '''
 
 
 class Rule:
-    def __init__(self, probability, parent):
+    __slots__ = ('prob', 'parent', 'rank')
+
+    def __init__(self, probability, parent, rank=0):
         self.prob = probability
         self.parent = parent
+        self.rank = rank
 
     # Factory method for making unary or binary rules (returns None otherwise)
     @staticmethod
-    def createRule(probability, parent, childList):
+    def createRule(probability, parent, childList, rank=0):
         if len(childList) == 1:
-            return UnaryRule(probability, parent, childList[0])
+            return UnaryRule(probability, parent, childList[0], rank)
         elif len(childList) == 2:
-            return BinaryRule(probability, parent, childList[0], childList[1])
+            return BinaryRule(probability, parent, childList[0], childList[1], rank)
         return None
 
     # Returns a tuple containing the rule's children
@@ -42,8 +57,10 @@ A UnaryRule has a probability, a parent category, and a child category/word
 
 
 class UnaryRule(Rule):
-    def __init__(self, probability, parent, child):
-        Rule.__init__(self, probability, parent)
+    __slots__ = ('child',)
+
+    def __init__(self, probability, parent, child, rank=0):
+        Rule.__init__(self, probability, parent, rank)
         self.child = child
 
     # Returns a singleton (tuple) containing the rule's child
@@ -57,8 +74,10 @@ A BinaryRule has a probability, a parent category, and two children
 
 
 class BinaryRule(Rule):
-    def __init__(self, probability, parent, leftChild, rightChild):
-        Rule.__init__(self, probability, parent)
+    __slots__ = ('leftChild', 'rightChild')
+
+    def __init__(self, probability, parent, leftChild, rightChild, rank=0):
+        Rule.__init__(self, probability, parent, rank)
         self.leftChild = leftChild
         self.rightChild = rightChild
 
@@ -73,6 +92,9 @@ An Item stores the label and Viterbi probability for a node in a parse tree
 
 
 class Item:
+    # Items are the bulk of a chart, so none of them carries a __dict__
+    __slots__ = ('label', 'prob', 'numParses')
+
     def __init__(self, label, prob, numParses):
         self.label = label
         self.prob = prob
@@ -90,6 +112,8 @@ doesn't have children, and it has a Viterbi probability of 1.0)
 
 
 class LeafItem(Item):
+    __slots__ = ()
+
     def __init__(self, word):
         # using log probabilities, this is the default value (0.0 = log(1.0))
         Item.__init__(self, word, 0.0, 1)
@@ -102,6 +126,8 @@ stores pointers to the node's child[ren])
 
 
 class InternalItem(Item):
+    __slots__ = ('children',)
+
     def __init__(self, category, prob, children=()):
         Item.__init__(self, category, prob, 0)
         self.children = children
@@ -113,12 +139,214 @@ class InternalItem(Item):
             print("Warning: adding a node with more than two children (CKY may not work correctly)")
 
     # For an internal node, we want to recurse through the labels of the
-    # subtree rooted at this node
+    # subtree rooted at this node. The walk uses its own stack and joins the
+    # parts once, so deep trees neither hit the recursion limit nor copy the
+    # string over and over
     def toString(self):
-        ret = "( " + self.label + " "
-        for child in self.children:
-            ret += child.toString() + " "
-        return ret + ")"
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif isinstance(node, InternalItem):
+                parts.append("( " + node.label + " ")
+                stack.append(")")
+                for child in reversed(node.children):
+                    stack.append(" ")
+                    stack.append(child)
+            else:
+                parts.append(node.label)
+        return "".join(parts)
+
+
+'''
+A LazyItem is the root of a parse tree whose children are only built (by
+calling build()) the first time someone asks for them, so a caller that only
+reads prob and numParses never pays for the tree
+'''
+
+
+class LazyItem(InternalItem):
+    __slots__ = ('build', 'built')
+
+    def __init__(self, category, prob, numParses, build):
+        Item.__init__(self, category, prob, numParses)
+        self.build = build
+        self.built = None
+
+    @property
+    def children(self):
+        if self.build is not None:
+            self.built = self.build()
+            self.build = None
+        return self.built
+
+    # pickles (e.g. from a worker process) as the plain tree
+    def __reduce__(self):
+        return (restoreItem, (self.label, self.prob, self.numParses, self.children))
+
+
+def restoreItem(label, prob, numParses, children):
+    # children are set after the fact: an un-binarized node can have more
+    # than two, which InternalItem would warn about
+    item = InternalItem(label, prob)
+    item.children = children
+    item.numParses = numParses
+    return item
+
+
+# The tokens of a bracketed tree: brackets, and labels or words between them
+TREE_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+
+'''
+Reads a tree in the bracketed format of InternalItem.toString,
+"( TOP ( S ( NP ( DT the ) ( NN man ) ) ... ) )"; the spaces around the
+brackets are optional. Returns the InternalItem of the root, whose nodes
+carry no prob (0.0) or numParses (None). Raises ValueError if the text is
+not exactly one well-formed tree
+'''
+
+
+def readTree(text):
+    tokens = TREE_TOKEN.findall(text)
+    # the open nodes, as (label, children so far)
+    stack = []
+    root = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if root is not None:
+            raise ValueError("text after the end of the tree: %r" % token)
+        if token == "(":
+            if i + 1 == len(tokens) or tokens[i + 1] in ("(", ")"):
+                raise ValueError("a node without a label")
+            stack.append((tokens[i + 1], []))
+            i += 2
+            continue
+        if not stack:
+            raise ValueError("%r outside of the tree" % token)
+        if token == ")":
+            label, children = stack.pop()
+            if not children:
+                raise ValueError("node %s has no children" % label)
+            item = restoreItem(label, 0.0, None, tuple(children))
+            if stack:
+                stack[-1][1].append(item)
+            else:
+                root = item
+        else:
+            stack[-1][1].append(LeafItem(token))
+        i += 1
+    if root is None:
+        raise ValueError("unbalanced brackets" if stack else "no tree")
+    return root
+
+
+'''
+Returns the children of a node with the intermediate nodes of binarized
+rules (see PCFG.binarize) replaced by their own children. Those are built
+first, so one level of splicing undoes a whole binarized rule
+'''
+
+
+def unbinarize(children):
+    if not any(isinstance(child, InternalItem) and child.label.startswith(BINARIZED) for child in children):
+        return children
+    out = []
+    for child in children:
+        if isinstance(child, InternalItem) and child.label.startswith(BINARIZED):
+            out.extend(child.children)
+        else:
+            out.append(child)
+    return tuple(out)
+
+
+'''
+A ChartItem is the entry of a chart cell for one label. Instead of child
+items it keeps a single integer backpointer `back`:
+  None                      a lexical rule (the cell's word is the child)
+  >= 0                      a binary rule, (split * L + left id) * L + right id
+                            with L labels (see PCFG.ruleIndex)
+  < 0                       the unary chain of closure entry -1 - back
+'''
+
+
+class ChartItem(Item):
+    __slots__ = ('back',)
+
+    def __init__(self, label, prob, numParses=0, back=None):
+        Item.__init__(self, label, prob, numParses)
+        self.back = back
+
+
+'''
+Builds the tree below root without recursion. expand(node) returns
+(label, prob, numParses, children) for a node, where each child is either a
+LeafItem or another node for expand; the InternalItems are built bottom-up,
+without the intermediate nodes of binarized rules
+'''
+
+
+def materialize(root, expand):
+    done = []
+    stack = [(root, None)]
+    while stack:
+        node, built = stack.pop()
+        if built is not None:
+            label, prob, numParses, size = built
+            start = len(done) - size
+            item = restoreItem(label, prob, numParses, unbinarize(tuple(done[start:])))
+            del done[start:]
+            done.append(item)
+        elif isinstance(node, LeafItem):
+            done.append(node)
+        else:
+            label, prob, numParses, children = expand(node)
+            stack.append((None, (label, prob, numParses, len(children))))
+            for child in reversed(children):
+                stack.append((child, None))
+    return done[0]
+
+
+'''
+The glue layer of max_span parsing: joins pieces of a sentence (spans of at
+most maxSpan words) under a flat TOP. best(i, j) returns (log prob, node)
+for the piece over (i, j), or None if there is none, and expand builds the
+subtree of a node as in materialize(). The sentence is cut into the fewest
+pieces, and among those into the ones with the highest product of
+probabilities. Returns (number of pieces, TOP item), or None if the pieces do
+not cover the sentence. The TOP item is not a parse of the grammar, so it
+has no numParses (None)
+'''
+
+
+def glue(n, maxSpan, best, expand):
+    # cost[j] = (pieces, -log prob) of the best cover of the first j words
+    cost = [None] * (n + 1)
+    back = [None] * (n + 1)
+    cost[0] = (0, 0.0)
+    for j in range(1, n + 1):
+        for i in range(max(0, j - maxSpan), j):
+            if cost[i] is None:
+                continue
+            piece = best(i, j)
+            if piece is None:
+                continue
+            candidate = (cost[i][0] + 1, cost[i][1] - piece[0])
+            if cost[j] is None or candidate < cost[j]:
+                cost[j] = candidate
+                back[j] = (i, piece[1])
+    if n == 0 or cost[n] is None:
+        return None
+    nodes = []
+    j = n
+    while j > 0:
+        j, node = back[j]
+        nodes.append(node)
+    nodes.reverse()
+    return len(nodes), LazyItem(TOP, -cost[n][1], None,
+                                lambda: unbinarize(tuple(materialize(node, expand) for node in nodes)))
 
 
 '''
@@ -129,20 +357,64 @@ Your task is to implement the stubs provided in this class
 
 
 class Cell:
-    def __init__(self):
-        self.items = {}
+    __slots__ = ('items', 'bases', 'max_label', 'max_prob', 'labelIds', 'labels')
 
-    def addItem(self, item):
+    def __init__(self, labelIds=None):
+        self.items = {}
+        # the items (as the binary/lexical rules left them) that a unary
+        # chain has since replaced; unary chains are built on top of these
+        self.bases = None
+        self.max_label = None
+        self.max_prob = float('-inf')
+        # bitset of the labels that have an item in this cell (bit
+        # labelIds[label])
+        self.labelIds = labelIds
+        self.labels = 0
+
+    def addItem(self, item, prob=None):
+        if prob is not None:
+            item.prob = prob
+        if item.prob > self.max_prob:
+            self.max_label = item.label
+            self.max_prob = item.prob
+        if self.labelIds is not None and item.label in self.labelIds:
+            self.labels |= 1 << self.labelIds[item.label]
         self.items[item.label] = item
 
+    # Returns the item for a label, or None; a lookup never adds anything
     def getItem(self, label):
-        if label not in self.items:
-            self.items[label] = InternalItem(label, float('-inf'))
-        return self.items[label]
+        return self.items.get(label)
+
+    # Returns the item for a label, adding an empty one (no derivation yet,
+    # log prob -inf) if the cell has none
+    def getOrAddItem(self, label):
+        item = self.items.get(label)
+        if item is None:
+            item = ChartItem(label, float('-inf'))
+            self.items[label] = item
+        return item
+
+    # Returns the item for a label from before the unary closure, or None if
+    # only a unary chain derives the label here
+    def getBaseItem(self, label):
+        if self.bases is not None and label in self.bases:
+            return self.bases[label]
+        item = self.items.get(label)
+        if item is None or (item.back is not None and item.back < 0):
+            return None
+        return item
 
     def getItems(self):
         return [self.items[label] for label in self.items]
 
+    def removeItem(self, label):
+        del self.items[label]
+        if self.labelIds is not None and label in self.labelIds:
+            self.labels &= ~(1 << self.labelIds[label])
+
+
+# The (read-only) cell of every span that has no items
+EMPTY_CELL = Cell()
 
 '''
 A Chart stores a Cell for every possible (contiguous) span of a sentence
@@ -152,19 +424,141 @@ Your task is to implement the stubs provided in this class
 
 
 class Chart:
-    def __init__(self, sentence):
-        self.cells = {}
+    __slots__ = ('cells', 'words', 'tokens', 'n', 'S', 'pruned', 'labelIds')
+
+    def __init__(self, sentence, labelIds=None, tokens=None):
+        self.words = sentence
+        # what the lexicon is asked for each word (see Lexicon.tokens)
+        self.tokens = sentence if tokens is None else tokens
         self.n = len(sentence)
-        self.S = (self.n, self.n)
-        for i in range(self.n + 1):
-            for j in range(i, self.n + 1):
-                self.cells[(i, j)] = Cell()
+        self.S = (0, self.n)
+        self.labelIds = labelIds
+        # number of items dropped by beam/threshold pruning
+        self.pruned = 0
+        # the cells of the spans (i, j), 0 <= i < j <= n, row after row in a
+        # flat list (see index()); None for spans with no items
+        self.cells = [None] * (self.n * (self.n + 1) // 2)
+
+    # Position of span (i, j) in self.cells: row i holds the n - i spans
+    # (i, i + 1) ... (i, n), after the i * n - i * (i - 1) / 2 spans of the
+    # rows above it
+    def index(self, i, j):
+        return i * self.n - i * (i - 1) // 2 + j - i - 1
 
     def getRoot(self):
-        return self.cells[self.S]
+        return self.getCell(0, self.n)
 
+    # Spans without items all share EMPTY_CELL, which must not be modified;
+    # fill a newCell() and setCell() it instead
     def getCell(self, i, j):
-        return self.cells[(i, j)]
+        cell = self.cells[self.index(i, j)]
+        return EMPTY_CELL if cell is None else cell
+
+    def newCell(self):
+        return Cell(self.labelIds)
+
+    def setCell(self, i, j, cell):
+        if cell.items:
+            self.cells[self.index(i, j)] = cell
+
+
+'''
+The semiring of CKY itself, as PCFG.fillColumn takes it: a cell keeps, for
+every label, the best derivation (its log prob and backpointer) and the
+number of derivations. newChart() makes the chart, leaves() fills a leaf
+cell from the lexical rules of its word, binary() adds the derivations over
+one split point and returns (rule applications, improvements), and close()
+applies the unary closure to a complete cell. SemiringCKY
+(hw3_pcfg_semiring.py) does the same for any semiring; scan selects the
+first-cut loop over every binary rule (PCFG.scanRules)
+'''
+
+
+class ViterbiCKY:
+    def __init__(self, pcfg, scan=False):
+        self.pcfg = pcfg
+        self.scan = scan
+        self.labelIds, labels, self.leftRules, self.ranks = pcfg.ruleIndex()
+        self.LL = len(labels) * len(labels)
+
+    def newChart(self, sentence, tokens=None):
+        return Chart(sentence, self.labelIds, tokens)
+
+    def leaves(self, cell, labels, probs):
+        for label, prob in zip(labels, probs):
+            cell.addItem(ChartItem(label, prob, 1))
+
+    def binary(self, A_cell, B_cell, C_cell, k):
+        if self.scan:
+            return self.pcfg.scanRules(self.labelIds, A_cell, B_cell, C_cell, k)
+        return self.pcfg.indexedRules(self.leftRules, self.ranks, self.LL, A_cell, B_cell, C_cell, k)
+
+    def close(self, cell):
+        self.pcfg.applyUnaries(cell)
+
+
+'''
+ParseStats collects what happened during one call to PCFG.CKY; pass one in
+with stats=ParseStats() to get it filled in. Passing one also turns on the
+phase timers and chart counters, which cost nothing when stats is None
+'''
+
+
+class ParseStats:
+    def __init__(self, spans=False):
+        # items dropped from chart cells by beam/threshold pruning
+        self.pruned = 0
+        # agenda operations of the 'astar' engine
+        self.popped = 0
+        self.pushed = 0
+        # positions of the words the lexicon has no rules for; CKY gives up
+        # on such a sentence before filling any cell
+        self.unknown = []
+        # with max_span: the number of pieces the glue layer joined under TOP
+        # (0 if the grammar parsed the sentence)
+        self.glue = 0
+        # whether the result came from the result cache
+        self.cached = False
+        # wall time of the whole parse, and per phase: 'lexical' (the
+        # diagonal), 'binary', 'unary' and 'prune' for the chart engines,
+        # 'search' for astar, and 'tree' for building the tree, which happens
+        # when its children are first asked for
+        self.seconds = 0.0
+        self.phases = {}
+        # cells filled, (left item, right item) pairs tried, binary rule
+        # applications, items added to cells, items replaced by a better
+        # derivation, and the most items in one cell
+        self.cells = 0
+        self.pairs = 0
+        self.applications = 0
+        self.added = 0
+        self.replaced = 0
+        self.maxCell = 0
+        # with spans=True, the work of every cell (i, j) filled, as
+        # (i, j, items, rule applications, seconds), where items are counted
+        # after the unary closure and before pruning (see hw3_pcfg_heatmap.py)
+        self.spans = [] if spans else None
+
+    # Adds the time since mark to a phase; returns the time now, as the mark
+    # of the next phase
+    def lap(self, phase, mark):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - mark
+        return now
+
+    # Wraps the build function of a LazyItem so that building the tree counts
+    # as the 'tree' phase (here and in the metrics aggregator)
+    def timeTree(self, build):
+        def timed():
+            mark = time.perf_counter()
+            built = build()
+            seconds = time.perf_counter() - mark
+            self.lap('tree', mark)
+            metrics = hw3_pcfg_metrics.aggregator()
+            if metrics is not None:
+                metrics.observe('phase_seconds', seconds, phase='tree')
+            return built
+        return timed
 
 
 '''
@@ -174,42 +568,154 @@ produce a Viterbi parse for a sentence if one exists
 
 
 class PCFG:
-    def __init__(self, grammarFile, debug=False):
-        self.ckyRules = {}
+    def __init__(self, grammarFile, debug=False, engine='python', cache=False, signatures=False,
+                 renormalize=False):
+        # rebuilt from the compiled grammar if something asks for it (see
+        # ckyRules)
+        self._ckyRules = None
+        # intermediate symbols of binarized n-ary rules (see binarize())
+        self.binarizedSymbols = set()
+        # with renormalize, the rules of a parent whose probabilities do not
+        # sum to 1 are scaled so that they do; unnormalized maps each such
+        # parent to its sum in the file (the compiled grammar cache keeps it)
+        self.renormalize = renormalize
+        self.unnormalized = {}
+        # names the files derived from a grammar read differently (see
+        # hw3_pcfg_grammar.cachePath)
+        self.variant = 'renormalized' if renormalize else None
         self.debug = debug
-        self.readGrammar(grammarFile)
+        # kept so that worker processes can load the same grammar
+        self.grammarFile = grammarFile
+        self.cache = cache
+        # 'python' is the reference CKY below, 'numpy' the vectorized one in
+        # hw3_pcfg_numpy.py; both return the same trees, scores and counts.
+        # 'scan' is the reference CKY with its first-cut inner loop over every
+        # binary rule, kept as the baseline for hw3_pcfg_bench.py. 'astar'
+        # (hw3_pcfg_astar.py) finds the same Viterbi tree best first, without
+        # filling the whole chart, but does not count numParses
+        self.engine = engine
+        self._numpyEngine = None
+        self._astarEngine = None
+        # scan -> ViterbiCKY and semiring -> SemiringCKY (see fillColumn() and
+        # semiringParse())
+        self._viterbiEngines = {}
+        self._semiringEngines = {}
+        self._ruleIndex = None
+        self._edgeIndex = None
+        self._binaryRules = None
+        # see enableResultCache()
+        self.resultCache = None
+        # the integer-indexed form of the grammar (see hw3_pcfg_grammar.py)
+        if cache and os.path.isfile(grammarFile):
+            # With cache=True the compiled grammar is mapped from
+            # <grammarFile>c when it matches the file's contents
+            self.grammar, _ = CompiledGrammar.forFile(grammarFile, lambda sha1: self.readGrammar(grammarFile, sha1),
+                                                      self.variant)
+        else:
+            self.grammar = self.readGrammar(grammarFile)
+        self.unnormalized = dict(self.grammar.unnormalized)
+        if self.unnormalized and debug and not renormalize:
+            print("Warning: the rules of %d parent(s) do not sum to 1 (%s)" % (
+                len(self.unnormalized),
+                ", ".join("%s: %g" % item for item in sorted(self.unnormalized.items())[:10])))
         self.topCheck()
+        if debug and any(self.binarization()):
+            print("Binarized n-ary rules: added %d rules and %d symbols" % self.binarization())
+        # the lexical rules by word; with signatures, unknown words back off
+        # to their word-shape classes (see Lexicon)
+        self.lexicon = Lexicon(self.grammar, signatures)
+        # best unary chains (TOP -> S, NP -> NN, ...), applied to every cell
+        # once its binary rules are done; raises UnaryCycleError if the unary
+        # rules form a cycle
+        self.closure = UnaryClosure(self.unaryRules(), grammarFile)
+
+    # The rules as Rule objects, by children (children tuple -> set of rules),
+    # rebuilt from the compiled grammar the first time they are asked for
+    @property
+    def ckyRules(self):
+        if self._ckyRules is None:
+            self._ckyRules = self.grammar.ckyRules()
+        return self._ckyRules
+
+    # The compiled (integer-indexed) grammar
+    def compiledGrammar(self):
+        return self.grammar
 
     '''
-    Reads the rules for this grammar from an input file
+    Reads the rules for this grammar from an input file, streaming it (see
+    readRules) straight into a GrammarBuilder, and checking in the same pass
+    that the rules of every parent sum to about 1. Returns the compiled
+    grammar; raises a GrammarError that lists the malformed lines, if there
+    are any
     '''
 
-    def readGrammar(self, grammarFile):
+    def readGrammar(self, grammarFile, sha1=None):
+        builder = GrammarBuilder()
+        totals = {}
         if os.path.isfile(grammarFile):
-            file = open(grammarFile, "r")
-            for line in file:
-                raw = line.split()
+            errors = []
+            for number, prob, parent, children in readRules(grammarFile, errors):
+                totals[parent] = totals.get(parent, 0.0) + prob
+                if len(children) > 2:
+                    children = self.binarize(children, builder, number)
                 # reminder, we're using log probabilities
-                prob = math.log(float(raw[0]))
-                parent = raw[1]
-                children = raw[3:]
-                rule = Rule.createRule(prob, parent, children)
-                if rule.children() not in self.ckyRules:
-                    self.ckyRules[rule.children()] = set([])
-                self.ckyRules[rule.children()].add(rule)
-        print("???????????????????????????????????????")
-        print(self.ckyRules)
-        print("???????????????????????????????????????")
+                builder.add(math.log(prob), parent, children, number)
+            if errors:
+                raise GrammarError(grammarFile, errors)
+        return builder.build(sha1, self.checkSums(totals), self.renormalize)
+
+    '''
+    Returns the parents whose rule probabilities sum to more than
+    PROB_SUM_TOLERANCE away from 1, with their sums
+    '''
+
+    def checkSums(self, totals):
+        return dict((parent, total) for parent, total in totals.items() if abs(total - 1.0) > PROB_SUM_TOLERANCE)
+
+    '''
+    Binarizes the children of an n-ary rule from the left: A -> B C D E
+    becomes A -> @B|C|D E, with @B|C -> B C and @B|C|D -> @B|C D at prob 1.
+    An intermediate symbol stands for a prefix of children, whatever the
+    parent, so rules that share a prefix share its symbols and each symbol
+    has a single rule; parse scores and counts are those of the n-ary
+    grammar. Returns the two children of the binarized rule
+    '''
+
+    def binarize(self, children, builder, rank=0):
+        left = children[0]
+        for end in range(2, len(children)):
+            prefix = BINARIZED + "|".join(children[:end])
+            if prefix not in self.binarizedSymbols:
+                self.binarizedSymbols.add(prefix)
+                builder.add(0.0, prefix, [left, children[end - 1]], rank)
+            left = prefix
+        return [left, children[-1]]
+
+    '''
+    Returns (rules, symbols) added by binarizing the n-ary rules of the
+    grammar. Every intermediate symbol comes with exactly one rule, so the
+    two are equal; each adds a label to every chart cell it can reach
+    '''
+
+    def binarization(self):
+        added = sum(1 for label in self.grammar.symbols if label.startswith(BINARIZED))
+        return added, added
+
+    '''
+    Returns the unary rules between nonterminals as (parent, child, log prob);
+    a unary rule whose child is not the parent of any rule is lexical
+    '''
+
+    def unaryRules(self):
+        return self.grammar.unaryRules()
 
     '''
     Checks that the grammar at least matches the start symbol (TOP)
     '''
 
     def topCheck(self):
-        for rhs in self.ckyRules:
-            for rule in self.ckyRules[rhs]:
-                if rule.parent == TOP:
-                    return  # TOP generates at least one other symbol
+        if self.grammar.hasParent(TOP):
+            return  # TOP generates at least one other symbol
         if self.debug:
             print("Warning: TOP symbol does not generate any children (grammar will always fail)")
 
@@ -222,50 +728,663 @@ class PCFG:
                    If no such tree exists, return None\
     '''
 
-    def CKY(self, sentence):
+    def CKY(self, sentence, engine=None, beam=None, threshold=None, stats=None, max_span=None):
+        engine = engine or self.engine
+        if engine not in ('python', 'scan', 'numpy', 'astar'):
+            raise ValueError("Unknown CKY engine: %s" % engine)
+        if engine == 'astar' and (beam is not None or threshold is not None or max_span is not None):
+            # A* finds the Viterbi tree without pruning a chart
+            raise ValueError("beam, threshold and max_span need a chart engine, not astar")
+        if max_span is not None and max_span < 1:
+            raise ValueError("max_span needs a width of at least 1")
+        metrics = hw3_pcfg_metrics.aggregator()
+        if metrics is not None:
+            # instrumented, so there is something to aggregate
+            stats = stats if stats is not None else ParseStats()
+            tree = self.cachedCKY(sentence, engine, beam, threshold, stats, max_span)
+            metrics.record(stats)
+            return tree
+        return self.cachedCKY(sentence, engine, beam, threshold, stats, max_span)
+
+    '''
+    CKY through the result cache, when there is one
+    '''
+
+    def cachedCKY(self, sentence, engine, beam, threshold, stats, max_span):
+        if self.resultCache is None:
+            return self.uncachedCKY(sentence, engine, beam, threshold, stats, max_span)
+
+        key = self.resultCache.key(sentence, engine=engine, beam=beam, threshold=threshold,
+                                   max_span=max_span, signatures=self.lexicon.signatures,
+                                   renormalize=self.renormalize)
+        entry = self.resultCache.get(key)
+        if entry is None:
+            parseStats = ParseStats(spans=stats is not None and stats.spans is not None)
+            tree = self.uncachedCKY(sentence, engine, beam, threshold, parseStats, max_span)
+            self.resultCache.put(key, tree, parseStats)
+            entry = (tree, vars(parseStats))
+        elif stats is not None:
+            stats.cached = True
+        if stats is not None:
+            for name, value in entry[1].items():
+                if name != 'cached':
+                    setattr(stats, name, value)
+        return entry[0]
+
+    '''
+    CKY without the result cache
+    '''
+
+    def uncachedCKY(self, sentence, engine, beam, threshold, stats, max_span):
+        if stats is not None:
+            start = time.perf_counter()
+        tokens = self.tokenize(sentence, stats)
+        if tokens is None:
+            if stats is not None:
+                stats.seconds = time.perf_counter() - start
+            return None
+        if engine == 'numpy':
+            chart, tree = self.numpyEngine().parse(sentence, beam, threshold, tokens, max_span, stats)
+        elif engine == 'astar':
+            chart, tree = self.astarEngine().parse(sentence, tokens)
+            if stats is not None:
+                stats.popped, stats.pushed = chart.popped, chart.pushed
+                stats.lap('search', start)
+        else:
+            chart, applications = self.fillChart(sentence, scan=(engine == 'scan'), beam=beam, threshold=threshold,
+                                                 tokens=tokens, max_span=max_span, stats=stats)
+            tree = self.buildTree(chart)
+            if tree is None and max_span is not None:
+                tree = self.glueTree(chart, max_span)
+
+        pieces = 0
+        if isinstance(tree, tuple):
+            pieces, tree = tree
+        if stats is not None:
+            stats.pruned = chart.pruned
+            stats.glue = pieces
+            if tree is not None:
+                tree.build = stats.timeTree(tree.build)
+            stats.seconds = time.perf_counter() - start
+        return tree
+
+    '''
+    Returns what the lexicon is asked for each word of a sentence (see
+    Lexicon.tokens), or None if some word has no lexical rules, in which case
+    the sentence has no parse. This takes one dict lookup per word, so a
+    hopeless sentence is turned down before any chart is allocated; the
+    positions of its unknown words go to stats.unknown
+    '''
+
+    def tokenize(self, sentence, stats=None):
+        tokens, unknown = self.lexicon.tokens(sentence)
+        if stats is not None:
+            stats.unknown = unknown
+        return None if unknown else tokens
+
+    '''
+    Fills the chart for a sentence. Returns the chart, whose items carry
+    integer backpointers (see ChartItem), and the number of binary rule
+    applications.
+
+    Pruning is opt-in and happens once a cell is complete (the root cell is
+    never pruned): beam keeps the best `beam` items of a cell, threshold
+    drops items whose log prob is more than `threshold` below the cell's best.
+    tokens are the words to look up in the lexicon (see tokenize()), by
+    default the words themselves.
+
+    With max_span, only the cells of spans of up to max_span words are
+    filled, which makes the work linear in the length of the sentence; the
+    root cell stays empty when the sentence is longer (see glueTree()).
+    stats, a ParseStats, turns on the timers and counters of fillColumn.
+    semiring, a SemiringCKY, fills the chart with its values instead (see
+    semiringParse())
+    '''
+
+    def fillChart(self, sentence, scan=False, beam=None, threshold=None, tokens=None, max_span=None, stats=None,
+                  semiring=None):
         # func probabilistic-CKY(words, grammar) returns most
         # probabilistic parse and its probability
         words = sentence
-        grammar = self.ckyRules
-        chart = Chart(sentence)
-        back = {}
+        semiring = self.viterbiEngine(scan) if semiring is None else semiring
+        chart = semiring.newChart(sentence, tokens)
+        applications = 0
 
         # i: rows, j: cols
-        for j in range(1, len(words)):
-            # Fill leaves on diagonals
-            chart.getCell(j - 1, j).addItem(LeafItem(words[j]))
-
-            # Move right through the columns and Up through the rows
-            for i in reversed(range(j - 2)):
-                for k in range(i + 1, j):
-                    for children in grammar:
-                        # Check if BinaryRule
-                        if len(children) == 1:
-                            continue
-
-                        # Check if table[i,k,B] > 0
-                        B_cell = chart.getCell(i, k)
-                        t_B = B_cell.getItem(children[0]).prob
-                        if t_B == float('-inf'):
-                            continue
-
-                        # Check if table[k,j,C] > 0
-                        C_cell = chart.getCell(k, j)
-                        t_C = C_cell.getItem(children[1]).prob
-                        if t_C == float('-inf'):
-                            continue
-
-                        for rule in grammar[children]:
-                            # Check if table[i,j,A] < P (A -> BC) * table[i,j,B] * table[i,j,C]
-                            A_cell = chart.getCell(i, j)
-                            item = A_cell.getItem(rule.parent)
-                            t_A_ = math.log(rule.prob) + t_B + t_C
-                            if item.prob < t_A_:
-                                item.prob = t_A_
-                                back[(i, j, rule.parent)] = (k, *children)
-
-        print(chart)
-        return None
+        for j in range(1, len(words) + 1):
+            applications += self.fillColumn(chart, j, scan, beam, threshold, max_span, stats, semiring)
+        return chart, applications
+
+    # The ViterbiCKY of the indexed (or with scan, the first-cut) rule loop
+    def viterbiEngine(self, scan=False):
+        if scan not in self._viterbiEngines:
+            self._viterbiEngines[scan] = ViterbiCKY(self, scan)
+        return self._viterbiEngines[scan]
+
+    '''
+    Fills the cells (i, j) of column j, for every i < j, from the word j - 1
+    and the columns before it (see fillChart). Returns the number of binary
+    rule applications. With stats, the phase timers and chart counters of
+    the ParseStats are updated as well; without, none of that is done. The
+    cells are filled through semiring (ViterbiCKY by default, see
+    fillChart), which decides what a cell keeps of its derivations
+    '''
+
+    def fillColumn(self, chart, j, scan=False, beam=None, threshold=None, max_span=None, stats=None, semiring=None):
+        semiring = self.viterbiEngine(scan) if semiring is None else semiring
+        applications = 0
+        prune = beam is not None or threshold is not None
+        if stats is not None:
+            mark = time.perf_counter()
+
+        # Fill leaves on diagonals
+        leaf_cell = chart.newCell()
+        leaves, probs = self.lexicon.lookup(chart.tokens[j - 1]) or ((), ())
+        semiring.leaves(leaf_cell, leaves, probs)
+        if stats is not None:
+            cellMark = mark
+            mark = stats.lap('lexical', mark)
+            stats.added += len(leaf_cell.items)
+            mark = self.countUnaries(semiring, leaf_cell, stats, mark)
+            size = len(leaf_cell.items)
+        else:
+            semiring.close(leaf_cell)
+        if prune and (j - 1, j) != chart.S:
+            chart.pruned += self.pruneCell(leaf_cell, beam, threshold)
+            if stats is not None:
+                mark = stats.lap('prune', mark)
+        if stats is not None and stats.spans is not None:
+            stats.spans.append((j - 1, j, size, 0, mark - cellMark))
+        chart.setCell(j - 1, j, leaf_cell)
+
+        # Move right through the columns and Up through the rows
+        lowest = 0 if max_span is None else max(0, j - max_span)
+        for i in reversed(range(lowest, j - 1)):
+            A_cell = chart.newCell()
+            if stats is not None:
+                cellMark, cellApplications = mark, applications
+            for k in range(i + 1, j):
+                B_cell = chart.getCell(i, k)
+                C_cell = chart.getCell(k, j)
+                applied, improved = semiring.binary(A_cell, B_cell, C_cell, k)
+                applications += applied
+                if stats is not None:
+                    stats.pairs += len(B_cell.items) * len(C_cell.items)
+                    stats.applications += applied
+                    stats.replaced += improved
+            if stats is not None:
+                mark = stats.lap('binary', mark)
+                # the first derivation of an item is not a replacement
+                stats.added += len(A_cell.items)
+                stats.replaced -= len(A_cell.items)
+                mark = self.countUnaries(semiring, A_cell, stats, mark)
+                size = len(A_cell.items)
+            else:
+                semiring.close(A_cell)
+            if prune and (i, j) != chart.S:
+                chart.pruned += self.pruneCell(A_cell, beam, threshold)
+                if stats is not None:
+                    mark = stats.lap('prune', mark)
+            if stats is not None and stats.spans is not None:
+                stats.spans.append((i, j, size, applications - cellApplications, mark - cellMark))
+            chart.setCell(i, j, A_cell)
+        return applications
+
+    # semiring.close() for an instrumented parse: counts the cell, the items
+    # the closure adds or replaces, and the time it takes
+    def countUnaries(self, semiring, cell, stats, mark):
+        size = len(cell.items)
+        replaced = len(cell.bases or ())
+        semiring.close(cell)
+        stats.cells += 1
+        stats.added += len(cell.items) - size
+        stats.replaced += len(cell.bases or ()) - replaced
+        stats.maxCell = max(stats.maxCell, len(cell.items))
+        return stats.lap('unary', mark)
+
+    '''
+    Removes the items of a cell that fall outside the beam or below the
+    threshold, and returns how many were removed. Items with equal log
+    probs are ranked by label, so both engines keep the same ones
+    '''
+
+    def pruneCell(self, cell, beam, threshold):
+        items = cell.getItems()
+        items.sort(key=lambda item: (-item.prob, item.label))
+        keep = items if beam is None else items[:beam]
+        if threshold is not None:
+            keep = [item for item in keep if item.prob >= cell.max_prob - threshold]
+        kept = set(item.label for item in keep)
+        pruned = 0
+        for label in list(cell.items):
+            if label not in kept:
+                pruned += 1
+                # a kept unary chain may still end in its base item
+                base = cell.getBaseItem(label)
+                if base is not None:
+                    if cell.bases is None:
+                        cell.bases = {}
+                    cell.bases[label] = base
+                cell.removeItem(label)
+        return pruned
+
+    '''
+    First-cut inner loop: tries every binary rule of the grammar against the
+    cells (i, k) and (k, j). Returns (rule applications, improvements), where
+    improvements counts the times an item got a new best derivation
+    '''
+
+    def scanRules(self, labelIds, A_cell, B_cell, C_cell, k):
+        L = len(labelIds)
+        applications = 0
+        improved = 0
+        for children, rules in self.binaryRules():
+            # Check if table[i,k,B] > 0
+            B_item = B_cell.getItem(children[0])
+            if B_item is None:
+                continue
+
+            # Check if table[k,j,C] > 0
+            C_item = C_cell.getItem(children[1])
+            if C_item is None:
+                continue
+
+            for parent, prob in rules:
+                applications += 1
+                # Every derivation counts towards numParses, even
+                # the ones that don't beat the Viterbi score
+                item = A_cell.getOrAddItem(parent)
+                item.numParses += B_item.numParses * C_item.numParses
+
+                # Check if table[i,j,A] < P (A -> BC) * table[i,j,B] * table[i,j,C]
+                t_A_ = prob + B_item.prob + C_item.prob
+                if item.prob < t_A_:
+                    A_cell.addItem(item, t_A_)
+                    item.back = (k * L + labelIds[children[0]]) * L + labelIds[children[1]]
+                    improved += 1
+        return applications, improved
+
+    '''
+    The binary rules for scanRules, in rank order, as (children, rules)
+    pairs: rules lists the (parent, log prob) of a run of rules with the
+    same children. Trying them in this order, a tie keeps the rule of the
+    lowest rank, as in indexedRules
+    '''
+
+    def binaryRules(self):
+        if self._binaryRules is None:
+            self._binaryRules = []
+            for rank, parent, children, prob in self.rankedRules():
+                if not self._binaryRules or self._binaryRules[-1][0] != children:
+                    self._binaryRules.append((children, []))
+                self._binaryRules[-1][1].append((parent, prob))
+        return self._binaryRules
+
+    '''
+    The binary rules as (rank, parent, children, log prob), in rank order,
+    read off the arrays of the compiled grammar (so a grammar loaded from
+    its cache file never builds Rule objects for the CKY loops)
+    '''
+
+    def rankedRules(self):
+        grammar = self.compiledGrammar()
+        symbols = grammar.symbols
+        order = sorted(range(len(grammar.binRank)), key=grammar.binRank.__getitem__)
+        return [(grammar.binRank[r], symbols[grammar.binParent[r]],
+                 (symbols[grammar.binLeft[r]], symbols[grammar.binRight[r]]), grammar.binProb[r]) for r in order]
+
+    '''
+    Indexed inner loop: only visits the rules whose left child is in the
+    cell (i, k), and checks their right child against the label bitset of
+    the cell (k, j). Ties keep the rule that comes first in the grammar (its
+    rank), as the first-cut loop does. Returns what scanRules returns
+    '''
+
+    def indexedRules(self, leftRules, ranks, LL, A_cell, B_cell, C_cell, k):
+        applications = 0
+        improved = 0
+        for B_item in B_cell.getItems():
+            for C, mask, parent, prob, rank, back in leftRules.get(B_item.label, ()):
+                if not C_cell.labels & mask:
+                    continue
+                C_item = C_cell.items[C]
+                applications += 1
+                item = A_cell.getOrAddItem(parent)
+                item.numParses += B_item.numParses * C_item.numParses
+
+                t_A_ = prob + B_item.prob + C_item.prob
+                if item.prob < t_A_ or (item.prob == t_A_ and item.back // LL == k
+                                        and rank < ranks[(parent, item.back % LL)]):
+                    A_cell.addItem(item, t_A_)
+                    item.back = k * LL + back
+                    improved += 1
+        return applications, improved
+
+    '''
+    Returns (labelIds, labels, leftRules, ranks): an id for every
+    nonterminal (its compiled grammar symbol id, also its bit in the cell
+    bitsets) and the label of every id,
+    the binary rules indexed by left child as lists of
+    (right child, right child bit mask, parent, log prob, rank, children id)
+    in rank order, and the rank of the rule an item of a parent over a
+    children id (left id * L + right id, with L labels) was built by, as
+    ranks[(parent, children id)]: the lowest rank of the most probable of
+    its rules (a grammar may repeat a rule)
+    '''
+
+    def ruleIndex(self):
+        if self._ruleIndex is None:
+            grammar = self.compiledGrammar()
+            labelIds = dict(grammar.symbolIds)
+            labels = list(grammar.symbols)
+            L = len(labels)
+            leftRules = {}
+            ranks = {}
+            best = {}
+            for rank, parent, children, prob in self.rankedRules():
+                back = labelIds[children[0]] * L + labelIds[children[1]]
+                if (parent, back) not in ranks or prob > best[(parent, back)]:
+                    ranks[(parent, back)] = rank
+                    best[(parent, back)] = prob
+                leftRules.setdefault(children[0], []).append(
+                    (children[1], 1 << labelIds[children[1]], parent, prob, rank, back))
+            self._ruleIndex = (labelIds, labels, leftRules, ranks)
+        return self._ruleIndex
+
+    '''
+    Returns (parentRules, chainsByTop) for incomingEdges(): the binary rules
+    indexed by parent as lists of (left child, right child, log prob, rank),
+    and a dict that maps a label to its unary chains as lists of
+    (order, log prob, chain), where order ranks chains as CKY does (closure
+    entry, then the chain's position in closure.chainsFrom). Use
+    chainsFrom(label): the chains of a label are listed on first use, as
+    there can be exponentially many
+    '''
+
+    def edgeIndex(self):
+        if self._edgeIndex is None:
+            parentRules = {}
+            for B, rules in self.ruleIndex()[2].items():
+                for C, mask, parent, prob, rank, back in rules:
+                    parentRules.setdefault(parent, []).append((B, C, prob, rank))
+            for parent in parentRules:
+                parentRules[parent].sort(key=lambda rule: rule[3])
+            self._edgeIndex = (parentRules, {})
+        return self._edgeIndex
+
+    # The unary chains from a label as (order, log prob, chain), see edgeIndex
+    def chainsFrom(self, label):
+        chainsByTop = self.edgeIndex()[1]
+        if label not in chainsByTop:
+            ranks = self.closure.ranks
+            chainsByTop[label] = [((ranks[(label, chain[-1])], position), prob, chain)
+                                  for position, (prob, chain) in enumerate(self.closure.chainsFrom(label))]
+        return chainsByTop[label]
+
+    '''
+    Returns the incoming hyperedges of a node of a filled chart, as lists of
+    (kind, children, weight, order[, chain]). A node is (i, j, label, closed):
+    the base item of the label (built by a binary or lexical rule) or its
+    closed item (the top of the cell's unary closure). A base item has a
+    'lexical' edge per lexical rule, or a 'binary' edge per split and rule
+    whose children (closed items) are in the chart; a closed item has an
+    'identity' edge to its own base item and a 'chain' edge down to every base
+    item a unary chain reaches. order ranks edges as CKY breaks ties: split
+    and rule rank, or -1 for the base item and (closure entry, position in
+    closure.chainsFrom) for a chain. These are exactly the derivations numParses
+    counts
+    '''
+
+    def incomingEdges(self, chart, key):
+        parentRules = self.edgeIndex()[0]
+        i, j, label, closed = key
+        cell = chart.getCell(i, j)
+        edges = []
+        if closed:
+            if cell.getBaseItem(label) is not None:
+                edges.append(('identity', ((i, j, label, False),), 0.0, (-1,)))
+            for order, prob, chain in self.chainsFrom(label):
+                if cell.getBaseItem(chain[-1]) is not None:
+                    edges.append(('chain', ((i, j, chain[-1], False),), prob, order, chain))
+        elif j - i == 1:
+            leaves, probs = self.lexicon.lookup(chart.tokens[i]) or ((), ())
+            for leaf, prob in zip(leaves, probs):
+                if leaf == label:
+                    edges.append(('lexical', (), prob, (0,)))
+        else:
+            for k in range(i + 1, j):
+                left = chart.getCell(i, k)
+                right = chart.getCell(k, j)
+                for B, C, prob, rank in parentRules.get(label, ()):
+                    if B in left.items and C in right.items:
+                        edges.append(('binary', ((i, k, B, True), (k, j, C, True)), prob, (k, rank)))
+        return edges
+
+    '''
+    Applies the unary closure to a cell in a single pass. Every item of the
+    cell (as the binary rules left it) can be reached from a parent A through
+    a unary chain; A gets the best of its own item and those chains, and
+    numParses adds (number of chains) * (parses of the item) for each.
+    Items are never changed in place: an improved A is a new item pointing at
+    the chain's closure entry, and the item it replaced is kept in
+    cell.bases, as the bottom of other chains
+    '''
+
+    def applyUnaries(self, cell):
+        if not len(self.closure):
+            return
+        base = cell.getItems()
+        updated = {}
+        for B_item in base:
+            for parent, prob, count, chain, rank in self.closure.byChild.get(B_item.label, ()):
+                if parent not in updated:
+                    old = cell.getItem(parent)
+                    item = ChartItem(parent, float('-inf'))
+                    if old is not None:
+                        item = ChartItem(parent, old.prob, old.numParses, old.back)
+                    updated[parent] = item
+                item = updated[parent]
+                item.numParses += count * B_item.numParses
+
+                t_A_ = prob + B_item.prob
+                unary = item.back is not None and item.back < 0
+                if item.prob < t_A_ or (item.prob == t_A_ and unary and rank < -1 - item.back):
+                    item.prob = t_A_
+                    item.back = -1 - rank
+        for parent in updated:
+            item = updated[parent]
+            old = cell.getItem(parent)
+            if old is not None and item.back is not None and item.back < 0:
+                if cell.bases is None:
+                    cell.bases = {}
+                cell.bases[parent] = old
+            cell.addItem(item)
+
+    '''
+    Returns the TOP item of the Viterbi parse, or None if the root cell has
+    no TOP item. The tree below it is only built from the chart's
+    backpointers when its children are first asked for
+    '''
+
+    def buildTree(self, chart):
+        if chart.n == 0 or chart.getRoot().getItem(TOP) is None:
+            return None
+        return self.spanTree(chart, 0, chart.n, TOP)
+
+    # The subtree of a label's item over (i, j), built lazily like buildTree's
+    # (None if the cell has no such item)
+    def spanTree(self, chart, i, j, label):
+        item = chart.getCell(i, j).getItem(label)
+        if item is None:
+            return None
+        return LazyItem(item.label, item.prob, item.numParses,
+                        lambda: materialize((i, j, item), lambda node: self.expand(chart, node)).children)
+
+    '''
+    Joins the cells of a chart filled with max_span under TOP (see glue()).
+    The piece over a span is the most probable item of its cell, ties going
+    to the lowest label; TOP items are passed over, as TOP only belongs at
+    the root. Returns (number of pieces, TOP item) or None
+    '''
+
+    def glueTree(self, chart, maxSpan):
+        def best(i, j):
+            items = [item for item in chart.getCell(i, j).getItems() if item.label != TOP]
+            if not items:
+                return None
+            item = min(items, key=lambda item: (-item.prob, item.label))
+            return item.prob, (i, j, item)
+
+        return glue(chart.n, maxSpan, best, lambda node: self.expand(chart, node))
+
+    '''
+    One step of materialize() over the chart: a node is (i, j, item) for a
+    chart item, or (i, j, chain, base item) for the label chain[0] inside the
+    unary chain (..., chain[0], ..., chain[-1]) whose bottom is that base item
+    '''
+
+    def expand(self, chart, node):
+        labels = self.ruleIndex()[1]
+        L = len(labels)
+        i, j = node[0], node[1]
+        cell = chart.getCell(i, j)
+
+        # numParses of a node is that of the label's final item (0 if the
+        # label was pruned from the cell)
+        def parses(label):
+            item = cell.getItem(label)
+            return 0 if item is None else item.numParses
+
+        if len(node) == 4:
+            chain, base = node[2], node[3]
+            prob = base.prob
+            for parent, child in reversed(list(zip(chain[:-1], chain[1:]))):
+                prob = self.closure.ruleProbs[(parent, child)] + prob
+            child = (i, j, base) if len(chain) == 2 else (i, j, chain[1:], base)
+            return chain[0], prob, parses(chain[0]), (child,)
+
+        item = node[2]
+        if item.back is None:
+            children = (LeafItem(chart.words[i]),)
+        elif item.back < 0:
+            chain = self.closure.entries[-1 - item.back][4]
+            base = cell.getBaseItem(chain[-1])
+            children = ((i, j, base) if len(chain) == 2 else (i, j, chain[1:], base),)
+        else:
+            k, B, C = item.back // (L * L), item.back // L % L, item.back % L
+            children = ((i, k, chart.getCell(i, k).getItem(labels[B])),
+                        (k, j, chart.getCell(k, j).getItem(labels[C])))
+        return item.label, item.prob, parses(item.label), children
+
+    '''
+    Returns the k best parses of a sentence as TOP items in score order (the
+    first is the tree CKY returns), fewer if it has fewer parses. Only the
+    chart is filled up front; later parses are worked out lazily from it
+    (see hw3_pcfg_kbest.py)
+    '''
+
+    def kbest(self, sentence, k, beam=None, threshold=None):
+        from hw3_pcfg_kbest import KBest
+        tokens = self.tokenize(sentence)
+        if tokens is None:
+            return []
+        chart, applications = self.fillChart(sentence, beam=beam, threshold=threshold, tokens=tokens)
+        return KBest(self, chart).trees(k)
+
+    '''
+    Returns an IncrementalParser (see hw3_pcfg_incremental.py) that parses a
+    sentence word by word with push(word), with the pruning options of
+    fillChart
+    '''
+
+    def incremental(self, beam=None, threshold=None, max_span=None):
+        from hw3_pcfg_incremental import IncrementalParser
+        return IncrementalParser(self, beam=beam, threshold=threshold, max_span=max_span)
+
+    '''
+    Returns the packed forest of all parses of a sentence (see
+    hw3_pcfg_forest.py), with exact parse counts; save() it for a reranker
+    '''
+
+    def forest(self, sentence, beam=None, threshold=None):
+        from hw3_pcfg_forest import Forest
+        tokens, unknown = self.lexicon.tokens(sentence)
+        chart, applications = self.fillChart(sentence, beam=beam, threshold=threshold, tokens=tokens)
+        return Forest.fromChart(self, chart)
+
+    '''
+    Runs inside-outside over a sentence (see NumpyCKY.insideOutside): the
+    total log prob of the sentence, span and label posteriors and expected
+    rule counts, in an InsideOutsideChart
+    '''
+
+    def insideOutside(self, sentence):
+        tokens, unknown = self.lexicon.tokens(sentence)
+        return self.numpyEngine().insideOutside(sentence, tokens)
+
+    '''
+    Fills the chart of a sentence with the values of a semiring (see
+    hw3_pcfg_semiring.py), through the fillChart loop that CKY runs, and
+    returns its SemiringChart. The default semiring gets the Viterbi log
+    prob, the exact parse count and the inside log prob of every cell in one
+    pass; chart.total() is (prob, numParses, log likelihood)
+    '''
+
+    def semiringParse(self, sentence, semiring=None):
+        from hw3_pcfg_semiring import VITERBI_COUNT_INSIDE, SemiringCKY, ViterbiCountInsideCKY
+        semiring = VITERBI_COUNT_INSIDE if semiring is None else semiring
+        if semiring not in self._semiringEngines:
+            if semiring is VITERBI_COUNT_INSIDE:
+                self._semiringEngines[semiring] = ViterbiCountInsideCKY(self)
+            else:
+                self._semiringEngines[semiring] = SemiringCKY(self, semiring)
+        tokens, unknown = self.lexicon.tokens(sentence)
+        chart, applications = self.fillChart(sentence, tokens=tokens, semiring=self._semiringEngines[semiring])
+        return chart
+
+    '''
+    Puts a ParseCache (see hw3_pcfg_cache.py) in front of CKY: at most
+    `size` results in memory, and with a path also in a SQLite file there
+    that later processes reuse. Returns the cache, whose counters() tell how
+    it is doing
+    '''
+
+    def enableResultCache(self, size=1024, path=None):
+        from hw3_pcfg_cache import ParseCache
+        self.resultCache = ParseCache(fileHash(self.grammarFile), size, path)
+        return self.resultCache
+
+    '''
+    Parses many sentences over a pool of worker processes (see
+    hw3_pcfg_batch.py). Returns one ParseResult per sentence, in input order;
+    options are passed on to CKY
+    '''
+
+    def parse_batch(self, sentences, workers=None, **options):
+        from hw3_pcfg_batch import parseBatch
+        return parseBatch(self, sentences, workers, **options)
+
+    '''
+    Returns the vectorized CKY engine for this grammar, building its integer
+    tables the first time it is asked for
+    '''
+
+    def numpyEngine(self):
+        if self._numpyEngine is None:
+            from hw3_pcfg_numpy import NumpyCKY
+            self._numpyEngine = NumpyCKY(self)
+        return self._numpyEngine
+
+    '''
+    Returns the A* engine for this grammar; its outside estimates are
+    computed (or loaded from the cache) on the first parse
+    '''
+
+    def astarEngine(self):
+        if self._astarEngine is None:
+            from hw3_pcfg_astar import AStar
+            self._astarEngine = AStar(self)
+        return self._astarEngine
 
 
 if __name__ == "__main__":
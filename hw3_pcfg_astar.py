@@ -0,0 +1,311 @@
+import heapq
+import numpy as np
+
+from hw3_pcfg import TOP, LazyItem, LeafItem, materialize
+from hw3_pcfg_grammar import cachePath, readSections, writeSections
+
+ESTIMATES_MAGIC = b"PCFGX\x00\x00\x01"
+ESTIMATES_VERSION = 1
+ESTIMATES_SUFFIX = ".astar"
+
+# the estimate tables cover sentences of at least this many words
+MIN_LENGTH = 40
+
+# added to every estimate, so rounding differences between an estimate and
+# the score it bounds can never make it inadmissible
+SLACK = 1e-9
+
+
+'''
+OutsideEstimates are the "SX" outside estimates of Klein and Manning (2003):
+for every symbol and every context of l words to the left and r words to the
+right of a span, the best log prob any sentence can give to the part of a
+parse outside that span. They depend only on the grammar, not on the words,
+so they never underestimate the true outside score of an item (they are
+admissible) and are computed once per grammar.
+
+outClosed[l, r, a] bounds the outside of the closed item of symbol id a (the
+top of a cell's unary closure), outBase[l, r, a] that of its base item. Both
+cover l + r <= maxLength
+'''
+
+
+class OutsideEstimates:
+    def __init__(self, sha1, maxLength, outClosed, outBase):
+        self.sha1 = sha1
+        self.maxLength = maxLength
+        self.outClosed = outClosed
+        self.outBase = outBase
+
+    '''
+    Computes the estimates for a grammar from the numpy engine's rule
+    tables, with inside bounds over spans of 1 .. maxLength words
+    '''
+
+    @staticmethod
+    def compute(engine, maxLength, sha1=None):
+        N = len(engine.symbols)
+        grammar = engine.grammar
+        L = maxLength + 1
+
+        def close(base):
+            closed = base.copy()
+            if len(engine.closureParent):
+                np.maximum.at(closed, engine.closureParent, engine.closureProb + base[engine.closureChild])
+            return closed
+
+        # best inside log prob of every symbol over m words, for any words
+        insideClosed = np.full((L + 1, N), -np.inf)
+        base = np.full(N, -np.inf)
+        np.maximum.at(base, np.frombuffer(grammar.lexParent, dtype=np.int32),
+                      np.frombuffer(grammar.lexProb, dtype=np.float64))
+        insideClosed[1] = close(base)
+        for m in range(2, L + 1):
+            base = np.full(N, -np.inf)
+            for left in range(1, m):
+                cand = engine.ruleProb + insideClosed[left][engine.ruleLeft] + insideClosed[m - left][engine.ruleRight]
+                np.maximum.at(base, engine.ruleParent, cand)
+            insideClosed[m] = close(base)
+
+        outClosed = np.full((L, L, N), -np.inf)
+        outBase = np.full((L, L, N), -np.inf)
+        chainTop = engine.closureParent
+        chainBottom = engine.closureChild
+        for total in range(0, L):
+            for l in range(0, total + 1):
+                r = total - l
+                closed = outClosed[l, r]
+                if total == 0 and TOP in engine.symbolIds:
+                    closed[engine.symbolIds[TOP]] = 0.0
+                # as the left child of a rule, with a sibling of m words to
+                # the right, and as the right child, with one to the left
+                for m in range(1, r + 1):
+                    cand = outBase[l, r - m][engine.ruleParent] + engine.ruleProb + insideClosed[m][engine.ruleRight]
+                    np.maximum.at(closed, engine.ruleLeft, cand)
+                for m in range(1, l + 1):
+                    cand = outBase[l - m, r][engine.ruleParent] + engine.ruleProb + insideClosed[m][engine.ruleLeft]
+                    np.maximum.at(closed, engine.ruleRight, cand)
+                outBase[l, r] = closed
+                if len(chainTop):
+                    np.maximum.at(outBase[l, r], chainBottom, closed[chainTop] + engine.closureProb)
+        return OutsideEstimates(sha1, maxLength, outClosed, outBase)
+
+    '''
+    Returns the estimates of a PCFG for sentences of up to `length` words.
+    With pcfg.cache they are kept in <grammarFile>.astar, next to the
+    compiled grammar (toygrammar.renormalized.pcfg.astar for the renormalized
+    variant), and only recomputed when the grammar changes or a longer
+    sentence needs a bigger table. Tables come in sizes MIN_LENGTH times a
+    power of two, so sentences of growing length recompute them a
+    logarithmic number of times, not once per new length
+    '''
+
+    @staticmethod
+    def forGrammar(pcfg, length):
+        maxLength = MIN_LENGTH
+        while maxLength < length:
+            maxLength *= 2
+        sha1 = pcfg.compiledGrammar().sha1
+        path = cachePath(pcfg.grammarFile, pcfg.variant, ESTIMATES_SUFFIX)
+        if pcfg.cache and sha1 is not None:
+            estimates = OutsideEstimates.load(path, sha1)
+            if estimates is not None and estimates.maxLength >= length:
+                return estimates
+        estimates = OutsideEstimates.compute(pcfg.numpyEngine(), maxLength, sha1)
+        if pcfg.cache and sha1 is not None:
+            try:
+                estimates.save(path)
+            except (IOError, OSError):
+                pass
+        return estimates
+
+    def save(self, path):
+        writeSections(path, ESTIMATES_MAGIC,
+                      {"version": ESTIMATES_VERSION, "sha1": self.sha1, "maxLength": self.maxLength,
+                       "shape": list(self.outClosed.shape)},
+                      [("outClosed", "d", self.outClosed.ravel()), ("outBase", "d", self.outBase.ravel())])
+
+    @staticmethod
+    def load(path, sha1=None):
+        loaded = readSections(path, ESTIMATES_MAGIC)
+        if loaded is None:
+            return None
+        header, sections = loaded
+        if header["version"] != ESTIMATES_VERSION or (sha1 is not None and header["sha1"] != sha1):
+            return None
+        shape = tuple(header["shape"])
+        return OutsideEstimates(header["sha1"], header["maxLength"],
+                                np.frombuffer(sections["outClosed"], dtype=np.float64).reshape(shape),
+                                np.frombuffer(sections["outBase"], dtype=np.float64).reshape(shape))
+
+
+'''
+An AStarChart holds what an A* search over one sentence has found: the best
+inside log prob of every item reached so far, keyed by (i, j, label) for
+closed and base items, and the done (popped) closed items indexed by their
+start and end position, which binary rules combine. popped and pushed count
+agenda operations
+'''
+
+
+class AStarChart:
+    def __init__(self, sentence, tokens=None):
+        self.words = sentence
+        # what the lexicon is asked for each word (see Lexicon.tokens)
+        self.tokens = sentence if tokens is None else tokens
+        self.n = len(sentence)
+        self.closed = {}
+        self.base = {}
+        # start -> label -> {end: log prob}, and end -> label -> {start: log prob}
+        self.byStart = [{} for _ in range(self.n + 1)]
+        self.byEnd = [{} for _ in range(self.n + 1)]
+        self.popped = 0
+        self.pushed = 0
+        # nothing is pruned; kept so callers can treat it like a Chart
+        self.pruned = 0
+
+
+'''
+AStar finds the Viterbi parse of a sentence best first: items come off an
+agenda in order of inside log prob plus their outside estimate, so cells far
+from any good parse are never built. The search stops once no item left on
+the agenda can match the best TOP item found, and the tree is then read off
+the done items with CKY's tie-breaking, so it is the tree PCFG.CKY returns,
+with the same probabilities. numParses needs every parse, so A* trees leave
+it as None
+'''
+
+
+class AStar:
+    def __init__(self, pcfg):
+        self.pcfg = pcfg
+        self.symbolIds = pcfg.compiledGrammar().symbolIds
+        self.estimates = None
+        labelIds, labels, leftRules, ranks = pcfg.ruleIndex()
+        self.leftRules = leftRules
+        # right child -> [(left child, parent, log prob)]
+        self.rightRules = {}
+        for B, rules in leftRules.items():
+            for C, mask, parent, prob, rank, back in rules:
+                self.rightRules.setdefault(C, []).append((B, parent, prob))
+        # parent -> [(child, log prob, chain, rank)] for the best chains
+        self.chainsByParent = {}
+        for rank, (parent, child, prob, count, chain) in enumerate(pcfg.closure.entries):
+            self.chainsByParent.setdefault(parent, []).append((child, prob, chain, rank))
+
+    def estimate(self, i, j, label, closed):
+        table = self.estimates.outClosed if closed else self.estimates.outBase
+        return table[i, self.n - j, self.symbolIds[label]]
+
+    def push(self, chart, scores, key, closed, score):
+        if key in scores and scores[key] >= score:
+            return
+        outside = self.estimate(key[0], key[1], key[2], closed)
+        if outside == -np.inf:
+            return
+        scores[key] = score
+        chart.pushed += 1
+        heapq.heappush(self.agenda, (-(score + outside + SLACK), chart.pushed, key, closed, score))
+
+    '''
+    Returns (chart, tree) like NumpyCKY.parse
+    '''
+
+    def parse(self, sentence, tokens=None):
+        n = len(sentence)
+        chart = AStarChart(sentence, tokens)
+        self.n = n
+        if n == 0 or TOP not in self.symbolIds:
+            return chart, None
+        if self.estimates is None or self.estimates.maxLength < n:
+            self.estimates = OutsideEstimates.forGrammar(self.pcfg, n)
+
+        self.agenda = []
+        for j, token in enumerate(chart.tokens):
+            labels, probs = self.pcfg.lexicon.lookup(token) or ((), ())
+            for label, prob in zip(labels, probs):
+                self.push(chart, chart.base, (j, j + 1, label), False, prob)
+
+        goal = (0, n, TOP)
+        while self.agenda:
+            priority, _, key, closed, score = self.agenda[0]
+            if goal in chart.closed and -priority < chart.closed[goal]:
+                break
+            heapq.heappop(self.agenda)
+            scores = chart.closed if closed else chart.base
+            if scores[key] != score:
+                continue  # a better score for the item was pushed since
+            chart.popped += 1
+            i, j, label = key
+            if not closed:
+                # the unary closure: the item itself, and every chain above it
+                for parent, prob, count, chain, rank in self.pcfg.closure.byChild.get(label, ()):
+                    self.push(chart, chart.closed, (i, j, parent), True, prob + score)
+                if label in self.chainsByParent:
+                    self.push(chart, chart.closed, key, True, score)
+                    continue
+                # no chain ends in the label, so its closed item is this one
+                # (and its score is just as final)
+                chart.closed[key] = score
+
+            chart.byStart[i].setdefault(label, {})[j] = score
+            chart.byEnd[j].setdefault(label, {})[i] = score
+            # as the left child of a rule, then as the right child
+            for C, mask, parent, prob, rank, back in self.leftRules.get(label, ()):
+                for end, right in chart.byStart[j].get(C, {}).items():
+                    self.push(chart, chart.base, (i, end, parent), False, prob + score + right)
+            for B, parent, prob in self.rightRules.get(label, ()):
+                for start, left in chart.byEnd[i].get(B, {}).items():
+                    self.push(chart, chart.base, (start, j, parent), False, prob + left + score)
+        self.agenda = None
+
+        if goal not in chart.closed:
+            return chart, None
+        top = chart.closed[goal]
+        return chart, LazyItem(TOP, top, None,
+                               lambda: materialize((0, n, TOP, True), lambda node: self.expand(chart, node)).children)
+
+    def done(self, chart, i, j, label):
+        return chart.byStart[i].get(label, {}).get(j)
+
+    '''
+    One step of materialize() over the done items: a node is (i, j, label,
+    closed) for an item, or (i, j, chain) for the label chain[0] inside the
+    unary chain (..., chain[0], ..., chain[-1]) on top of a base item. Among
+    the derivations that reach an item's score it takes the one CKY keeps
+    (see PCFG.incomingEdges)
+    '''
+
+    def expand(self, chart, node):
+        i, j = node[0], node[1]
+        if len(node) == 3:
+            chain = node[2]
+            prob = chart.base[(i, j, chain[-1])]
+            for parent, child in reversed(list(zip(chain[:-1], chain[1:]))):
+                prob = self.pcfg.closure.ruleProbs[(parent, child)] + prob
+            child = (i, j, chain[-1], False) if len(chain) == 2 else (i, j, chain[1:])
+            return chain[0], prob, None, (child,)
+
+        label, closed = node[2], node[3]
+        if closed:
+            score = chart.closed[(i, j, label)]
+            if chart.base.get((i, j, label)) == score:
+                closed = False  # its own base item wins ties
+            else:
+                for child, prob, chain, rank in self.chainsByParent.get(label, ()):
+                    if (i, j, child) in chart.base and prob + chart.base[(i, j, child)] == score:
+                        return label, score, None, ((i, j, chain[-1], False) if len(chain) == 2 else
+                                                    (i, j, chain[1:]),)
+
+        score = chart.base[(i, j, label)]
+        leaves = self.pcfg.lexicon.lookup(chart.tokens[i]) if j - i == 1 else None
+        if leaves is not None and any(leaf == label and prob == score for leaf, prob in zip(*leaves)):
+            return label, score, None, (LeafItem(chart.words[i]),)
+        parentRules = self.pcfg.edgeIndex()[0]
+        for k in range(i + 1, j):
+            for B, C, prob, rank in parentRules.get(label, ()):
+                left = self.done(chart, i, k, B)
+                right = self.done(chart, k, j, C)
+                if left is not None and right is not None and prob + left + right == score:
+                    return label, score, None, ((i, k, B, True), (k, j, C, True))
+        raise AssertionError("no derivation for %s over (%d, %d)" % (label, i, j))
@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+import hw3_pcfg
+from hw3_pcfg_testing import HERE, randomCases, runTests, scratchDirectory
+
+'''
+Tests of the A* engine (hw3_pcfg_astar.py): it must find CKY's Viterbi
+trees, ties included, refuse the chart engines' pruning options, and keep
+the outside estimates of a grammar variant in a file of their own
+'''
+
+
+def testAStarAgrees():
+    for path, pcfg, sentences in randomCases(count=20, maxLength=8):
+        for sentence in sentences:
+            reference = pcfg.CKY(sentence)
+            tree = pcfg.CKY(sentence, engine='astar')
+            assert (tree is None) == (reference is None), (path, sentence)
+            if tree is not None:
+                assert tree.toString() == reference.toString(), (path, sentence)
+                assert tree.prob == reference.prob, (path, sentence)
+
+
+def testAStarRejectsPruning():
+    pcfg = hw3_pcfg.PCFG(os.path.join(HERE, 'toygrammar.pcfg'))
+    sentence = "the man eats the sushi".split()
+    for options in ({'beam': 3}, {'threshold': 2.0}, {'max_span': 3}):
+        try:
+            pcfg.CKY(sentence, engine='astar', **options)
+        except ValueError:
+            continue
+        assert False, "astar accepted %s" % options
+
+
+def testEstimatesPerVariant():
+    with scratchDirectory() as directory:
+        path = os.path.join(directory, "toy.pcfg")
+        shutil.copyfile(os.path.join(HERE, 'toygrammar.pcfg'), path)
+        sentence = "the man eats the sushi".split()
+        for renormalize in (False, True, False):
+            pcfg = hw3_pcfg.PCFG(path, cache=True, renormalize=renormalize)
+            assert pcfg.CKY(sentence, engine='astar').toString() == pcfg.CKY(sentence).toString()
+        estimates = sorted(name for name in os.listdir(directory) if name.endswith(".astar"))
+        assert estimates == ["toy.pcfg.astar", "toy.renormalized.pcfg.astar"], estimates
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
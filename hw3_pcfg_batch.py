@@ -0,0 +1,158 @@
+import collections
+import multiprocessing
+import os
+import time
+import hw3_pcfg
+import hw3_pcfg_metrics
+
+# The grammar used by this (worker) process; see parseBatch
+_pcfg = None
+
+'''
+A ParseResult is the outcome of parsing one sentence of a batch: the tree
+(None on a parse failure), or the error that made the parse crash, together
+with the parse's ParseStats and wall time
+'''
+
+
+class ParseResult:
+    def __init__(self, index, sentence):
+        self.index = index
+        self.sentence = sentence
+        self.tree = None
+        self.error = None
+        self.stats = None
+        self.seconds = 0.0
+
+    def ok(self):
+        return self.error is None and self.tree is not None
+
+
+def parseOne(pcfg, index, sentence, options):
+    result = ParseResult(index, sentence)
+    result.stats = hw3_pcfg.ParseStats()
+    start = time.perf_counter()
+    try:
+        result.tree = pcfg.CKY(sentence, stats=result.stats, **options)
+    except Exception as e:
+        # one bad sentence must not take the batch down with it
+        result.error = "%s: %s" % (type(e).__name__, e)
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+# A forked worker inherits the parent's metrics, whose file it would
+# overwrite; its stats go back to the parent with the results instead
+def _startWorker():
+    hw3_pcfg_metrics._aggregator = None
+
+
+def _loadGrammar(grammarFile, engine, debug, signatures, renormalize):
+    global _pcfg
+    _startWorker()
+    # spawned workers map the compiled grammar instead of re-parsing the text
+    _pcfg = hw3_pcfg.PCFG(grammarFile, debug=debug, engine=engine, cache=True,
+                         signatures=signatures, renormalize=renormalize)
+
+
+def _work(task):
+    index, sentence, options = task
+    return parseOne(_pcfg, index, sentence, options)
+
+
+# Records the stats of a result a worker parsed in this process's metrics,
+# if they are on, as CKY records the parses it makes here
+def recordResult(result):
+    metrics = hw3_pcfg_metrics.aggregator()
+    if metrics is not None and result.stats is not None:
+        metrics.record(result.stats)
+        if 'tree' in result.stats.phases:
+            metrics.observe('phase_seconds', result.stats.phases['tree'], phase='tree')
+
+
+'''
+Starts a pool of worker processes that parse with the grammar of pcfg.
+With the fork start method the workers inherit the already loaded grammar;
+otherwise each worker loads it once through the compiled grammar cache
+'''
+
+
+def startPool(pcfg, workers):
+    global _pcfg
+    if 'fork' in multiprocessing.get_all_start_methods():
+        _pcfg = pcfg
+        return multiprocessing.get_context('fork').Pool(workers, initializer=_startWorker)
+    return multiprocessing.Pool(workers, initializer=_loadGrammar,
+                                initargs=(pcfg.grammarFile, pcfg.engine, pcfg.debug,
+                                          pcfg.lexicon.signatures, pcfg.renormalize))
+
+
+def stopPool(pool):
+    global _pcfg
+    pool.close()
+    pool.join()
+    _pcfg = None
+
+
+'''
+Parses a list of sentences over `workers` processes (default: one per CPU)
+and returns their ParseResults in input order. CKY is cubic in sentence
+length, so the longest sentences are handed out first and the short ones
+fill in the gaps at the end.
+'''
+
+
+def parseBatch(pcfg, sentences, workers=None, **options):
+    sentences = [list(sentence) for sentence in sentences]
+    results = [None] * len(sentences)
+    order = sorted(range(len(sentences)), key=lambda i: len(sentences[i]), reverse=True)
+    tasks = [(i, sentences[i], options) for i in order]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(sentences) < 2:
+        for i, sentence, options in tasks:
+            results[i] = parseOne(pcfg, i, sentence, options)
+        return results
+
+    pool = startPool(pcfg, workers)
+    try:
+        for result in pool.imap_unordered(_work, tasks, chunksize=1):
+            recordResult(result)
+            results[result.index] = result
+    finally:
+        stopPool(pool)
+    return results
+
+
+'''
+Generator version of parseBatch for unbounded input: sentences can be any
+iterable and are read lazily, and ParseResults are yielded in input order as
+soon as they are done. At most `window` sentences per worker are in flight,
+so memory does not grow with the size of the input.
+
+With metrics on (see hw3_pcfg_metrics.enableMetrics), both record the stats
+of the sentences the workers parse in this process, as a parse here would.
+'''
+
+
+def parseStream(pcfg, sentences, workers=1, window=4, **options):
+    if workers == 1:
+        for i, sentence in enumerate(sentences):
+            yield parseOne(pcfg, i, sentence, options)
+        return
+
+    pool = startPool(pcfg, workers)
+    pending = collections.deque()
+    try:
+        for i, sentence in enumerate(sentences):
+            pending.append(pool.apply_async(_work, ((i, sentence, options),)))
+            if len(pending) >= workers * window:
+                result = pending.popleft().get()
+                recordResult(result)
+                yield result
+        while pending:
+            result = pending.popleft().get()
+            recordResult(result)
+            yield result
+    finally:
+        stopPool(pool)
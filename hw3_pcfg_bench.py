@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import hw3_pcfg
+
+# the default grid of the suite: (nonterminals, binary rules, lexicon size),
+# and sentence lengths
+GRAMMAR_SIZES = [(10, 50, 100), (20, 200, 500), (40, 800, 2000)]
+SENTENCE_LENGTHS = [5, 10, 20]
+
+# a run is a regression against a baseline when a time grows by more than this
+REGRESSION_RATIO = 1.2
+
+
+def readSentences(inputFile):
+    sentences = []
+    with open(inputFile, "r") as file:
+        for line in file:
+            # accepts plain sentences as well as the gold file format
+            # (score | parses | sentence | tree)
+            if '|' in line:
+                line = line.split('|')[2]
+            if line.strip():
+                sentences.append(line.split())
+    return sentences
+
+
+'''
+Fills the chart of every sentence `repeat` times with the given inner loop
+('scan' is the first-cut loop over every binary rule, 'python' the
+left-child index with label bitsets) and returns (rule applications, seconds)
+'''
+
+
+def benchmarkFill(pcfg, sentences, engine, repeat=1):
+    applications = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for sentence in sentences:
+            chart, n = pcfg.fillChart(sentence, scan=(engine == 'scan'))
+            applications += n
+    return applications, time.perf_counter() - start
+
+
+'''
+Parses sentences of each of the given lengths (cut from the words of
+`sentences` run together) with and without max_span, and returns rows of
+(length, seconds per parse without the limit, seconds with it, number of
+glued pieces)
+'''
+
+
+def benchmarkLengths(pcfg, sentences, lengths, maxSpan, engine='python', repeat=1):
+    words = [word for sentence in sentences for word in sentence]
+    rows = []
+    for length in lengths:
+        sentence = (words * (length // len(words) + 1))[:length]
+        times = []
+        stats = hw3_pcfg.ParseStats()
+        for limit in (None, maxSpan):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pcfg.CKY(sentence, engine=engine, max_span=limit, stats=stats)
+            times.append((time.perf_counter() - start) / repeat)
+        rows.append((length, times[0], times[1], stats.glue))
+    return rows
+
+
+'''
+Writes a random grammar in Chomsky normal form (plus TOP -> N0) to path:
+`nonterminals` symbols N0 ..., `rules` distinct binary rules between them,
+and a lexicon of `lexicon` words w0 ..., each a word of one to three random
+nonterminals. Every nonterminal has at least one rule, and the rules of a
+parent get random probabilities that sum to 1. Returns the words
+'''
+
+
+def generateGrammar(path, nonterminals, rules, lexicon, seed=0):
+    r = random.Random(seed)
+    labels = ["N%d" % a for a in range(nonterminals)]
+    byParent = dict((label, []) for label in labels)
+    binary = set()
+    while len(binary) < min(rules, nonterminals ** 3):
+        binary.add((r.choice(labels), r.choice(labels), r.choice(labels)))
+    for parent, left, right in sorted(binary):
+        byParent[parent].append("%s %s" % (left, right))
+    words = ["w%d" % w for w in range(lexicon)]
+    for word in words:
+        for label in r.sample(labels, r.randint(1, min(3, nonterminals))):
+            byParent[label].append(word)
+    with open(path, "w") as file:
+        file.write("1.0 TOP -> N0\n")
+        for label in labels:
+            children = byParent[label] or [r.choice(words)]
+            weights = [r.random() + 0.1 for _ in children]
+            total = sum(weights)
+            for weight, rhs in zip(weights, children):
+                file.write("%r %s -> %s\n" % (weight / total, label, rhs))
+    return words
+
+
+def generateSentences(words, length, count, seed=0):
+    r = random.Random(seed)
+    return [[r.choice(words) for _ in range(length)] for _ in range(count)]
+
+
+'''
+Runs one point of the grid: generates the grammar and `count` sentences of
+`length` words, and times loading the grammar, CKY (filling the chart) and
+extracting the trees (toString of the lazy trees CKY returns). Returns a
+dict for the JSON report, with times in seconds and peakBytes the
+tracemalloc peak of parsing the first sentence
+'''
+
+
+def benchmarkPoint(size, length, engine='python', count=5, seed=0, directory=None):
+    nonterminals, rules, lexicon = size
+    handle, path = tempfile.mkstemp(suffix=".pcfg", dir=directory)
+    os.close(handle)
+    words = generateGrammar(path, nonterminals, rules, lexicon, seed)
+    sentences = generateSentences(words, length, count, seed)
+
+    start = time.perf_counter()
+    pcfg = hw3_pcfg.PCFG(path, engine=engine)
+    load = time.perf_counter() - start
+
+    parse = extract = 0.0
+    parsed = 0
+    for sentence in sentences:
+        start = time.perf_counter()
+        tree = pcfg.CKY(sentence)
+        middle = time.perf_counter()
+        if tree is not None:
+            tree.toString()
+            parsed += 1
+        parse += middle - start
+        extract += time.perf_counter() - middle
+
+    tracemalloc.start()
+    tree = pcfg.CKY(sentences[0])
+    if tree is not None:
+        tree.toString()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    os.remove(path)
+
+    cells = count * length * (length + 1) // 2
+    return {
+        "nonterminals": nonterminals, "rules": rules, "lexicon": lexicon, "length": length,
+        "sentences": count, "parsed": parsed,
+        "loadSeconds": load, "parseSeconds": parse, "extractSeconds": extract,
+        "sentencesPerSecond": count / (parse + extract) if parse + extract > 0 else None,
+        "secondsPerCell": parse / cells,
+        "peakBytes": peak,
+    }
+
+
+def runSuite(sizes, lengths, engine='python', count=5, seed=0):
+    results = [benchmarkPoint(size, length, engine, count, seed) for size in sizes for length in lengths]
+    return {
+        "engine": engine, "seed": seed, "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(), "machine": platform.machine(),
+        "results": results,
+    }
+
+
+'''
+Compares a suite report with an earlier one point by point. Returns
+(lines, regressions): a line per grid point found in both, and how many of
+them got slower (parse or extract time per sentence) by more than
+REGRESSION_RATIO
+'''
+
+
+def compareReports(report, baseline):
+    def key(point):
+        return point["nonterminals"], point["rules"], point["lexicon"], point["length"]
+
+    before = dict((key(point), point) for point in baseline["results"])
+    lines = []
+    if report["engine"] != baseline["engine"]:
+        lines.append("note: comparing engine %s with %s" % (report["engine"], baseline["engine"]))
+    regressions = 0
+    for point in report["results"]:
+        old = before.get(key(point))
+        if old is None:
+            continue
+        # per sentence, so runs with different counts compare
+        ratios = [(point[name] / point["sentences"]) / (old[name] / old["sentences"]) if old[name] > 0 else 1.0
+                  for name in ("parseSeconds", "extractSeconds")]
+        slower = max(ratios) > REGRESSION_RATIO
+        regressions += slower
+        lines.append("%4d nt %6d rules %6d words %3d long: parse %.2fx extract %.2fx%s"
+                     % (key(point) + tuple(ratios) + ("  REGRESSION" if slower else "",)))
+    return lines, regressions
+
+
+def printSuite(report):
+    print("%4s %6s %6s %4s %8s %8s %8s %10s %12s %10s" % (
+        "nt", "rules", "words", "len", "load s", "parse s", "tree s", "sent/s", "s/cell", "peak KB"))
+    for point in report["results"]:
+        print("%4d %6d %6d %4d %8.4f %8.4f %8.4f %10.1f %12.3g %10d" % (
+            point["nonterminals"], point["rules"], point["lexicon"], point["length"], point["loadSeconds"],
+            point["parseSeconds"], point["extractSeconds"], point["sentencesPerSecond"] or 0.0,
+            point["secondsPerCell"], point["peakBytes"] // 1024))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CKY engines")
+    parser.add_argument("grammar", nargs="?", default="toygrammar.pcfg")
+    parser.add_argument("sentences", nargs="?", default="pcfg_test_gold.txt")
+    parser.add_argument("repeat", nargs="?", type=int, default=10)
+    parser.add_argument("--suite", action="store_true",
+                        help="run the grid of random grammars and sentence lengths instead")
+    parser.add_argument("--engine", default="python", choices=["python", "scan", "numpy", "astar"])
+    parser.add_argument("--count", type=int, default=5, help="sentences per grid point")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="write the suite report to this file")
+    parser.add_argument("--compare", default=None, help="compare the suite with an earlier report")
+    args = parser.parse_args(argv)
+
+    if args.suite:
+        report = runSuite(GRAMMAR_SIZES, SENTENCE_LENGTHS, args.engine, args.count, args.seed)
+        printSuite(report)
+        if args.json is not None:
+            with open(args.json, "w") as file:
+                json.dump(report, file, indent=1)
+        if args.compare is not None:
+            with open(args.compare, "r") as file:
+                lines, regressions = compareReports(report, json.load(file))
+            for line in lines:
+                print(line)
+            if regressions:
+                print("%d regression(s) against %s" % (regressions, args.compare))
+                return 1
+        return 0
+
+    grammarFile, sentenceFile, repeat = args.grammar, args.sentences, args.repeat
+
+    pcfg = hw3_pcfg.PCFG(grammarFile)
+    sentences = readSentences(sentenceFile)
+    print("%d sentences x %d, grammar %s" % (len(sentences), repeat, grammarFile))
+
+    baseline = None
+    for engine in ('scan', 'python'):
+        applications, seconds = benchmarkFill(pcfg, sentences, engine, repeat)
+        rate = applications / seconds if seconds > 0 else float('inf')
+        line = "%-8s %10d rule applications %8.3fs %12.0f applications/s" % (engine, applications, seconds, rate)
+        if baseline is None:
+            baseline = seconds
+        else:
+            line += "  (%.1fx)" % (baseline / seconds)
+        print(line)
+
+    maxSpan = 10
+    print("latency by sentence length, max_span=%d (python engine)" % maxSpan)
+    for length, full, limited, pieces in benchmarkLengths(pcfg, sentences, (10, 20, 40, 80), maxSpan):
+        print("%4d words  full %8.4fs  max_span %8.4fs  (%.1fx, %d glued pieces)"
+              % (length, full, limited, full / limited, pieces))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
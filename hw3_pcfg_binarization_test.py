@@ -0,0 +1,56 @@
+import sys
+import hw3_pcfg
+from hw3_pcfg_testing import allParses, close, runTests, scratchDirectory, writeGrammar
+
+'''
+Tests of binarization on load (PCFG.binarize): a grammar with n-ary rules
+must score, count and build trees as the n-ary grammar itself does, by a
+brute-force enumeration over its rules as written, with no intermediate
+symbol left in an output tree
+'''
+
+NARY_GRAMMAR = """1.0 TOP -> S
+0.6 S -> NP VP PU
+0.4 S -> NP VP
+0.5 NP -> DT JJ NN
+0.3 NP -> DT NN
+0.2 NP -> DT JJ JJ NN
+0.5 VP -> VB NP PP
+0.3 VP -> VB NP
+0.2 VP -> VP PP
+1.0 PP -> IN NP
+1.0 DT -> the
+1.0 JJ -> big
+0.5 NN -> dog
+0.5 NN -> cat
+1.0 VB -> sees
+1.0 IN -> with
+1.0 PU -> .
+"""
+
+NARY_SENTENCES = ["the dog sees the cat", "the big dog sees the cat .",
+                  "the big big cat sees the dog with the big cat .",
+                  "the dog sees the cat with the cat with the dog"]
+
+
+def testBinarization():
+    with scratchDirectory() as directory:
+        path = writeGrammar(directory, "nary.pcfg", NARY_GRAMMAR)
+        pcfg = hw3_pcfg.PCFG(path)
+        assert pcfg.binarization()[0] > 0
+        for text in NARY_SENTENCES:
+            sentence = text.split()
+            parses = allParses(path, sentence)
+            best = max(prob for prob, _ in parses)
+            tree = pcfg.CKY(sentence)
+            # scores, counts and trees are those of the n-ary grammar
+            assert close(tree.prob, best), text
+            assert tree.numParses == len(parses), text
+            assert tree.toString() in [string for prob, string in parses if close(prob, best)], text
+            assert hw3_pcfg.BINARIZED not in tree.toString(), text
+            trees = pcfg.kbest(sentence, len(parses))
+            assert sorted(tree.toString() for tree in trees) == sorted(string for _, string in parses), text
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
@@ -0,0 +1,113 @@
+import collections
+import json
+import os
+import pickle
+import sqlite3
+
+'''
+A ParseCache sits in front of PCFG.CKY (see PCFG.enableResultCache) and
+remembers the result of every sentence it has parsed: the tree (None for a
+parse failure) and the ParseStats of the parse, which a hit copies back into
+the caller's stats. Entries are keyed by the words, the sha1 of the grammar
+file and every option that can change the result, so a hit returns exactly
+what parsing again would.
+
+The first tier is an in-memory LRU of at most `size` entries. With a path,
+evicted and new entries also go to a SQLite file there, which outlives the
+process; a lookup that misses the LRU tries it before parsing. Entries are
+kept pickled: the tree is built before it is stored, so no chart stays alive
+in the cache, and every hit unpickles a tree and stats of its own.
+
+hits, diskHits, misses and evictions count lookups answered from memory,
+lookups answered from the file, lookups that had to parse, and entries
+dropped from the LRU
+'''
+
+
+class ParseCache:
+    def __init__(self, grammarHash, size=1024, path=None):
+        self.grammarHash = grammarHash
+        self.size = size
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        self.evictions = 0
+        # the SQLite connection, and the process that opened it: a worker
+        # forked from this process must open its own
+        self.db = None
+        self.pid = None
+
+    def key(self, sentence, **options):
+        return json.dumps([self.grammarHash, list(sentence), sorted(options.items())])
+
+    '''
+    Returns (tree, stats fields) for a key, or None if it is not cached. Every
+    hit gets a tree and fields of its own, unpickled from the entry
+    '''
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return pickle.loads(self.entries[key])
+        db = self.connect()
+        if db is not None:
+            row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.diskHits += 1
+                self.remember(key, row[0])
+                return pickle.loads(row[0])
+        self.misses += 1
+        return None
+
+    '''
+    Caches the result of a parse. Pickling builds a lazy tree (as a plain
+    tree, see LazyItem) and copies the stats, phases included, so the entry
+    holds no reference to the chart or to the caller's objects
+    '''
+
+    def put(self, key, tree, stats):
+        entry = pickle.dumps((tree, dict(vars(stats)) if stats is not None else None), pickle.HIGHEST_PROTOCOL)
+        self.remember(key, entry)
+        db = self.connect()
+        if db is not None:
+            db.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, entry))
+            db.commit()
+
+    def remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def connect(self):
+        if self.path is None:
+            return None
+        if self.db is None or self.pid != os.getpid():
+            self.db = sqlite3.connect(self.path)
+            self.db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value BLOB)")
+            self.pid = os.getpid()
+        return self.db
+
+    def counters(self):
+        return {"hits": self.hits, "diskHits": self.diskHits, "misses": self.misses,
+                "evictions": self.evictions, "entries": len(self.entries)}
+
+    # Empties the LRU (the file keeps its entries)
+    def clear(self):
+        self.entries.clear()
+
+    def close(self):
+        if self.db is not None and self.pid == os.getpid():
+            self.db.close()
+        self.db = None
+
+    # the connection stays with the process that opened it
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["db"] = None
+        state["pid"] = None
+        return state
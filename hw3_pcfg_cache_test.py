@@ -0,0 +1,85 @@
+import gc
+import os
+import sys
+import tracemalloc
+import hw3_pcfg
+from hw3_pcfg_testing import HERE, runTests, scratchDirectory
+
+'''
+Tests of the result cache (hw3_pcfg_cache.py): hits must return the tree
+parsing again would, each a tree of its own, from memory or from the SQLite
+file, and the cache must hold the trees, not the charts they came from
+'''
+
+# The most memory 10 cached parses of the toy grammar may keep alive: their
+# trees take about 50 KB, their charts over 1 MB
+RETAINED_LIMIT = 256 * 1024
+
+
+def testResultCache():
+    with scratchDirectory() as directory:
+        grammarFile = os.path.join(HERE, 'toygrammar.pcfg')
+        sentence = "the man eats the sushi with the chopsticks".split()
+        reference = hw3_pcfg.PCFG(grammarFile).CKY(sentence)
+        pcfg = hw3_pcfg.PCFG(grammarFile)
+        cache = pcfg.enableResultCache(size=2, path=os.path.join(directory, "results.db"))
+        first = pcfg.CKY(sentence)
+        stats = hw3_pcfg.ParseStats()
+        second = pcfg.CKY(sentence, stats=stats)
+        assert stats.cached and cache.hits == 1 and cache.misses == 1
+        # every hit is a tree of its own
+        assert second is not first and second.toString() == reference.toString()
+        second.children[0].label = 'X'
+        assert pcfg.CKY(sentence).toString() == reference.toString()
+        # other options are other entries; parse failures are cached too
+        assert pcfg.CKY(sentence, beam=1) is not None and cache.misses == 2
+        assert pcfg.CKY("man the".split()) is None and pcfg.CKY("man the".split()) is None
+        assert cache.evictions > 0
+        # the file outlives the process's cache
+        other = hw3_pcfg.PCFG(grammarFile)
+        otherCache = other.enableResultCache(path=os.path.join(directory, "results.db"))
+        assert other.CKY(sentence).toString() == reference.toString()
+        assert otherCache.diskHits == 1 and otherCache.misses == 0
+        cache.close()
+        otherCache.close()
+
+
+def testNoChartRetained():
+    pcfg = hw3_pcfg.PCFG(os.path.join(HERE, 'toygrammar.pcfg'))
+    pcfg.CKY("the man eats the sushi".split())
+    pcfg.enableResultCache()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for k in range(1, 11):
+            sentence = ("the man eats the tuna " + "and the woman eats the sushi " * k).split()
+            stats = hw3_pcfg.ParseStats()
+            assert pcfg.CKY(sentence, stats=stats) is not None
+            del stats
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    assert retained < RETAINED_LIMIT, "%d KB retained" % (retained // 1024)
+
+
+def testStatsCopied():
+    pcfg = hw3_pcfg.PCFG(os.path.join(HERE, 'toygrammar.pcfg'))
+    pcfg.enableResultCache()
+    sentence = "the man eats the sushi".split()
+    stats = hw3_pcfg.ParseStats()
+    pcfg.CKY(sentence, stats=stats)
+    phases = dict(stats.phases)
+    stats.phases['extra'] = 1.0
+    hit = hw3_pcfg.ParseStats()
+    pcfg.CKY(sentence, stats=hit)
+    assert hit.cached and hit.phases == phases, hit.phases
+    hit.phases['extra'] = 1.0
+    again = hw3_pcfg.ParseStats()
+    pcfg.CKY(sentence, stats=again)
+    assert again.phases == phases, again.phases
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
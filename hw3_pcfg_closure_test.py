@@ -0,0 +1,64 @@
+import sys
+import hw3_pcfg
+from hw3_pcfg_grammar import UnaryCycleError
+from hw3_pcfg_testing import allParses, close, randomCases, runTests, scratchDirectory, writeGrammar
+
+'''
+Tests of the unary closure (UnaryClosure in hw3_pcfg_grammar.py): CKY with
+unary chains must score and count exactly the parses a brute-force
+enumeration finds, a grammar with 2^28 unary chains must load without
+walking them, and unary cycles must be rejected
+'''
+
+CYCLIC_GRAMMAR = """1.0 TOP -> S
+0.5 S -> A
+0.5 S -> w
+0.5 A -> B
+0.5 A -> w
+0.5 B -> A
+0.5 B -> w
+"""
+
+
+# X0 -> Xj for every j > 0, X1 -> Xj for every j > 1, ...: 2^(labels - 2)
+# chains from X0 down to the last label, which is the only one over a word
+def ladderGrammar(labels):
+    lines = ["1.0 TOP -> X0"]
+    for i in range(labels - 1):
+        for j in range(i + 1, labels):
+            lines.append("%r X%d -> X%d" % (1.0 / (labels - 1 - i), i, j))
+    lines.append("1.0 X%d -> w" % (labels - 1))
+    return "\n".join(lines) + "\n"
+
+
+def testChainsAgreeWithBruteForce():
+    for path, pcfg, sentences in randomCases():
+        for sentence in sentences:
+            parses = allParses(path, sentence)
+            tree = pcfg.CKY(sentence)
+            assert (tree is None) == (not parses), (path, sentence)
+            if tree is not None:
+                assert tree.numParses == len(parses), (path, sentence)
+                assert close(tree.prob, max(prob for prob, _ in parses)), (path, sentence)
+
+
+def testManyChains():
+    with scratchDirectory() as directory:
+        pcfg = hw3_pcfg.PCFG(writeGrammar(directory, "ladder.pcfg", ladderGrammar(30)))
+        tree = pcfg.CKY(["w"])
+        assert tree.numParses == 2 ** 28, tree.numParses
+
+
+def testCyclesRejected():
+    with scratchDirectory() as directory:
+        path = writeGrammar(directory, "cyclic.pcfg", CYCLIC_GRAMMAR)
+        try:
+            hw3_pcfg.PCFG(path)
+        except UnaryCycleError as e:
+            assert set(e.cycle) == {"A", "B"} and e.path == path, (e.cycle, e.path)
+        else:
+            assert False, "a unary cycle was accepted"
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
@@ -0,0 +1,259 @@
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+import hw3_pcfg
+import hw3_pcfg_batch
+from hw3_pcfg import TOP, LeafItem, readTree
+
+'''
+Gold evaluation: parses the sentences of a gold file (the format of
+pcfg_test_gold.txt, "score | numParses | sentence | tree" per line) over
+worker processes and scores the Viterbi trees against the gold trees with
+PARSEVAL: labeled precision, recall and F1 over constituents, plus exact
+match, Viterbi score agreement and numParses agreement:
+
+    python hw3_pcfg_eval.py toygrammar.pcfg pcfg_test_gold.txt --workers 8
+
+Trees are compared as multisets of labeled spans (label, i, j), read
+straight off the tree objects; nothing is turned into a string. As in
+evalb, preterminals (the part-of-speech nodes over one word) and TOP are
+not counted as brackets, so a parse failure costs recall but not precision.
+A tree is an exact match when all of its nodes, preterminals and unary
+chains included, are the gold tree's
+'''
+
+# Viterbi scores agree when they are equal to this many decimals, as in
+# hw3_pcfg_test.py
+SCORE_DECIMALS = 5
+
+
+'''
+Returns (nodes, brackets) for a tree: nodes lists (label, i, j) for every
+internal node in preorder, which pins the whole tree down, and brackets is
+the Counter of the labeled spans PARSEVAL scores
+'''
+
+
+def constituents(tree):
+    nodes = []
+    brackets = collections.Counter()
+    # (node, its position in nodes once its children are done, else None);
+    # ends holds the end so far of every open node, which grows word by word
+    stack = [(tree, None)]
+    ends = []
+    while stack:
+        node, position = stack.pop()
+        if position is not None:
+            label, i, _ = nodes[position]
+            end = ends.pop()
+            nodes[position] = (label, i, end)
+            if ends:
+                ends[-1] = end
+            preterminal = len(node.children) == 1 and isinstance(node.children[0], LeafItem)
+            if not preterminal and label != TOP:
+                brackets[(label, i, end)] += 1
+        elif isinstance(node, LeafItem):
+            ends[-1] += 1
+        else:
+            # a node starts where what came before it ends
+            i = ends[-1] if ends else 0
+            stack.append((node, len(nodes)))
+            nodes.append((node.label, i, None))
+            ends.append(i)
+            stack.extend((child, None) for child in reversed(node.children))
+    return nodes, brackets
+
+
+'''
+The scores of one sentence: the brackets of the gold and test trees and
+how many of them match, whether the trees are equal, whether the Viterbi
+score and numParses are the gold ones (numParses None if the engine does
+not count parses), and the error that made parsing crash, if any
+'''
+
+
+class SentenceScore:
+    def __init__(self, index, length):
+        self.index = index
+        self.length = length
+        self.parsed = False
+        self.error = None
+        self.gold = 0
+        self.test = 0
+        self.matched = 0
+        self.exact = False
+        self.scoreMatch = False
+        self.numParses = None
+        self.parsesMatch = False
+        self.seconds = 0.0
+
+
+# Parses a line of a gold file into (score, numParses, words, tree text)
+def readGoldLine(line):
+    fields = line.split('|')
+    if len(fields) != 4:
+        raise ValueError("a gold line has 4 fields separated by '|': %r" % line.strip())
+    return float(fields[0]), int(fields[1]), fields[2].split(), fields[3]
+
+
+def evaluateOne(pcfg, index, line, options):
+    try:
+        score, numParses, words, goldText = readGoldLine(line)
+        goldNodes, goldBrackets = constituents(readTree(goldText))
+    except ValueError as e:
+        result = SentenceScore(index, 0)
+        result.error = "bad gold line: %s" % e
+        return result
+    result = SentenceScore(index, len(words))
+    result.gold = sum(goldBrackets.values())
+    start = time.perf_counter()
+    try:
+        tree = pcfg.CKY(words, **options)
+    except Exception as e:
+        # one bad sentence must not take the evaluation down with it
+        result.error = "%s: %s" % (type(e).__name__, e)
+        tree = None
+    if tree is not None:
+        testNodes, testBrackets = constituents(tree)
+        result.parsed = True
+        result.test = sum(testBrackets.values())
+        result.matched = sum((goldBrackets & testBrackets).values())
+        result.exact = testNodes == goldNodes
+        result.scoreMatch = round(tree.prob, SCORE_DECIMALS) == round(score, SCORE_DECIMALS)
+        result.numParses = tree.numParses
+        result.parsesMatch = tree.numParses == numParses
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+# the workers parse with the grammar hw3_pcfg_batch.startPool gave them
+def _work(task):
+    index, line, options = task
+    return evaluateOne(hw3_pcfg_batch._pcfg, index, line, options)
+
+
+'''
+Evaluates the lines of a gold file over `workers` processes (default: one
+per CPU) and returns their SentenceScores in input order. As in
+hw3_pcfg_batch.parseBatch, the longest sentences are handed out first. A
+malformed gold line is scored as an error, not raised
+'''
+
+
+def evaluateLines(pcfg, lines, workers=None, **options):
+    lines = [line for line in lines if line.strip()]
+    # the length of the line stands in for the length of the sentence
+    order = sorted(range(len(lines)), key=lambda i: len(lines[i]), reverse=True)
+    tasks = [(i, lines[i], options) for i in order]
+    scores = [None] * len(lines)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(lines) < 2:
+        for i, line, options in tasks:
+            scores[i] = evaluateOne(pcfg, i, line, options)
+        return scores
+
+    pool = hw3_pcfg_batch.startPool(pcfg, workers)
+    try:
+        # a task is one sentence, cheap to ship; small chunks keep the long
+        # sentences at the front from piling up on one worker
+        for result in pool.imap_unordered(_work, tasks, chunksize=4):
+            scores[result.index] = result
+    finally:
+        hw3_pcfg_batch.stopPool(pool)
+    return scores
+
+
+'''
+Sums SentenceScores up into the totals of the evaluation, as a dict ready
+for JSON: PARSEVAL precision, recall and F1 (in percent), and the counts
+and rates of parsed sentences, exact matches and score and numParses
+agreement. numParses agreement is over the sentences whose engine counted
+parses
+'''
+
+
+def summarize(scores, seconds):
+    total = len(scores)
+    gold = sum(score.gold for score in scores)
+    test = sum(score.test for score in scores)
+    matched = sum(score.matched for score in scores)
+    counted = [score for score in scores if score.numParses is not None]
+    precision = 100.0 * matched / test if test else 0.0
+    recall = 100.0 * matched / gold if gold else 0.0
+
+    def rate(count, outOf):
+        return 100.0 * count / outOf if outOf else 0.0
+
+    return {
+        "sentences": total,
+        "parsed": sum(score.parsed for score in scores),
+        "errors": sum(score.error is not None for score in scores),
+        "goldBrackets": gold,
+        "testBrackets": test,
+        "matchedBrackets": matched,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "exactMatch": rate(sum(score.exact for score in scores), total),
+        "scoreAgreement": rate(sum(score.scoreMatch for score in scores), total),
+        "numParsesAgreement": rate(sum(score.parsesMatch for score in counted), len(counted)),
+        "numParsesCounted": len(counted),
+        "seconds": seconds,
+        "sentencesPerSecond": total / seconds if seconds > 0 else 0.0,
+    }
+
+
+def printSummary(summary, out=sys.stdout):
+    out.write("%(sentences)d sentences, %(parsed)d parsed, %(errors)d errors\n" % summary)
+    out.write("labeled precision %(precision)6.2f  recall %(recall)6.2f  F1 %(f1)6.2f"
+              "  (%(matchedBrackets)d of %(goldBrackets)d gold, %(testBrackets)d test brackets)\n" % summary)
+    out.write("exact match %(exactMatch)6.2f%%  score agreement %(scoreAgreement)6.2f%%"
+              "  numParses agreement %(numParsesAgreement)6.2f%% (of %(numParsesCounted)d)\n" % summary)
+    out.write("%(seconds).2fs, %(sentencesPerSecond).1f sentences/s\n" % summary)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score Viterbi parses against a gold file with PARSEVAL")
+    parser.add_argument("grammar", help="grammar file (.pcfg)")
+    parser.add_argument("gold", help="gold file: score | numParses | sentence | tree, one per line")
+    parser.add_argument("--engine", default="python", choices=["python", "scan", "numpy", "astar"])
+    parser.add_argument("--workers", type=int, default=None, help="number of parser processes")
+    parser.add_argument("--cache", action="store_true", help="use the compiled grammar cache")
+    parser.add_argument("--signatures", action="store_true",
+                        help="back off unknown words to word-shape signatures (see Lexicon)")
+    parser.add_argument("--beam", type=int, default=None, help="keep the best N items per cell")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="drop items more than this many nats below the best of their cell")
+    parser.add_argument("--max-span", type=int, default=None,
+                        help="only build constituents of up to N words, gluing the pieces under TOP")
+    parser.add_argument("--json", default=None, help="write the summary to this file")
+    parser.add_argument("--verbose", action="store_true", help="list the sentences that are not exact matches")
+    args = parser.parse_args(argv)
+
+    pcfg = hw3_pcfg.PCFG(args.grammar, engine=args.engine, cache=args.cache, signatures=args.signatures)
+    with open(args.gold, "r") as file:
+        lines = file.readlines()
+    start = time.perf_counter()
+    scores = evaluateLines(pcfg, lines, workers=args.workers, beam=args.beam, threshold=args.threshold,
+                           max_span=args.max_span)
+    summary = summarize(scores, time.perf_counter() - start)
+
+    if args.verbose:
+        for score in scores:
+            if not score.exact:
+                reason = score.error or ("no parse" if not score.parsed else
+                                         "%d of %d brackets" % (score.matched, score.gold))
+                sys.stdout.write("%5d  %s\n" % (score.index, reason))
+    printSummary(summary)
+    if args.json is not None:
+        with open(args.json, "w") as file:
+            json.dump(summary, file, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
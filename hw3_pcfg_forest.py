@@ -0,0 +1,192 @@
+import array
+from hw3_pcfg import TOP
+from hw3_pcfg_grammar import StringTable, readSections, writeSections
+
+FOREST_MAGIC = b"PCFGF\x00\x00\x01"
+FOREST_VERSION = 1
+
+# edgeKind values
+EDGE_KINDS = ['lexical', 'binary', 'identity', 'chain']
+
+# name -> array typecode of every section in a forest file
+SECTIONS = [
+    # nodes, children before parents (the root is the last node)
+    ("nodeStart", "i"), ("nodeEnd", "i"), ("nodeLabel", "i"), ("nodeClosed", "b"),
+    ("nodeScore", "d"),
+    # the edges into node v are edges nodeEdges[v]:nodeEdges[v + 1]
+    ("nodeEdges", "i"),
+    # edges: kind, rule (or chain) log prob, chain (index into the chain
+    # table, -1 for other kinds), tail nodes tails[edgeTails[e]:edgeTails[e + 1]]
+    ("edgeKind", "b"), ("edgeProb", "d"), ("edgeChain", "i"),
+    ("edgeTails", "i"), ("tails", "i"),
+    # exact parse counts, as little-endian unsigned integers of any length
+    ("countOffsets", "q"), ("countBlob", "B"),
+    # unary chains used by chain edges, as label ids
+    ("chainOffsets", "i"), ("chainLabels", "i"),
+    ("symbolOffsets", "q"), ("symbolBlob", "B"),
+    ("wordOffsets", "q"), ("wordBlob", "B"),
+]
+
+'''
+A Forest is the packed parse forest of one sentence: a hypergraph whose nodes
+are (span, label) items of the chart and whose edges are rule applications,
+holding every parse numParses counts without listing them. As in
+PCFG.incomingEdges, a label can have two nodes over a span: its base item and,
+when a unary chain reaches it there, its closed item. A closed item that is
+only its own base item is left out; edges point to the base item instead.
+
+Every node carries its exact number of parses, summed over all of its edges
+(every split point and rule), and its Viterbi log prob. A forest is saved as
+flat arrays in one binary file that Forest.load maps without parsing anything.
+'''
+
+
+class Forest:
+    def __init__(self, header, sections):
+        self.n = header["n"]
+        self.root = header["root"]
+        for name, _ in SECTIONS:
+            setattr(self, name, sections[name])
+        self.symbols = StringTable(self.symbolOffsets, self.symbolBlob).strings()
+        self.words = StringTable(self.wordOffsets, self.wordBlob).strings()
+
+    '''
+    Builds the forest of the parses of TOP in a chart filled by
+    PCFG.fillChart. Only the nodes that some parse of TOP uses are kept
+    '''
+
+    @staticmethod
+    def fromChart(pcfg, chart):
+        arrays = dict((name, array.array(typecode)) for name, typecode in SECTIONS)
+        symbolIds = {}
+        chainIds = {}
+        counts = []
+        arrays["nodeEdges"].append(0)
+        arrays["edgeTails"].append(0)
+        arrays["chainOffsets"].append(0)
+
+        def symbolId(label):
+            return symbolIds.setdefault(label, len(symbolIds))
+
+        def chainId(chain):
+            if chain not in chainIds:
+                chainIds[chain] = len(chainIds)
+                arrays["chainLabels"].extend(symbolId(label) for label in chain)
+                arrays["chainOffsets"].append(len(arrays["chainLabels"]))
+            return chainIds[chain]
+
+        # a closed item whose only edge is to its own base item is that item
+        aliases = {}
+
+        def node(key):
+            if key not in aliases:
+                aliases[key] = key
+                if key[3]:
+                    keyEdges = pcfg.incomingEdges(chart, key)
+                    if len(keyEdges) == 1 and keyEdges[0][0] == 'identity':
+                        aliases[key] = keyEdges[0][1][0]
+            return aliases[key]
+
+        # node -> [(kind, tail nodes, log prob, chain id)]
+        edges = {}
+        ids = {}
+        root = -1
+        if chart.n > 0 and chart.getRoot().getItem(TOP) is not None:
+            stack = [(node((0, chart.n, TOP, True)), False)]
+            while stack:
+                key, ready = stack.pop()
+                if not ready:
+                    if key not in edges:
+                        edges[key] = [(EDGE_KINDS.index(edge[0]), [node(tail) for tail in edge[1]], edge[2],
+                                       chainId(edge[4]) if edge[0] == 'chain' else -1)
+                                      for edge in pcfg.incomingEdges(chart, key)]
+                        stack.append((key, True))
+                        for kind, tails, weight, chain in edges[key]:
+                            stack.extend((tail, False) for tail in tails if tail not in edges)
+                    continue
+
+                # all the tails have ids by now
+                i, j, label, closed = key
+                cell = chart.getCell(i, j)
+                count = 0
+                for kind, tails, weight, chain in edges.pop(key):
+                    arrays["edgeKind"].append(kind)
+                    arrays["edgeProb"].append(weight)
+                    arrays["edgeChain"].append(chain)
+                    product = 1
+                    for tail in tails:
+                        arrays["tails"].append(ids[tail])
+                        product *= counts[ids[tail]]
+                    arrays["edgeTails"].append(len(arrays["tails"]))
+                    count += product
+                edges[key] = None
+                ids[key] = len(counts)
+                counts.append(count)
+                arrays["nodeStart"].append(i)
+                arrays["nodeEnd"].append(j)
+                arrays["nodeLabel"].append(symbolId(label))
+                arrays["nodeClosed"].append(1 if closed else 0)
+                arrays["nodeScore"].append(cell.getItem(label).prob if closed else cell.getBaseItem(label).prob)
+                arrays["nodeEdges"].append(len(arrays["edgeKind"]))
+            root = len(counts) - 1
+
+        arrays["countOffsets"].append(0)
+        blob = []
+        for count in counts:
+            blob.append(count.to_bytes((count.bit_length() + 7) // 8, "little"))
+            arrays["countOffsets"].append(arrays["countOffsets"][-1] + len(blob[-1]))
+        arrays["countBlob"] = array.array("B", b"".join(blob))
+        symbols = StringTable.fromStrings(sorted(symbolIds, key=symbolIds.get))
+        words = StringTable.fromStrings(chart.words)
+        arrays["symbolOffsets"], arrays["symbolBlob"] = symbols.offsets, symbols.blob
+        arrays["wordOffsets"], arrays["wordBlob"] = words.offsets, words.blob
+        return Forest({"n": chart.n, "root": root}, arrays)
+
+    def save(self, path):
+        writeSections(path, FOREST_MAGIC, {"version": FOREST_VERSION, "n": self.n, "root": self.root},
+                      [(name, typecode, getattr(self, name)) for name, typecode in SECTIONS])
+
+    '''
+    Maps a forest file. Returns None if it is missing or in another format
+    '''
+
+    @staticmethod
+    def load(path):
+        loaded = readSections(path, FOREST_MAGIC)
+        if loaded is None or loaded[0]["version"] != FOREST_VERSION:
+            return None
+        return Forest(*loaded)
+
+    def __len__(self):
+        return len(self.nodeLabel)
+
+    def label(self, v):
+        return self.symbols[self.nodeLabel[v]]
+
+    def span(self, v):
+        return self.nodeStart[v], self.nodeEnd[v]
+
+    # Exact number of parses below node v
+    def count(self, v):
+        return int.from_bytes(self.countBlob[self.countOffsets[v]:self.countOffsets[v + 1]], "little")
+
+    # Number of parses of the sentence (0 if it has none)
+    def numParses(self):
+        return 0 if self.root < 0 else self.count(self.root)
+
+    '''
+    Returns the edges into node v as (kind, log prob, tail nodes, chain),
+    where chain is the unary chain's labels for a chain edge and None
+    otherwise
+    '''
+
+    def edges(self, v):
+        out = []
+        for e in range(self.nodeEdges[v], self.nodeEdges[v + 1]):
+            chain = None
+            c = self.edgeChain[e]
+            if c >= 0:
+                chain = tuple(self.symbols[s] for s in self.chainLabels[self.chainOffsets[c]:self.chainOffsets[c + 1]])
+            tails = tuple(self.tails[self.edgeTails[e]:self.edgeTails[e + 1]])
+            out.append((EDGE_KINDS[self.edgeKind[e]], self.edgeProb[e], tails, chain))
+        return out
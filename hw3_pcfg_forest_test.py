@@ -0,0 +1,21 @@
+import sys
+from hw3_pcfg_testing import allParses, randomCases, runTests
+
+'''
+Tests of the packed parse forests (hw3_pcfg_forest.py): a forest must count
+exactly the parses CKY counts, which are every parse a brute-force
+enumeration finds
+'''
+
+
+def testForestCounts():
+    for path, pcfg, sentences in randomCases():
+        for sentence in sentences:
+            tree = pcfg.CKY(sentence)
+            numParses = tree.numParses if tree is not None else 0
+            assert numParses == len(allParses(path, sentence)), (path, sentence)
+            assert pcfg.forest(sentence).numParses() == numParses, (path, sentence)
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
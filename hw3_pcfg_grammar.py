@@ -0,0 +1,700 @@
+import array
+import bisect
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+# Compiled grammars live next to the text grammar, e.g. toygrammar.pcfgc
+CACHE_SUFFIX = "c"
+MAGIC = b"PCFGC\x00\x00\x01"
+FORMAT_VERSION = 3
+
+# text grammars are read this many bytes (of whole lines) at a time
+READ_CHUNK = 1 << 20
+
+# how far the probabilities of a parent's rules may sum from 1
+PROB_SUM_TOLERANCE = 1e-4
+
+# GrammarError lists at most this many malformed lines
+MAX_REPORTED_ERRORS = 20
+
+# name -> array typecode of every section in a compiled grammar file
+SECTIONS = [
+    # binary rules, sorted by parent (file order within a parent)
+    ("binParent", "i"), ("binLeft", "i"), ("binRight", "i"), ("binProb", "d"),
+    # the line of the text grammar each binary rule was read from (Rule.rank)
+    ("binRank", "i"),
+    # unary rules between nonterminals (TOP -> S)
+    ("unParent", "i"), ("unChild", "i"), ("unProb", "d"),
+    # lexicon: the rules of word w are lexParent/lexProb[lexStart[w]:lexStart[w + 1]]
+    ("lexStart", "i"), ("lexParent", "i"), ("lexProb", "d"),
+    # symbol and word strings: utf-8 blobs split by offset tables
+    ("symbolOffsets", "q"), ("symbolBlob", "B"),
+    ("wordOffsets", "q"), ("wordBlob", "B"),
+]
+
+
+def fileHash(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# A variant goes before the extension: toygrammar.renormalized.pcfgc (or
+# another suffix for other files derived from the grammar)
+def cachePath(grammarFile, variant=None, suffix=CACHE_SUFFIX):
+    if variant:
+        root, ext = os.path.splitext(grammarFile)
+        grammarFile = "%s.%s%s" % (root, variant, ext)
+    return grammarFile + suffix
+
+
+'''
+A GrammarError is raised for a text grammar with malformed lines; errors
+holds all of them as (line number, message)
+'''
+
+
+class GrammarError(ValueError):
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        lines = ["%s:%d: %s" % (path, number, message) for number, message in errors[:MAX_REPORTED_ERRORS]]
+        if len(errors) > MAX_REPORTED_ERRORS:
+            lines.append("... and %d more" % (len(errors) - MAX_REPORTED_ERRORS))
+        ValueError.__init__(self, "%d malformed line(s) in grammar\n%s" % (len(errors), "\n".join(lines)))
+
+
+'''
+Streams the rules of a text grammar, READ_CHUNK bytes of lines at a time,
+as (line number, prob, parent, children) with prob as written (not a log).
+Lines are "prob parent -> child ..."; blank lines and lines starting with #
+are skipped. A malformed line is not yielded but appended to errors as
+(line number, message), so one pass finds all of them
+'''
+
+
+def readRules(path, errors):
+    number = 0
+    with open(path, "r") as file:
+        while True:
+            lines = file.readlines(READ_CHUNK)
+            if not lines:
+                break
+            for line in lines:
+                number += 1
+                raw = line.split()
+                if not raw or raw[0].startswith("#"):
+                    continue
+                if len(raw) < 4 or raw[2] != "->":
+                    errors.append((number, "expected 'prob parent -> child ...', got %r" % line.strip()))
+                    continue
+                try:
+                    prob = float(raw[0])
+                except ValueError:
+                    errors.append((number, "bad probability %r" % raw[0]))
+                    continue
+                if not 0.0 < prob <= 1.0:
+                    errors.append((number, "probability %s is not in (0, 1]" % raw[0]))
+                    continue
+                yield number, prob, raw[1], raw[3:]
+
+
+'''
+Writes a file of typed arrays: MAGIC, the length of a json header, the
+header (`header` plus the byte order and the layout of the sections), then
+every section's bytes, each 8-byte aligned. sections is a list of
+(name, array typecode, array or memoryview)
+'''
+
+
+def writeSections(path, magic, header, sections):
+    layout = []
+    offset = 0
+    for name, typecode, values in sections:
+        nbytes = memoryview(values).nbytes
+        layout.append([name, typecode, offset, nbytes])
+        offset += nbytes + (-nbytes % 8)
+    header = dict(header, byteorder=sys.byteorder, sections=layout)
+    header = json.dumps(header).encode("utf-8")
+    header += b" " * (-(len(magic) + 8 + len(header)) % 8)
+
+    # write to a temporary file first so readers never map a partial file
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for (_, _, values), (_, _, _, nbytes) in zip(sections, layout):
+            f.write(memoryview(values).cast("B"))
+            f.write(b"\x00" * (-nbytes % 8))
+    os.replace(tmp, path)
+
+
+'''
+Maps a file written by writeSections. Returns (header, sections), where each
+section is a memoryview over the mapped file, or None if the file is missing,
+starts with another magic or was written with another byte order
+'''
+
+
+def readSections(path, magic):
+    if not os.path.isfile(path):
+        return None
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            return None
+        headerLength = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(headerLength).decode("utf-8"))
+        if header["byteorder"] != sys.byteorder:
+            return None
+        start = len(magic) + 8 + headerLength
+        if os.fstat(f.fileno()).st_size == start:
+            buf = memoryview(b"")
+        else:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    sections = {}
+    for name, typecode, offset, nbytes in header["sections"]:
+        sections[name] = buf[start + offset:start + offset + nbytes].cast(typecode)
+    return header, sections
+
+
+'''
+A StringTable is a read-only, sorted or unsorted list of strings stored as a
+single utf-8 blob plus an offset table. Indexing returns bytes; it is a
+sequence, so bisect works on it directly
+'''
+
+
+class StringTable:
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    @staticmethod
+    def fromStrings(strings):
+        offsets = array.array("q", [0])
+        parts = []
+        for s in strings:
+            b = s.encode("utf-8")
+            parts.append(b)
+            offsets.append(offsets[-1] + len(b))
+        return StringTable(offsets, array.array("B", b"".join(parts)))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def string(self, i):
+        return self[i].decode("utf-8")
+
+    def strings(self):
+        return [self.string(i) for i in range(len(self))]
+
+
+'''
+A CompiledGrammar holds a PCFG as flat arrays over interned integer symbol
+ids, the form the vectorized engines work on. It can be written to a single
+binary file and loaded back through mmap, so loading costs only the header and
+the (small) nonterminal table; the rule arrays and the lexicon stay on disk
+and are shared by every process that maps the same file.
+'''
+
+
+class CompiledGrammar:
+    def __init__(self, sha1, sections, unnormalized=None):
+        self.sha1 = sha1
+        # the parents whose rules did not sum to 1 in the text grammar, with
+        # their sums (see PCFG.checkSums); kept in the header of the cache file
+        self.unnormalized = {} if unnormalized is None else unnormalized
+        for name, _ in SECTIONS:
+            setattr(self, name, sections[name])
+        self.symbols = StringTable(self.symbolOffsets, self.symbolBlob).strings()
+        self.symbolIds = dict((s, i) for i, s in enumerate(self.symbols))
+        # sorted, so lookups are a binary search over the mapped blob
+        self.words = StringTable(self.wordOffsets, self.wordBlob)
+
+    '''
+    Returns the compiled grammar for a text grammar file, loading it from
+    the cache file next to it when that was compiled from the same contents,
+    and otherwise calling compile(sha1) (which must return the compiled
+    grammar, see GrammarBuilder) and writing the cache. variant names the
+    way the rules were read when that changes them (as renormalization does)
+    '''
+
+    @staticmethod
+    def forFile(grammarFile, compile, variant=None):
+        sha1 = fileHash(grammarFile)
+        if variant:
+            # the same file read differently (e.g. renormalized) compiles to
+            # a different grammar
+            sha1 = hashlib.sha1((sha1 + "+" + variant).encode("utf-8")).hexdigest()
+        path = cachePath(grammarFile, variant)
+        grammar = CompiledGrammar.load(path, sha1)
+        if grammar is not None:
+            return grammar, True
+
+        grammar = compile(sha1)
+        try:
+            grammar.save(path)
+        except (IOError, OSError):
+            pass  # read-only directory: still usable, just not cached
+        return grammar, False
+
+    def save(self, path):
+        writeSections(path, MAGIC, {"version": FORMAT_VERSION, "sha1": self.sha1, "unnormalized": self.unnormalized},
+                      [(name, typecode, getattr(self, name)) for name, typecode in SECTIONS])
+
+    '''
+    Maps a compiled grammar file. Returns None if it is missing, in another
+    format, or was compiled from a different grammar (sha1 mismatch)
+    '''
+
+    @staticmethod
+    def load(path, sha1=None):
+        loaded = readSections(path, MAGIC)
+        if loaded is None:
+            return None
+        header, sections = loaded
+        if header["version"] != FORMAT_VERSION:
+            return None
+        if sha1 is not None and header["sha1"] != sha1:
+            return None
+        return CompiledGrammar(header["sha1"], sections, header["unnormalized"])
+
+    def wordId(self, word):
+        key = word.encode("utf-8")
+        i = bisect.bisect_left(self.words, key)
+        if i < len(self.words) and self.words[i] == key:
+            return i
+        return None
+
+    '''
+    Returns the (parent id, log prob) pairs of the lexical rules for a word
+    '''
+
+    def lexicon(self, word):
+        w = self.wordId(word)
+        if w is None:
+            return []
+        return [(self.lexParent[r], self.lexProb[r]) for r in range(self.lexStart[w], self.lexStart[w + 1])]
+
+    def hasParent(self, label):
+        if label not in self.symbolIds:
+            return False
+        a = self.symbolIds[label]
+        return a in self.binParent or a in self.unParent or a in self.lexParent
+
+    '''
+    Rebuilds the PCFG.ckyRules dictionary (used by the reference CKY), with
+    the ranks of the binary rules
+    '''
+
+    def ckyRules(self):
+        from hw3_pcfg import Rule
+
+        ckyRules = {}
+
+        def add(prob, parent, children, rank=0):
+            rule = Rule.createRule(prob, parent, children, rank)
+            ckyRules.setdefault(rule.children(), set()).add(rule)
+
+        order = sorted(range(len(self.binRank)), key=self.binRank.__getitem__)
+        for r in order:
+            add(self.binProb[r], self.symbols[self.binParent[r]],
+                [self.symbols[self.binLeft[r]], self.symbols[self.binRight[r]]], self.binRank[r])
+        for r in range(len(self.unParent)):
+            add(self.unProb[r], self.symbols[self.unParent[r]], [self.symbols[self.unChild[r]]])
+        for w in range(len(self.words)):
+            word = self.words.string(w)
+            for r in range(self.lexStart[w], self.lexStart[w + 1]):
+                add(self.lexProb[r], self.symbols[self.lexParent[r]], [word])
+        return ckyRules
+
+    '''
+    Returns the unary rules between nonterminals as (parent, child, log prob)
+    '''
+
+    def unaryRules(self):
+        return [(self.symbols[self.unParent[r]], self.symbols[self.unChild[r]], self.unProb[r])
+                for r in range(len(self.unParent))]
+
+
+'''
+A GrammarBuilder compiles rules into the arrays of a CompiledGrammar as they
+are read, so loading a text grammar holds those arrays and the strings of its
+labels and words, never a Rule object per line. A unary rule is lexical
+unless its child is the parent of some rule, which is only known once every
+rule has been read, so unary rules keep their child as a string id until
+build(). Labels get their symbol ids in the order they are first read
+'''
+
+
+class GrammarBuilder:
+    def __init__(self):
+        # every label and word read -> its string id, and back
+        self.stringIds = {}
+        self.strings = []
+        # per string id, the first time (in strings read) it was read as a
+        # label (a parent or a binary child) and as the child of a unary rule
+        self.firstLabel = array.array("q")
+        self.firstUnary = array.array("q")
+        self.read = 0
+        self.parents = set()
+        self.binParent, self.binLeft, self.binRight = array.array("i"), array.array("i"), array.array("i")
+        self.binProb, self.binRank = array.array("d"), array.array("i")
+        self.unParent, self.unChild, self.unProb = array.array("i"), array.array("i"), array.array("d")
+
+    def stringId(self, string, first):
+        i = self.stringIds.get(string)
+        if i is None:
+            i = self.stringIds[string] = len(self.strings)
+            self.strings.append(string)
+            self.firstLabel.append(-1)
+            self.firstUnary.append(-1)
+        if first[i] < 0:
+            first[i] = self.read
+        self.read += 1
+        return i
+
+    '''
+    Adds the rule parent -> children (one or two of them) with a log prob;
+    rank is the line of the text grammar it was read from
+    '''
+
+    def add(self, prob, parent, children, rank=0):
+        a = self.stringId(parent, self.firstLabel)
+        self.parents.add(a)
+        if len(children) == 2:
+            self.binParent.append(a)
+            self.binLeft.append(self.stringId(children[0], self.firstLabel))
+            self.binRight.append(self.stringId(children[1], self.firstLabel))
+            self.binProb.append(prob)
+            self.binRank.append(rank)
+        else:
+            self.unParent.append(a)
+            self.unChild.append(self.stringId(children[0], self.firstUnary))
+            self.unProb.append(prob)
+
+    # When a label was first read as one, counting the unary rules between
+    # labels
+    def firstRead(self, i):
+        if i in self.parents and 0 <= self.firstUnary[i] < self.firstLabel[i]:
+            return self.firstUnary[i]
+        return self.firstLabel[i]
+
+    '''
+    Returns the CompiledGrammar of the rules added. unnormalized maps the
+    parents whose rules do not sum to 1 to their sums; with renormalize,
+    their rules are divided by those sums
+    '''
+
+    def build(self, sha1=None, unnormalized=None, renormalize=False):
+        labels = [i for i in range(len(self.strings)) if self.firstLabel[i] >= 0]
+        labels.sort(key=self.firstRead)
+        symbolIds = dict((i, a) for a, i in enumerate(labels))
+        shift = {}
+        if renormalize and unnormalized:
+            shift = dict((self.stringIds[parent], math.log(total)) for parent, total in unnormalized.items())
+
+        # binary rules by parent, in rank (read) order within a parent: a
+        # counting sort, so no key is held per rule
+        starts = array.array("i", [0]) * (len(labels) + 1)
+        for parent in self.binParent:
+            starts[symbolIds[parent] + 1] += 1
+        for a in range(len(labels)):
+            starts[a + 1] += starts[a]
+        order = array.array("i", [0]) * len(self.binParent)
+        for r, parent in enumerate(self.binParent):
+            a = symbolIds[parent]
+            order[starts[a]] = r
+            starts[a] += 1
+        sections = {
+            "binParent": array.array("i", (symbolIds[self.binParent[r]] for r in order)),
+            "binLeft": array.array("i", (symbolIds[self.binLeft[r]] for r in order)),
+            "binRight": array.array("i", (symbolIds[self.binRight[r]] for r in order)),
+            "binProb": array.array("d", (self.binProb[r] - shift.get(self.binParent[r], 0.0) for r in order)),
+            "binRank": array.array("i", (self.binRank[r] for r in order)),
+            "unParent": array.array("i"), "unChild": array.array("i"), "unProb": array.array("d"),
+            "lexStart": array.array("i", [0]), "lexParent": array.array("i"), "lexProb": array.array("d"),
+        }
+        lexicon = {}
+        for r in range(len(self.unParent)):
+            parent, child = self.unParent[r], self.unChild[r]
+            prob = self.unProb[r] - shift.get(parent, 0.0)
+            if child in self.parents:
+                sections["unParent"].append(symbolIds[parent])
+                sections["unChild"].append(symbolIds[child])
+                sections["unProb"].append(prob)
+            else:
+                lexicon.setdefault(child, []).append((symbolIds[parent], prob))
+
+        words = sorted((self.strings[w] for w in lexicon), key=lambda w: w.encode("utf-8"))
+        for word in words:
+            for parent, prob in lexicon[self.stringIds[word]]:
+                sections["lexParent"].append(parent)
+                sections["lexProb"].append(prob)
+            sections["lexStart"].append(len(sections["lexParent"]))
+
+        symbolTable = StringTable.fromStrings(self.strings[i] for i in labels)
+        wordTable = StringTable.fromStrings(words)
+        sections.update(symbolOffsets=symbolTable.offsets, symbolBlob=symbolTable.blob,
+                        wordOffsets=wordTable.offsets, wordBlob=wordTable.blob)
+        return CompiledGrammar(sha1, sections, unnormalized)
+
+
+'''
+Returns the word-shape signature classes of a word, most specific first:
+UNK followed by the features it has out of CAP (capitalized), NUM (has a
+digit), HYPH (has a hyphen) and S (ends in -s), then the same with features
+dropped from the right, down to plain UNK. "Dogs" gives UNK-CAP-S, UNK-CAP,
+UNK
+'''
+
+
+def wordSignatures(word):
+    features = []
+    if word[:1].isupper():
+        features.append("CAP")
+    if any(c.isdigit() for c in word):
+        features.append("NUM")
+    if "-" in word:
+        features.append("HYPH")
+    if len(word) > 1 and word.endswith("s"):
+        features.append("S")
+    return ["-".join(["UNK"] + features[:n]) for n in range(len(features), -1, -1)]
+
+
+'''
+A Lexicon keeps the lexical rules of a grammar apart from the others: for
+every word, the preterminals that can produce it and their log probs, as
+(labels, log probs). It looks words up in the mapped word table of a
+compiled grammar as they come, and keeps the ones it has seen in a dict.
+
+With signatures, a word without rules falls back to the first of its
+signature classes (see wordSignatures) that has rules; a grammar gives them
+rules as if they were words, e.g. "0.1 NNS -> UNK-S"
+'''
+
+
+class Lexicon:
+    def __init__(self, grammar, signatures=False):
+        self.entries = {}
+        self.grammar = grammar
+        self.signatures = signatures
+
+    # Returns (labels, log probs) for a word, or None if it has no rules
+    def lookup(self, word):
+        entry = self.entries.get(word)
+        if entry is None:
+            rules = self.grammar.lexicon(word)
+            if rules:
+                entry = (tuple(self.grammar.symbols[a] for a, _ in rules), tuple(prob for _, prob in rules))
+                self.entries[word] = entry
+        return entry
+
+    '''
+    Maps every word of a sentence to the word to look up: itself, or with
+    signatures one of its signature classes. Returns (tokens, unknown), where
+    unknown lists the positions of the words that have no rules either way.
+    One dict lookup per word, so a hopeless sentence is caught in O(n)
+    '''
+
+    def tokens(self, sentence):
+        tokens = []
+        unknown = []
+        for i, word in enumerate(sentence):
+            token = word
+            if self.lookup(word) is None:
+                token = None
+                if self.signatures:
+                    for signature in wordSignatures(word):
+                        if self.lookup(signature) is not None:
+                            token = signature
+                            break
+                if token is None:
+                    unknown.append(i)
+                    token = word
+            tokens.append(token)
+        return tokens, unknown
+
+
+'''
+Raised when the unary rules between nonterminals form a cycle
+(A -> B -> ... -> A), which the unary closure cannot sum over; cycle is
+the labels around it, the first repeated at the end
+'''
+
+
+class UnaryCycleError(ValueError):
+    def __init__(self, cycle, path=None):
+        self.cycle = cycle
+        self.path = path
+        ValueError.__init__(self, "%sthe unary rules form a cycle, %s; the unary closure needs them to be acyclic"
+                            % ("%s: " % path if path else "", " -> ".join(cycle)))
+
+
+'''
+A UnaryClosure is the best-path closure of the unary rules between
+nonterminals. For every A and B linked by a chain A -> ... -> B of one or
+more unary rules it stores the log prob of the best chain, the labels along
+that chain (the first in label order among equally good ones) and the number
+of distinct chains. The unary rules must be acyclic (UnaryCycleError
+otherwise), so all of this comes from dynamic programs over the labels in
+topological order, polynomial in the number of rules, however many chains
+there are.
+
+entries is sorted by (parent, child); an entry's index there is its rank,
+which both CKY engines use to break ties between chains. rules keeps the
+unary rules as (parent, child, log prob), duplicates included, edges the
+same by parent as sorted (child, log prob) lists, and order
+the labels that have unary rules, every parent before its children.
+'''
+
+
+class UnaryClosure:
+    def __init__(self, unaryRules, path=None):
+        self.rules = [(parent, child, prob) for parent, child, prob in unaryRules]
+        edges = {}
+        incoming = {}
+        self.ruleProbs = {}
+        for parent, child, prob in self.rules:
+            edges.setdefault(parent, []).append((child, prob))
+            incoming.setdefault(child, []).append((parent, prob))
+            self.ruleProbs[(parent, child)] = max(prob, self.ruleProbs.get((parent, child), prob))
+        for parent in edges:
+            edges[parent].sort()
+        self.edges = edges
+        self.order = self.topologicalOrder(edges, path)
+
+        self.entries = []
+        for start in sorted(edges):
+            # best[X] = [log prob, chain, count] of the chains start -> ... -> X,
+            # built in topological order: every chain to X ends with a rule
+            # Y -> X from a label Y that comes before X
+            best = {start: [0.0, (start,), 1]}
+            for label in self.order[self.order.index(start) + 1:]:
+                for parent, ruleProb in incoming.get(label, ()):
+                    if parent not in best:
+                        continue
+                    prob, chain, count = best[parent]
+                    prob, chain = prob + ruleProb, chain + (label,)
+                    if label not in best:
+                        best[label] = [prob, chain, count]
+                        continue
+                    entry = best[label]
+                    if entry[0] < prob or (entry[0] == prob and chain < entry[1]):
+                        entry[0:2] = [prob, chain]
+                    entry[2] += count
+            del best[start]
+            for child in sorted(best):
+                prob, chain, count = best[child]
+                self.entries.append((start, child, prob, count, chain))
+
+        # child -> [(parent, log prob, count, chain, rank)]
+        self.byChild = {}
+        # (parent, child) -> rank
+        self.ranks = {}
+        for rank, (parent, child, prob, count, chain) in enumerate(self.entries):
+            self.ranks[(parent, child)] = rank
+            self.byChild.setdefault(child, []).append((parent, prob, count, chain, rank))
+
+    '''
+    Returns the labels of the unary rules (parents and children) with every
+    parent before its children, or raises UnaryCycleError
+    '''
+
+    @staticmethod
+    def topologicalOrder(edges, path=None):
+        labels = set(edges)
+        for children in edges.values():
+            labels.update(child for child, prob in children)
+        parents = dict((label, 0) for label in labels)
+        for children in edges.values():
+            for child, prob in children:
+                parents[child] += 1
+        ready = sorted((label for label in labels if parents[label] == 0), reverse=True)
+        order = []
+        while ready:
+            label = ready.pop()
+            order.append(label)
+            for child, prob in edges.get(label, ()):
+                parents[child] -= 1
+                if parents[child] == 0:
+                    ready.append(child)
+        if len(order) == len(labels):
+            return order
+        # every label left still has a parent left, so walking up from one
+        # of them must come back to a label already seen
+        left = set(labels) - set(order)
+        parentsLeft = {}
+        for parent in left:
+            for child, prob in edges.get(parent, ()):
+                if child in left:
+                    parentsLeft.setdefault(child, []).append(parent)
+        label = min(left)
+        seen = []
+        while label not in seen:
+            seen.append(label)
+            label = min(parentsLeft[label])
+        cycle = seen[seen.index(label):] + [label]
+        raise UnaryCycleError(tuple(reversed(cycle)), path)
+
+    '''
+    The semiring sum over the chains from parent to child of the semiring
+    product of their rule weights, for every pair linked by a chain:
+    returns {(parent, child): value}. weight(log prob) is a rule's value.
+    This is the chain-sum matrix (I - U)^-1 of the unary rule matrix U, less
+    its identity, computed in topological order (U is acyclic)
+    '''
+
+    def chainSums(self, zero, plus, times, weight):
+        incoming = {}
+        for parent, child, prob in self.rules:
+            incoming.setdefault(child, []).append((parent, weight(prob)))
+        position = dict((label, i) for i, label in enumerate(self.order))
+        sums = {}
+        for start in sorted(self.edges):
+            # value of the chains start -> ... -> label; the empty chain is
+            # only the way in
+            values = {}
+            for label in self.order[position[start] + 1:]:
+                for parent, value in incoming.get(label, ()):
+                    if parent == start:
+                        through = value
+                    elif parent in values:
+                        through = times(values[parent], value)
+                    else:
+                        continue
+                    values[label] = plus(values[label], through) if label in values else through
+            for label, value in values.items():
+                sums[(start, label)] = value
+        return sums
+
+    '''
+    Yields every chain from a label as (log prob, chain), in label order
+    (depth first). There can be exponentially many: only the packed forest
+    and k-best search, which list derivations one by one, ask for them
+    '''
+
+    def chainsFrom(self, start):
+        stack = [(start, 0.0, (start,))]
+        while stack:
+            label, prob, chain = stack.pop()
+            # reversed, so children are visited in sorted order
+            for child, ruleProb in reversed(self.edges.get(label, ())):
+                stack.append((child, prob + ruleProb, chain + (child,)))
+            if label != start:
+                yield prob, chain
+
+    def __len__(self):
+        return len(self.entries)
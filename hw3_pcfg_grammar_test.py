@@ -0,0 +1,78 @@
+import contextlib
+import io
+import math
+import os
+import random
+import sys
+import tracemalloc
+import hw3_pcfg
+from hw3_pcfg_grammar import cachePath
+from hw3_pcfg_testing import runTests, scratchDirectory, writeGrammar
+
+'''
+Tests of grammar loading (PCFG.readGrammar): rules are compiled as they are
+read, without a Rule object per line, and the report of the parents whose
+rules do not sum to 1 survives the compiled grammar cache
+'''
+
+UNNORMALIZED_GRAMMAR = """1.0 TOP -> S
+0.5 S -> NP VP
+0.3 S -> VP
+1.0 NP -> dogs
+0.5 VP -> bark
+0.5 VP -> run
+"""
+
+# The most memory loading a grammar may take per line; a Rule object per
+# line took about 500 bytes
+LOAD_LIMIT = 200
+
+
+def testUnnormalizedCached():
+    with scratchDirectory() as directory:
+        path = writeGrammar(directory, "unnormalized.pcfg", UNNORMALIZED_GRAMMAR)
+        for renormalize in (False, True):
+            for hit in (False, True):
+                assert os.path.isfile(cachePath(path, 'renormalized' if renormalize else None)) == hit
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    pcfg = hw3_pcfg.PCFG(path, debug=True, cache=True, renormalize=renormalize)
+                assert set(pcfg.unnormalized) == {'S'} and abs(pcfg.unnormalized['S'] - 0.8) < 1e-9
+                # the warning is for grammars that are not renormalized
+                assert ("do not sum to 1" in output.getvalue()) != renormalize, (renormalize, hit)
+                tree = pcfg.CKY("dogs bark".split())
+                expected = math.log(0.5 / 0.8 if renormalize else 0.5) + math.log(0.5)
+                assert abs(tree.prob - expected) < 1e-9, (renormalize, hit)
+
+
+def testNoRulesBuilt():
+    with scratchDirectory() as directory:
+        path = writeGrammar(directory, "unnormalized.pcfg", UNNORMALIZED_GRAMMAR)
+        for cache in (False, True, True):
+            pcfg = hw3_pcfg.PCFG(path, cache=cache)
+            assert pcfg.CKY("dogs bark".split()) is not None
+            assert pcfg._ckyRules is None, cache
+            # they can still be rebuilt from the compiled grammar
+            assert sum(len(rules) for rules in pcfg.ckyRules.values()) == 6
+
+
+def testLoadMemory():
+    r = random.Random(0)
+    labels = ['X%d' % a for a in range(40)]
+    lines = ["1.0 TOP -> X0"]
+    for label in labels:
+        lines.extend("0.001 %s -> %s %s" % (label, r.choice(labels), r.choice(labels)) for _ in range(500))
+        lines.append("1.0 %s -> w" % label)
+    with scratchDirectory() as directory:
+        path = writeGrammar(directory, "large.pcfg", "\n".join(lines) + "\n")
+        tracemalloc.start()
+        try:
+            hw3_pcfg.PCFG(path)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    assert peak < LOAD_LIMIT * len(lines), "%d bytes per line" % (peak // len(lines))
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
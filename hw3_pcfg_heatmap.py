@@ -0,0 +1,196 @@
+import argparse
+import csv
+import html
+import sys
+import hw3_pcfg
+
+'''
+Span heatmaps: where in a sentence CKY spends its work. A parse with
+stats=ParseStats(spans=True) records, for every cell (i, j) of the chart,
+the number of items, the binary rule applications and the seconds it took;
+this tool dumps them to a CSV or NPZ file and renders them as the CKY
+triangle, in text or HTML, so that the spans behind a latency spike (and
+the words under them) stand out:
+
+    python hw3_pcfg_heatmap.py dump toygrammar.pcfg spans.csv the man eats the sushi with the chopsticks
+    python hw3_pcfg_heatmap.py render spans.csv --field applications
+    python hw3_pcfg_heatmap.py render spans.csv --html spans.html
+
+The CSV has one row per cell (i, j, items, applications, seconds) after a
+"# words:" comment line holding the sentence; NPZ (needs numpy) holds the
+same columns as arrays, and the words
+'''
+
+FIELDS = ('items', 'applications', 'seconds')
+
+# shades of the text heatmap, from empty to the hottest cell
+SHADES = " .:-=+*#%@"
+
+
+'''
+Parses a sentence with span recording on and returns (words, spans), spans
+as the (i, j, items, applications, seconds) tuples of ParseStats.spans
+'''
+
+
+def profileSentence(pcfg, words, engine=None, beam=None, threshold=None, max_span=None):
+    stats = hw3_pcfg.ParseStats(spans=True)
+    pcfg.CKY(words, engine=engine, beam=beam, threshold=threshold, stats=stats, max_span=max_span)
+    return list(words), sorted(stats.spans)
+
+
+def writeSpans(path, words, spans):
+    if path.endswith(".npz"):
+        import numpy as np
+        columns = list(zip(*spans)) or [()] * 5
+        np.savez_compressed(path, words=np.array(words, dtype=str),
+                            i=np.array(columns[0], dtype=np.int32), j=np.array(columns[1], dtype=np.int32),
+                            items=np.array(columns[2], dtype=np.int64),
+                            applications=np.array(columns[3], dtype=np.int64),
+                            seconds=np.array(columns[4], dtype=np.float64))
+        return
+    with open(path, "w", newline="") as file:
+        file.write("# words: %s\n" % " ".join(words))
+        writer = csv.writer(file)
+        writer.writerow(("i", "j") + FIELDS)
+        for i, j, items, applications, seconds in spans:
+            writer.writerow((i, j, items, applications, "%.9f" % seconds))
+
+
+# Reads a file of writeSpans back as (words, spans)
+def readSpans(path):
+    if path.endswith(".npz"):
+        import numpy as np
+        with np.load(path) as data:
+            return ([str(word) for word in data["words"]],
+                    list(zip(data["i"].tolist(), data["j"].tolist(), data["items"].tolist(),
+                             data["applications"].tolist(), data["seconds"].tolist())))
+    spans = []
+    with open(path, "r", newline="") as file:
+        first = file.readline()
+        if not first.startswith("# words:"):
+            raise ValueError("%s: not a span file (no '# words:' line)" % path)
+        words = first[len("# words:"):].split()
+        for row in csv.DictReader(file):
+            spans.append((int(row["i"]), int(row["j"]), int(row["items"]), int(row["applications"]),
+                          float(row["seconds"])))
+    return words, spans
+
+
+# (i, j) -> the value of a field for every cell of spans
+def spanValues(spans, field):
+    column = 2 + FIELDS.index(field)
+    return dict(((span[0], span[1]), span[column]) for span in spans)
+
+
+'''
+The top `count` cells by a field, hottest first, as (value, i, j, text of
+the span)
+'''
+
+
+def hotspots(words, spans, field, count=5):
+    values = spanValues(spans, field)
+    ranked = sorted(values.items(), key=lambda item: (-item[1], item[0]))[:count]
+    return [(value, i, j, " ".join(words[i:j])) for (i, j), value in ranked if value > 0]
+
+
+def formatValue(value, field):
+    return "%.0f" % (value * 1e6) if field == 'seconds' else "%d" % value
+
+
+'''
+The CKY triangle as text: row i (the first word of the span) and column j
+(the end of the span) hold the cell (i, j) as a shade of SHADES scaled to
+the hottest cell, followed by the hottest spans and their values
+(microseconds for seconds)
+'''
+
+
+def renderText(words, spans, field='items', count=5):
+    values = spanValues(spans, field)
+    top = max(values.values()) if values else 0
+    width = max([len(word) for word in words] + [1])
+    lines = ["%s by span ('%s' = %s)" % (field, SHADES[-1], formatValue(top, field))]
+    lines.append(" " * (width + 4) + "".join("%3d" % j for j in range(1, len(words) + 1)))
+    for i, word in enumerate(words):
+        row = []
+        for j in range(1, len(words) + 1):
+            if j <= i or (i, j) not in values:
+                row.append("   ")
+            else:
+                shade = int(round(values[(i, j)] / top * (len(SHADES) - 1))) if top > 0 else 0
+                row.append("  " + SHADES[shade])
+        lines.append("%3d %s%s" % (i, word.ljust(width), "".join(row)))
+    for value, i, j, text in hotspots(words, spans, field, count):
+        lines.append("%10s  (%d, %d)  %s" % (formatValue(value, field), i, j, text))
+    return "\n".join(lines) + "\n"
+
+
+# The CKY triangle as an HTML table, shaded by a field; every cell's title
+# has all the fields and the words of its span
+def renderHTML(words, spans, field='items'):
+    values = spanValues(spans, field)
+    cells = dict(((span[0], span[1]), span) for span in spans)
+    top = max(values.values()) if values else 0
+    out = ["<!DOCTYPE html>", "<html><head><meta charset=\"utf-8\"><title>%s by span</title>" % field,
+           "<style>table{border-collapse:collapse;font:12px monospace}"
+           "td,th{border:1px solid #ddd;padding:3px 6px;text-align:right}</style></head><body>",
+           "<p>%s by span: %s</p>" % (field, html.escape(" ".join(words))), "<table>",
+           "<tr><th></th>%s</tr>" % "".join("<th>%s</th>" % html.escape(word) for word in words)]
+    for i, word in enumerate(words):
+        row = ["<tr><th>%s</th>" % html.escape(word)]
+        for j in range(1, len(words) + 1):
+            if (i, j) not in cells:
+                row.append("<td></td>")
+                continue
+            _, _, items, applications, seconds = cells[(i, j)]
+            heat = values[(i, j)] / top if top > 0 else 0.0
+            title = "(%d, %d) %s: %d items, %d applications, %.1f us" % (
+                i, j, " ".join(words[i:j]), items, applications, seconds * 1e6)
+            row.append("<td title=\"%s\" style=\"background:rgba(220,40,20,%.3f)\">%s</td>"
+                       % (html.escape(title), heat, formatValue(values[(i, j)], field)))
+        out.append("".join(row) + "</tr>")
+    out.append("</table></body></html>")
+    return "\n".join(out) + "\n"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dump and render per-span chart work")
+    commands = parser.add_subparsers(dest="command")
+    dump = commands.add_parser("dump", help="parse a sentence and write its span file")
+    dump.add_argument("grammar", help="grammar file (.pcfg)")
+    dump.add_argument("output", help="span file to write (.csv, or .npz with numpy)")
+    dump.add_argument("words", nargs="+", help="the sentence")
+    dump.add_argument("--engine", default="python", choices=["python", "scan", "numpy"])
+    dump.add_argument("--beam", type=int, default=None)
+    dump.add_argument("--threshold", type=float, default=None)
+    dump.add_argument("--max-span", type=int, default=None)
+    render = commands.add_parser("render", help="render a span file as a triangular heatmap")
+    render.add_argument("spans", help="span file (.csv or .npz)")
+    render.add_argument("--field", default="items", choices=FIELDS)
+    render.add_argument("--html", default=None, metavar="FILE", help="write an HTML heatmap instead of text")
+    render.add_argument("--top", type=int, default=5, help="number of hottest spans listed")
+    args = parser.parse_args(argv)
+
+    if args.command == "dump":
+        pcfg = hw3_pcfg.PCFG(args.grammar, engine=args.engine)
+        words, spans = profileSentence(pcfg, args.words, beam=args.beam, threshold=args.threshold,
+                                       max_span=args.max_span)
+        writeSpans(args.output, words, spans)
+        sys.stdout.write(renderText(words, spans))
+    elif args.command == "render":
+        words, spans = readSpans(args.spans)
+        if args.html is not None:
+            with open(args.html, "w") as file:
+                file.write(renderHTML(words, spans, args.field))
+        else:
+            sys.stdout.write(renderText(words, spans, args.field, args.top))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+from hw3_pcfg import EMPTY_CELL, TOP, Chart
+
+'''
+An IncrementalChart is a Chart that grows by one word (one column) at a
+time. Its cells are kept column by column, as columns[j][i] for the span
+(i, j), since the row-major layout of Chart depends on the sentence length.
+n and S always describe the words pushed so far
+'''
+
+
+class IncrementalChart(Chart):
+    __slots__ = ('columns',)
+
+    def __init__(self, labelIds=None):
+        Chart.__init__(self, [], labelIds, [])
+        self.columns = [[]]
+
+    def addWord(self, word, token):
+        self.words.append(word)
+        self.tokens.append(token)
+        self.n += 1
+        self.S = (0, self.n)
+        self.columns.append([None] * self.n)
+
+    def getCell(self, i, j):
+        cell = self.columns[j][i]
+        return EMPTY_CELL if cell is None else cell
+
+    def setCell(self, i, j, cell):
+        if cell.items:
+            self.columns[j][i] = cell
+
+
+'''
+An IncrementalParser parses a sentence as its words come in, for clients
+that want analyses before the sentence is over (dialogue, streaming speech
+recognition). Each push(word) fills one more column of the chart, the cells
+(i, j) ending at the new word, exactly as PCFG.fillChart would; the cells of
+earlier columns never change, so the trees handed out stay valid as the
+sentence grows.
+
+With beam or threshold, the cells of the prefix spans (0, j) are never
+pruned, so that every prefix keeps its TOP items. A cell that full CKY
+would prune can then keep more items here, and the final parse can be at
+least as good as CKY's. Without pruning the parses are the same as CKY's.
+'''
+
+
+class IncrementalParser:
+    def __init__(self, pcfg, scan=False, beam=None, threshold=None, max_span=None):
+        self.pcfg = pcfg
+        self.scan = scan
+        self.beam = beam
+        self.threshold = threshold
+        self.max_span = max_span
+        self.chart = IncrementalChart(pcfg.ruleIndex()[0])
+        # positions of the words without lexical rules; no span over one of
+        # them can be built
+        self.unknown = []
+        self.applications = 0
+
+    def __len__(self):
+        return self.chart.n
+
+    '''
+    Adds a word and fills the cells of the spans that end with it. Returns
+    the Viterbi parse of the sentence so far, as tree() does
+    '''
+
+    def push(self, word):
+        chart = self.chart
+        tokens, unknown = self.pcfg.lexicon.tokens([word])
+        if unknown:
+            self.unknown.append(chart.n)
+        chart.addWord(word, tokens[0])
+        self.applications += self.pcfg.fillColumn(chart, chart.n, self.scan, self.beam, self.threshold,
+                                                  self.max_span)
+        return self.tree()
+
+    # Pushes every word of a list; returns the parse after the last one
+    def extend(self, words):
+        tree = self.tree()
+        for word in words:
+            tree = self.push(word)
+        return tree
+
+    # The Viterbi parse (a TOP item) of the words pushed so far, or None
+    def tree(self):
+        return self.pcfg.buildTree(self.chart)
+
+    '''
+    The best analysis of the span (i, j), 0 <= i < j <= len(self): the item
+    of the given label or, with label None, the most probable item of the
+    cell (ties going to the lowest label). None if the span has none
+    '''
+
+    def best(self, i, j, label=None):
+        cell = self.chart.getCell(i, j)
+        if label is None:
+            if not cell.items:
+                return None
+            label = min(cell.getItems(), key=lambda item: (-item.prob, item.label)).label
+        return self.pcfg.spanTree(self.chart, i, j, label)
+
+    '''
+    The best analyses of the prefixes of the words so far: for every
+    j = 1 .. len(self), the TOP item over (0, j) if the prefix has a parse,
+    and otherwise the best item of the cell, or None
+    '''
+
+    def prefixes(self):
+        out = []
+        for j in range(1, self.chart.n + 1):
+            tree = self.best(0, j, TOP)
+            out.append(tree if tree is not None else self.best(0, j))
+        return out
@@ -0,0 +1,25 @@
+import sys
+from hw3_pcfg_testing import randomCases, runTests
+
+'''
+Tests of incremental parsing (hw3_pcfg_incremental.py): after every word,
+the parser must return the tree CKY returns for the prefix so far
+'''
+
+
+def testIncremental():
+    for path, pcfg, sentences in randomCases(seeds=2, maxLength=6):
+        for sentence in sentences:
+            parser = pcfg.incremental()
+            for j, word in enumerate(sentence):
+                tree = parser.push(word)
+                reference = pcfg.CKY(sentence[:j + 1])
+                assert (tree is None) == (reference is None), (path, sentence, j)
+                if tree is not None:
+                    assert tree.toString() == reference.toString(), (path, sentence, j)
+                    assert tree.prob == reference.prob and tree.numParses == reference.numParses
+            assert len(parser.prefixes()) == len(sentence)
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
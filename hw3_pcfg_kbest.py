@@ -0,0 +1,187 @@
+import heapq
+from hw3_pcfg import TOP, LazyItem, LeafItem, materialize
+
+'''
+A KBestNode holds the k-best search state of one chart node: a base item
+(built by a binary or lexical rule) or a closed item (the top of a cell's
+unary closure). edges are its incoming hyperedges (see
+PCFG.incomingEdges), found its derivations in score order as
+(score, order, child ranks, edge), and heap the candidates for the next one
+'''
+
+
+class KBestNode:
+    __slots__ = ('edges', 'heap', 'seen', 'found', 'expanded', 'done')
+
+    def __init__(self):
+        self.edges = None
+        self.heap = None
+        self.seen = set()
+        self.found = []
+        # whether the successors of found[-1] are in the heap yet
+        self.expanded = True
+        self.done = False
+
+
+'''
+KBest enumerates the derivations of a filled chart (see PCFG.fillChart) best
+first, with the lazy algorithm of Huang and Chiang (2005): a node only works
+out its (r + 1)-th derivation when a parent asks for it, from its incoming
+edges and the r-th derivations its children have already found. The first
+derivation of every node scores what the chart says, so the one-best parse
+costs nothing past the chart, and each later one only a few heap operations
+per node it changes.
+
+Derivations are the ones numParses counts, and ties are ranked as CKY ranks
+them (split point, then rule rank; the base item, then the closure entry), so
+the first tree is the Viterbi tree of PCFG.CKY.
+'''
+
+
+class KBest:
+    def __init__(self, pcfg, chart):
+        self.pcfg = pcfg
+        self.chart = chart
+        # (i, j, label, closed) -> KBestNode
+        self.nodes = {}
+
+    '''
+    Returns up to k TOP items in score order; as with PCFG.CKY the tree
+    below each is only built when its children are first asked for
+    '''
+
+    def trees(self, k):
+        chart = self.chart
+        if chart.n == 0 or chart.getRoot().getItem(TOP) is None:
+            return []
+        root = (0, chart.n, TOP, True)
+        self.ensure(root, k)
+        return [self.tree(root, r) for r in range(min(k, len(self.nodes[root].found)))]
+
+    def tree(self, key, r):
+        score = self.nodes[key].found[r][0]
+        numParses = self.chart.getRoot().getItem(TOP).numParses
+        return LazyItem(TOP, score, numParses,
+                        lambda: materialize(('node', key, r), self.expand).children)
+
+    # Viterbi log prob of a node according to the chart
+    def chartScore(self, key):
+        i, j, label, closed = key
+        cell = self.chart.getCell(i, j)
+        return cell.getItem(label).prob if closed else cell.getBaseItem(label).prob
+
+    # log prob of the r-th derivation of a node (the chart's for r = 0)
+    def score(self, key, r):
+        node = self.nodes.get(key)
+        if node is None or len(node.found) <= r:
+            return self.chartScore(key)
+        return node.found[r][0]
+
+    def derivationScore(self, edge, ranks):
+        kind, children, weight, order = edge
+        if kind == 'lexical':
+            return weight
+        if kind == 'binary':
+            return weight + self.score(children[0], ranks[0]) + self.score(children[1], ranks[1])
+        if kind == 'chain':
+            return weight + self.score(children[0], ranks[0])
+        return self.score(children[0], ranks[0])
+
+    '''
+    Makes the node find its best `count` derivations (all of them if it has
+    fewer). Works through an explicit stack instead of recursing on the
+    children, so deep trees do not hit the recursion limit
+    '''
+
+    def ensure(self, key, count):
+        stack = [(key, count)]
+        while stack:
+            key, count = stack[-1]
+            node = self.nodes.get(key)
+            if node is None:
+                node = self.nodes[key] = KBestNode()
+            if len(node.found) >= count or node.done:
+                stack.pop()
+                continue
+            if node.edges is None:
+                node.edges = self.pcfg.incomingEdges(self.chart, key)
+                node.heap = []
+                for e, edge in enumerate(node.edges):
+                    ranks = (0,) * len(edge[1])
+                    node.seen.add((e, ranks))
+                    node.heap.append((-self.derivationScore(edge[:4], ranks), edge[3], ranks, e))
+                heapq.heapify(node.heap)
+            if not node.expanded:
+                # the successors of the last derivation need the next
+                # derivation of one of its children
+                score, order, ranks, e = node.found[-1]
+                children = node.edges[e][1]
+                missing = [(child, r + 2) for child, r in zip(children, ranks)
+                           if not self.has(child, r + 2)]
+                if missing:
+                    stack.extend(missing)
+                    continue
+                for p, child in enumerate(children):
+                    successor = ranks[:p] + (ranks[p] + 1,) + ranks[p + 1:]
+                    if (e, successor) in node.seen or len(self.nodes[child].found) <= successor[p]:
+                        continue
+                    node.seen.add((e, successor))
+                    edge = node.edges[e]
+                    heapq.heappush(node.heap, (-self.derivationScore(edge[:4], successor), edge[3], successor, e))
+                node.expanded = True
+            if not node.heap:
+                node.done = True
+                continue
+            score, order, ranks, e = heapq.heappop(node.heap)
+            node.found.append((-score, order, ranks, e))
+            node.expanded = False
+
+    # whether a node has found `count` derivations or has no more to find
+    def has(self, key, count):
+        node = self.nodes.get(key)
+        return node is not None and (len(node.found) >= count or node.done)
+
+    '''
+    One step of materialize() over the found derivations: a node is
+    ('node', key, r) for the r-th derivation of a chart node, or
+    ('chain', i, j, chain, key, r) for the label chain[0] inside a unary chain
+    (..., chain[0], ..., chain[-1]) on top of the r-th derivation of the base
+    item key
+    '''
+
+    def expand(self, node):
+        chart = self.chart
+        if node[0] == 'chain':
+            _, i, j, chain, key, r = node
+            prob = self.score(key, r)
+            for parent, child in reversed(list(zip(chain[:-1], chain[1:]))):
+                prob = self.pcfg.closure.ruleProbs[(parent, child)] + prob
+            child = ('node', key, r) if len(chain) == 2 else ('chain', i, j, chain[1:], key, r)
+            return chain[0], prob, self.parses(i, j, chain[0]), (child,)
+
+        _, key, r = node
+        self.ensure(key, r + 1)
+        score, order, ranks, e = self.nodes[key].found[r]
+        edge = self.nodes[key].edges[e]
+        while edge[0] == 'identity':
+            # a closed item that is its own base item is a single tree node
+            key, r = edge[1][0], ranks[0]
+            self.ensure(key, r + 1)
+            score, order, ranks, e = self.nodes[key].found[r]
+            edge = self.nodes[key].edges[e]
+        i, j, label, closed = key
+        kind, children = edge[0], edge[1]
+        if kind == 'lexical':
+            children = (LeafItem(chart.words[i]),)
+        elif kind == 'binary':
+            children = (('node', children[0], ranks[0]), ('node', children[1], ranks[1]))
+        else:
+            chain = edge[4]
+            children = (('node', children[0], ranks[0]) if len(chain) == 2 else
+                        ('chain', i, j, chain[1:], children[0], ranks[0]),)
+        return label, score, self.parses(i, j, label), children
+
+    # numParses of a label's final item in a cell (0 if it was pruned)
+    def parses(self, i, j, label):
+        item = self.chart.getCell(i, j).getItem(label)
+        return 0 if item is None else item.numParses
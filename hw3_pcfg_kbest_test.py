@@ -0,0 +1,42 @@
+import sys
+from hw3_pcfg_testing import allParses, close, randomCases, runTests
+
+'''
+Tests of k-best parsing (hw3_pcfg_kbest.py): the k best trees must be the k
+most probable parses a brute-force enumeration finds, best first and each
+once, with CKY's Viterbi tree first, and a list as long as the number of
+parses must hold every parse
+'''
+
+# k-best lists are checked in full up to this many parses, and their first
+# KBEST_LIMIT trees past that
+KBEST_LIMIT = 300
+
+
+def testKBest():
+    complete = 0
+    for path, pcfg, sentences in randomCases(maxLength=4):
+        for sentence in sentences:
+            parses = sorted(allParses(path, sentence), key=lambda parse: -parse[0])
+            trees = pcfg.kbest(sentence, min(len(parses) + 1, KBEST_LIMIT))
+            probs = dict((string, prob) for prob, string in parses)
+            if len(parses) < KBEST_LIMIT:
+                # complete: every parse exactly once
+                complete += 1
+                assert sorted(tree.toString() for tree in trees) == sorted(probs), (path, sentence)
+            # ordered: the most probable parses, best first, and the first is
+            # CKY's Viterbi tree
+            assert len(trees) == min(len(parses), KBEST_LIMIT), (path, sentence)
+            for tree, (prob, _) in zip(trees, parses):
+                assert close(tree.prob, probs[tree.toString()]) and close(tree.prob, prob), (path, sentence)
+            assert len(set(tree.toString() for tree in trees)) == len(trees), (path, sentence)
+            if trees:
+                assert trees[0].toString() == pcfg.CKY(sentence).toString(), (path, sentence)
+            # a shorter list is a prefix of the longer one
+            top = pcfg.kbest(sentence, 3)
+            assert [tree.toString() for tree in top] == [tree.toString() for tree in trees[:3]], (path, sentence)
+    assert complete > 0
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
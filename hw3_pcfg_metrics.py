@@ -0,0 +1,126 @@
+import atexit
+import collections
+import os
+import time
+
+'''
+Process-wide parse metrics. Once enableMetrics() is called, every PCFG.CKY
+call is instrumented (see ParseStats) and its stats recorded here; the
+aggregator keeps the last `window` observations of every metric and turns
+them into percentiles, written as a text metrics file in the Prometheus
+exposition format, which a scraper can read:
+
+    pcfg_parses_total 1200
+    pcfg_seconds{quantile="0.5"} 0.00041
+    pcfg_phase_seconds{phase="binary",quantile="0.99"} 0.0122
+
+Until then the only cost of this module to CKY is one function call
+'''
+
+# the quantiles written for every metric
+QUANTILES = (0.5, 0.9, 0.99, 1.0)
+
+# ParseStats counters recorded for every parse
+COUNTERS = ('cells', 'pairs', 'applications', 'added', 'replaced', 'maxCell', 'pruned', 'popped', 'pushed')
+
+_aggregator = None
+
+
+def aggregator():
+    return _aggregator
+
+
+'''
+Turns metrics on for this process. With a path, the metrics file is
+rewritten every `every` parses and when the process exits. Returns the
+MetricsAggregator
+'''
+
+
+def enableMetrics(path=None, window=10000, every=100):
+    global _aggregator
+    _aggregator = MetricsAggregator(path, window, every)
+    if path is not None:
+        atexit.register(_aggregator.flush)
+    return _aggregator
+
+
+def disableMetrics():
+    global _aggregator
+    if _aggregator is not None and _aggregator.path is not None:
+        atexit.unregister(_aggregator.flush)
+        _aggregator.flush()
+    _aggregator = None
+
+
+'''
+A MetricsAggregator rolls up the ParseStats of many parses: series maps
+(metric name, labels) to its latest observations, and totals counts parses,
+failures and cache hits since the start
+'''
+
+
+class MetricsAggregator:
+    def __init__(self, path=None, window=10000, every=100):
+        self.path = path
+        self.window = window
+        self.every = every
+        self.series = {}
+        self.totals = collections.Counter()
+        self.started = time.time()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key not in self.series:
+            self.series[key] = collections.deque(maxlen=self.window)
+        self.series[key].append(value)
+
+    def record(self, stats):
+        self.totals['parses'] += 1
+        if stats.unknown:
+            self.totals['unknown_word_failures'] += 1
+        if stats.cached:
+            self.totals['cache_hits'] += 1
+        if stats.glue:
+            self.totals['glued'] += 1
+        self.observe('seconds', stats.seconds)
+        for phase, seconds in stats.phases.items():
+            if phase != 'tree':  # observed when the tree is built
+                self.observe('phase_seconds', seconds, phase=phase)
+        for name in COUNTERS:
+            self.observe(name, getattr(stats, name))
+        if self.path is not None and self.every and self.totals['parses'] % self.every == 0:
+            self.flush()
+
+    '''
+    Returns {(name, labels): {quantile: value}} over the observations in the
+    window, with the nearest-rank quantiles of QUANTILES
+    '''
+
+    def percentiles(self):
+        out = {}
+        for key, values in self.series.items():
+            ordered = sorted(values)
+            if ordered:
+                out[key] = dict((q, ordered[min(len(ordered) - 1, int(q * len(ordered)))]) for q in QUANTILES)
+        return out
+
+    def render(self):
+        lines = ["pcfg_%s_total %d" % (name, count) for name, count in sorted(self.totals.items())]
+        lines.append("pcfg_uptime_seconds %.3f" % (time.time() - self.started))
+        for (name, labels), quantiles in sorted(self.percentiles().items()):
+            for q, value in sorted(quantiles.items()):
+                tags = ",".join('%s="%s"' % item for item in labels + (("quantile", "%g" % q),))
+                lines.append("pcfg_%s{%s} %g" % (name, tags, value))
+        return "\n".join(lines) + "\n"
+
+    # Writes the metrics file (through a temporary file, so a scraper never
+    # reads half of it)
+    def flush(self, path=None):
+        path = path or self.path
+        if path is None:
+            return
+        temporary = "%s.%d.tmp" % (path, os.getpid())
+        with open(temporary, "w") as file:
+            file.write(self.render())
+        os.replace(temporary, path)
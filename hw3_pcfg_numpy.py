@@ -0,0 +1,623 @@
+import operator
+import time
+import numpy as np
+
+from hw3_pcfg import TOP, LazyItem, LeafItem, glue, materialize
+
+# Counts stay in int64 while a bound on them stays below this; the span
+# lengths where it does not are counted with exact Python integers (object
+# arrays), and the chart only switches to those when a count is actually
+# past int64
+INT_COUNT_LIMIT = float(2 ** 62)
+
+
+'''
+Returns log(sum(exp(values))) over each group of columns starting at
+`starts`; group[c] is the group of column c. Groups with no finite value
+come out as -inf
+'''
+
+
+def groupedLogSumExp(values, starts, group):
+    peak = np.maximum.reduceat(values, starts, axis=1)
+    shift = np.where(peak == -np.inf, 0.0, peak)
+    total = np.add.reduceat(np.exp(values - shift[:, group]), starts, axis=1)
+    with np.errstate(divide='ignore'):
+        return np.log(total) + shift
+
+
+'''
+A NumpyChart holds, for every span (i, j) and nonterminal id a, the Viterbi
+log prob (score), the log prob before the unary closure (base), the parse
+count, and the backpointers: split point and binary rule index, and the
+closure entry of the best unary chain (-1 for none)
+'''
+
+
+class NumpyChart:
+    def __init__(self, n, N):
+        self.n = n
+        self.score = np.full((n + 1, n + 1, N), -np.inf)
+        self.base = self.score
+        # int64 until a count outgrows it (see storeCounts())
+        self.count = np.zeros((n + 1, n + 1, N), dtype=np.int64)
+        # the largest count of every cell, as a float: what the counts of
+        # the cells built from it are bounded by
+        self.countMax = np.zeros((n + 1, n + 1))
+        self.split = np.zeros((n + 1, n + 1, N), dtype=np.int32)
+        self.back = np.zeros((n + 1, n + 1, N), dtype=np.int32)
+        self.unary = np.full((n + 1, n + 1, N), -1, dtype=np.int32)
+        # number of items dropped by beam/threshold pruning
+        self.pruned = 0
+
+    # Whether counts bounded by `bound` need exact Python integers
+    def exact(self, bound):
+        return self.count.dtype == object or (bound.size > 0 and bound.max() >= INT_COUNT_LIMIT)
+
+    '''
+    Stores the counts of the items of labels over the cells (rows, cols),
+    switching the chart to Python integers if one does not fit in int64
+    '''
+
+    def storeCounts(self, rows, cols, labels, counts):
+        if counts.dtype == object and self.count.dtype != object:
+            if counts.size and counts.max() >= 2 ** 63:
+                self.count = self.count.astype(object)
+            else:
+                counts = counts.astype(np.int64)
+        self.count[rows, cols, labels] = counts
+        # countMax is only read while the counts are int64; the unary pass
+        # stores only some labels of a cell, so it can only raise the max
+        if self.count.dtype != object and counts.size:
+            cells = rows[:, 0], cols[:, 0]
+            self.countMax[cells] = np.maximum(self.countMax[cells], counts.max(axis=1))
+
+
+'''
+An InsideOutsideChart holds the result of NumpyCKY.insideOutside for one
+sentence. For every span (i, j) and nonterminal id a:
+  inside / outside          log inside and outside probs of the item at the
+                            top of the span's unary closure
+  base / outsideBase        the same for the item the binary (or lexical)
+                            rules built, before the closure
+  labelPosteriors           P(a labels some node over (i, j) | sentence),
+                            counting every node of a unary chain
+and spanPosteriors[i, j] = P((i, j) is a constituent | sentence). logZ is the
+log of the total probability of the sentence (-inf if it has no parse).
+The expected number of uses of every rule in a parse of the sentence is in
+binaryCounts (by compiled binary rule), unaryCounts (by (parent, child)) and
+lexicalCounts (by (parent, word)); ruleCounts() merges them
+'''
+
+
+class InsideOutsideChart:
+    def __init__(self, n, N):
+        self.n = n
+        self.logZ = -np.inf
+        self.base = np.full((n + 1, n + 1, N), -np.inf)
+        self.inside = np.full((n + 1, n + 1, N), -np.inf)
+        self.outsideBase = np.full((n + 1, n + 1, N), -np.inf)
+        self.outside = np.full((n + 1, n + 1, N), -np.inf)
+        self.labelPosteriors = np.zeros((n + 1, n + 1, N))
+        self.spanPosteriors = np.zeros((n + 1, n + 1))
+        self.binaryCounts = None
+        self.unaryCounts = {}
+        self.lexicalCounts = {}
+        self.symbols = None
+        self.binaryRules = None
+
+    def posterior(self, i, j, label):
+        if label not in self.symbols:
+            return 0.0
+        return float(self.labelPosteriors[i, j, self.symbols.index(label)])
+
+    '''
+    Returns the expected count of every rule with a nonzero count, keyed
+    like PCFG.ckyRules: (parent, children tuple) -> count
+    '''
+
+    def ruleCounts(self):
+        counts = {}
+        if self.binaryCounts is not None:
+            for (parent, left, right), count in zip(self.binaryRules, self.binaryCounts):
+                if count > 0:
+                    key = (parent, (left, right))
+                    counts[key] = counts.get(key, 0.0) + float(count)
+        for (parent, child), count in self.unaryCounts.items():
+            counts[(parent, (child,))] = count
+        for (parent, word), count in self.lexicalCounts.items():
+            counts[(parent, (word,))] = counts.get((parent, (word,)), 0.0) + count
+        return counts
+
+
+'''
+A NumpyCKY is the vectorized counterpart of PCFG.CKY. Nonterminals are
+interned as integer ids, and every span of the chart stores a dense vector of
+Viterbi log probabilities (and parse counts) over those ids. The binary-rule
+max is done for all spans of one length and one split offset at a time, as
+array operations over the whole rule table.
+
+Ties are broken the same way as the reference CKY (lowest split point first,
+then the order of the rules in the grammar file, then the rank of the unary
+chain), so both engines return the same trees, probabilities and numParses.
+'''
+
+
+class NumpyCKY:
+    def __init__(self, pcfg):
+        grammar = pcfg.compiledGrammar()
+        self.grammar = grammar
+        self.symbols = grammar.symbols
+        self.symbolIds = grammar.symbolIds
+
+        # The compiled binary rules are already grouped by parent (file order
+        # inside a group), so np.maximum.reduceat can take the max for every
+        # parent at once. np.frombuffer does not copy: with a cached grammar
+        # these arrays are the mapped file itself
+        self.ruleParent = np.frombuffer(grammar.binParent, dtype=np.int32)
+        self.ruleLeft = np.frombuffer(grammar.binLeft, dtype=np.int32)
+        self.ruleRight = np.frombuffer(grammar.binRight, dtype=np.int32)
+        self.ruleProb = np.frombuffer(grammar.binProb, dtype=np.float64)
+        self.ruleIndex = np.arange(len(self.ruleParent), dtype=np.int32)
+        self.groupStart, self.ruleGroup = self.groups(self.ruleParent)
+        self.groupParent = self.ruleParent[self.groupStart]
+        # the most rules of one parent: a cell's counts are at most this times
+        # the sum over splits of the largest counts of the two children
+        self.groupSize = float(np.diff(np.r_[self.groupStart, len(self.ruleParent)]).max()) \
+            if len(self.groupStart) else 0.0
+
+        # The unary closure (see PCFG.applyUnaries), grouped by parent id;
+        # closureRank is the entry's index in pcfg.closure.entries
+        self.closure = pcfg.closure
+        entries = sorted(range(len(pcfg.closure.entries)),
+                         key=lambda e: self.symbolIds[pcfg.closure.entries[e][0]])
+        self.closureRank = np.array(entries, dtype=np.int32)
+        self.closureParent = np.array([self.symbolIds[pcfg.closure.entries[e][0]] for e in entries], dtype=np.int64)
+        self.closureChild = np.array([self.symbolIds[pcfg.closure.entries[e][1]] for e in entries], dtype=np.int64)
+        self.closureProb = np.array([pcfg.closure.entries[e][2] for e in entries], dtype=np.float64)
+        # the number of chains of every entry, exact, and as int64 when they
+        # all fit (None otherwise); a closed count is at most closureFactor
+        # times the largest count of its cell before the closure
+        counts = [pcfg.closure.entries[e][3] for e in entries]
+        self.closureCount = np.array(counts, dtype=object)
+        self.closureCountInt = np.array(counts, dtype=np.int64) if max(counts or [0]) < INT_COUNT_LIMIT else None
+        self.closureStart, self.closureGroup = self.groups(self.closureParent)
+        self.closureGroupParent = self.closureParent[self.closureStart]
+        chainsByParent = {}
+        for parent, child, prob, count, chain in pcfg.closure.entries:
+            chainsByParent[parent] = chainsByParent.get(parent, 0) + count
+        self.closureFactor = 1.0 + float(max(chainsByParent.values() or [0]))
+
+        # tables of the inside-outside pass, built when it is first run
+        self.chainTables = None
+
+        # position of every symbol in label order, for ranking pruning ties
+        self.labelRank = np.empty(len(self.symbols), dtype=np.int64)
+        self.labelRank[sorted(range(len(self.symbols)), key=self.symbols.__getitem__)] = np.arange(len(self.symbols))
+
+    '''
+    Returns the start of each run of equal ids, and the run number of every
+    position, for a sorted id array
+    '''
+
+    @staticmethod
+    def groups(ids):
+        if not len(ids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        newGroup = np.r_[True, ids[1:] != ids[:-1]]
+        return np.flatnonzero(newGroup), np.cumsum(newGroup) - 1
+
+    '''
+    Same contract as PCFG.CKY: returns the TOP InternalItem of the Viterbi
+    parse (with prob and numParses set on every node), or None
+    '''
+
+    def CKY(self, sentence):
+        return self.parse(sentence)[1]
+
+    '''
+    Fills the chart (pruning as PCFG.fillChart does) and returns it together
+    with the tree. tokens are the words to look up in the lexicon and
+    max_span the widest span to fill, as for PCFG.fillChart; with max_span
+    the tree is glued (see glueTree()) when there is no parse, and returned
+    as (number of pieces, TOP item). With stats, the phase timers and the
+    counters that apply to a vectorized pass are filled in: cells, rule
+    applications (every rule at every split of every cell, as computed),
+    items added and the largest cell
+    '''
+
+    def parse(self, sentence, beam=None, threshold=None, tokens=None, max_span=None, stats=None):
+        tokens = sentence if tokens is None else tokens
+        n = len(sentence)
+        chart = NumpyChart(n, len(self.symbols))
+        if len(self.closureStart):
+            chart.base = chart.score.copy()
+        prune = beam is not None or threshold is not None
+        if stats is not None:
+            mark = time.perf_counter()
+
+        # Fill leaves on diagonals
+        for j, token in enumerate(tokens):
+            for a, prob in self.grammar.lexicon(token):
+                chart.score[j, j + 1, a] = prob
+                chart.count[j, j + 1, a] = 1
+                chart.countMax[j, j + 1] = 1.0
+        if stats is not None:
+            lengthMark = mark
+            mark = stats.lap('lexical', mark)
+        self.applyUnaries(chart, np.arange(0, n), np.arange(1, n + 1))
+        if stats is not None:
+            mark = stats.lap('unary', mark)
+            sizes = self.countSpans(chart, np.arange(0, n), 1, stats)
+        if prune and n > 1:
+            self.pruneSpans(chart, np.arange(0, n), np.arange(1, n + 1), beam, threshold)
+            if stats is not None:
+                mark = stats.lap('prune', mark)
+        if stats is not None and stats.spans is not None:
+            self.addSpans(stats, np.arange(0, n), 1, sizes, 0, mark - lengthMark)
+
+        for length in range(2, (n if max_span is None else min(n, max_span)) + 1):
+            starts = np.arange(0, n - length + 1)
+            if stats is not None:
+                lengthMark = mark
+            if len(self.groupStart):
+                self.fillSpans(chart, starts, length)
+            if stats is not None:
+                mark = stats.lap('binary', mark)
+                stats.applications += len(starts) * (length - 1) * len(self.ruleParent)
+            self.applyUnaries(chart, starts, starts + length)
+            if stats is not None:
+                mark = stats.lap('unary', mark)
+                sizes = self.countSpans(chart, starts, length, stats)
+            if prune and length < n:
+                self.pruneSpans(chart, starts, starts + length, beam, threshold)
+                if stats is not None:
+                    mark = stats.lap('prune', mark)
+            if stats is not None and stats.spans is not None:
+                self.addSpans(stats, starts, length, sizes, (length - 1) * len(self.ruleParent), mark - lengthMark)
+
+        tree = self.buildTree(sentence, chart)
+        if tree is None and max_span is not None:
+            tree = self.glueTree(sentence, chart, max_span)
+        return chart, tree
+
+    # ParseStats counters for the cells (starts[x], starts[x] + length),
+    # before pruning; returns the number of items of each cell
+    def countSpans(self, chart, starts, length, stats):
+        sizes = (chart.score[starts, starts + length] > -np.inf).sum(axis=1)
+        stats.cells += len(starts)
+        stats.added += int(sizes.sum())
+        if len(sizes):
+            stats.maxCell = max(stats.maxCell, int(sizes.max()))
+        return sizes
+
+    # ParseStats.spans entries for the cells of one span length. The cells
+    # of a length are filled together, so each gets an equal share of the
+    # time they took
+    def addSpans(self, stats, starts, length, sizes, applications, seconds):
+        share = seconds / len(starts) if len(starts) else 0.0
+        for i, size in zip(starts.tolist(), sizes.tolist()):
+            stats.spans.append((i, i + length, size, applications, share))
+
+    '''
+    Beam/threshold pruning of the cells (starts[x], ends[x]), with the same
+    ranking as PCFG.pruneCell: log prob, then label
+    '''
+
+    def pruneSpans(self, chart, starts, ends, beam, threshold):
+        score = chart.score[starts, ends]
+        live = score > -np.inf
+        keep = live.copy()
+        if threshold is not None:
+            keep &= score >= score.max(axis=1, keepdims=True) - threshold
+        if beam is not None:
+            order = np.lexsort((np.broadcast_to(self.labelRank, score.shape), -score), axis=1)
+            position = np.empty_like(order)
+            np.put_along_axis(position, order, np.arange(score.shape[1])[None, :].repeat(len(starts), 0), axis=1)
+            keep &= position < beam
+        chart.pruned += int((live & ~keep).sum())
+        chart.score[starts, ends] = np.where(keep, score, -np.inf)
+        chart.count[starts, ends] = np.where(keep, chart.count[starts, ends], 0)
+
+    '''
+    Fills every cell (i, i + length) of the chart, batched over i and over
+    the binary rules, one split offset at a time
+    '''
+
+    def fillSpans(self, chart, starts, length):
+        score = chart.score
+        ends = starts + length
+        G = len(self.groupStart)
+        bestScore = np.full((len(starts), G), -np.inf)
+        bestSplit = np.zeros((len(starts), G), dtype=np.int32)
+        bestRule = np.zeros((len(starts), G), dtype=np.int32)
+        bound = self.groupSize * sum(chart.countMax[starts, starts + offset] * chart.countMax[starts + offset, ends]
+                                     for offset in range(1, length))
+        dtype = object if chart.exact(bound) else np.int64
+        total = np.zeros((len(starts), G), dtype=dtype)
+
+        for offset in range(1, length):
+            mids = starts + offset
+            left = score[starts, mids]
+            right = score[mids, ends]
+
+            # same association as the reference: P(A -> B C) + t_B + t_C
+            cand = (self.ruleProb + left[:, self.ruleLeft]) + right[:, self.ruleRight]
+            groupMax = np.maximum.reduceat(cand, self.groupStart, axis=1)
+
+            # first rule (in file order) that reaches the max for its parent
+            hit = cand == groupMax[:, self.ruleGroup]
+            firstHit = np.minimum.reduceat(np.where(hit, self.ruleIndex, len(self.ruleIndex)),
+                                           self.groupStart, axis=1)
+
+            better = groupMax > bestScore
+            bestScore = np.where(better, groupMax, bestScore)
+            bestSplit = np.where(better, mids[:, None], bestSplit)
+            bestRule = np.where(better, firstHit, bestRule)
+
+            leftCount = chart.count[starts, mids].astype(dtype, copy=False)
+            rightCount = chart.count[mids, ends].astype(dtype, copy=False)
+            total += np.add.reduceat(leftCount[:, self.ruleLeft] * rightCount[:, self.ruleRight],
+                                     self.groupStart, axis=1)
+
+        rows = starts[:, None]
+        cols = ends[:, None]
+        labels = self.groupParent[None, :]
+        score[rows, cols, labels] = bestScore
+        chart.storeCounts(rows, cols, labels, total)
+        chart.split[rows, cols, labels] = bestSplit
+        chart.back[rows, cols, labels] = bestRule
+
+    '''
+    Applies the unary closure to the cells (starts[x], ends[x]) in a single
+    pass: a parent keeps its own score unless a chain is strictly better, and
+    among equal chains the lowest rank wins
+    '''
+
+    def applyUnaries(self, chart, starts, ends):
+        if not len(self.closureStart) or not len(starts):
+            return
+        base = chart.score[starts, ends]
+        baseCount = chart.count[starts, ends]
+        chart.base[starts, ends] = base
+
+        cand = self.closureProb + base[:, self.closureChild]
+        groupMax = np.maximum.reduceat(cand, self.closureStart, axis=1)
+        hit = (cand == groupMax[:, self.closureGroup]) & (cand > -np.inf)
+        firstRank = np.minimum.reduceat(np.where(hit, self.closureRank, len(self.closureRank)),
+                                        self.closureStart, axis=1)
+
+        own = base[:, self.closureGroupParent]
+        better = groupMax > own
+        if self.closureCountInt is None or chart.exact(self.closureFactor * chart.countMax[starts, ends]):
+            baseCount, chainCount = baseCount.astype(object), self.closureCount
+        else:
+            chainCount = self.closureCountInt
+        chains = np.add.reduceat(chainCount * baseCount[:, self.closureChild], self.closureStart, axis=1)
+
+        rows = starts[:, None]
+        cols = ends[:, None]
+        labels = self.closureGroupParent[None, :]
+        chart.score[rows, cols, labels] = np.where(better, groupMax, own)
+        chart.unary[rows, cols, labels] = np.where(better, firstRank, -1)
+        chart.storeCounts(rows, cols, labels, baseCount[:, self.closureGroupParent] + chains)
+
+    '''
+    Returns the TOP item of the Viterbi parse, or None; as in PCFG.buildTree
+    the tree below it is only built when its children are first asked for
+    '''
+
+    def buildTree(self, sentence, chart):
+        if TOP not in self.symbolIds or chart.score[0, chart.n, self.symbolIds[TOP]] == -np.inf:
+            return None
+        top = self.symbolIds[TOP]
+        root = (0, chart.n, top, True)
+        return LazyItem(TOP, float(chart.score[0, chart.n, top]), int(chart.count[0, chart.n, top]),
+                        lambda: materialize(root, lambda node: self.expand(sentence, chart, node)).children)
+
+    '''
+    PCFG.glueTree over this engine's chart: the piece over a span is its
+    most probable label other than TOP, ties going to the lowest label
+    '''
+
+    def glueTree(self, sentence, chart, maxSpan):
+        top = self.symbolIds.get(TOP)
+
+        def best(i, j):
+            score = chart.score[i, j].copy()
+            if top is not None:
+                score[top] = -np.inf
+            if score.max() == -np.inf:
+                return None
+            candidates = np.flatnonzero(score == score.max())
+            a = int(candidates[np.argmin(self.labelRank[candidates])])
+            return float(score[a]), (i, j, a, True)
+
+        return glue(chart.n, maxSpan, best, lambda node: self.expand(sentence, chart, node))
+
+    '''
+    One step of materialize() over the chart: a node is (i, j, a, unary) for
+    the item of label id a (after the unary closure if unary is set, before it
+    otherwise), or (i, j, chain, b) for the label chain[0] inside a unary
+    chain (..., chain[0], ..., chain[-1]) on top of the base item of b
+    '''
+
+    def expand(self, sentence, chart, node):
+        i, j = node[0], node[1]
+        if isinstance(node[2], tuple):
+            # same node probabilities as PCFG.expand
+            chain, b = node[2], node[3]
+            prob = float(chart.base[i, j, b])
+            for parent, child in reversed(list(zip(chain[:-1], chain[1:]))):
+                prob = self.closure.ruleProbs[(parent, child)] + prob
+            child = (i, j, b, False) if len(chain) == 2 else (i, j, chain[1:], b)
+            return chain[0], prob, int(chart.count[i, j, self.symbolIds[chain[0]]]), (child,)
+
+        a, unary = node[2], node[3]
+        entry = chart.unary[i, j, a] if unary else -1
+        if entry >= 0:
+            chain = self.closure.entries[entry][4]
+            b = self.symbolIds[chain[-1]]
+            children = ((i, j, b, False) if len(chain) == 2 else (i, j, chain[1:], b),)
+            prob = chart.score[i, j, a]
+        elif j - i == 1:
+            children = (LeafItem(sentence[i]),)
+            prob = chart.base[i, j, a]
+        else:
+            k = int(chart.split[i, j, a])
+            r = chart.back[i, j, a]
+            children = ((i, k, self.ruleLeft[r], True), (k, j, self.ruleRight[r], True))
+            prob = chart.base[i, j, a]
+        return self.symbols[a], float(prob), int(chart.count[i, j, a]), children
+
+    '''
+    Builds the tables of the inside-outside pass. The unary chains are summed
+    by (top, bottom) pair: prob is the log of the sum over the chains from
+    top to bottom, the entries of the chain-sum matrix (I - U)^-1 of the
+    unary rule matrix U (see UnaryClosure.chainSums), with the empty chain
+    (a, a) of every symbol. The unary rules themselves, duplicates summed,
+    are kept for their expected counts
+    '''
+
+    def buildChainTables(self):
+        sums = self.closure.chainSums(-np.inf, np.logaddexp, operator.add, lambda logProb: logProb)
+        pairs = [((s, s), 0.0) for s in self.symbols] + sorted(sums.items())
+        top = np.array([self.symbolIds[a] for (a, b), _ in pairs], dtype=np.int64)
+        bottom = np.array([self.symbolIds[b] for (a, b), _ in pairs], dtype=np.int64)
+        prob = np.array([p for _, p in pairs], dtype=np.float64)
+        rules = {}
+        for parent, child, logProb in self.closure.rules:
+            rules[(parent, child)] = np.logaddexp(rules.get((parent, child), -np.inf), logProb)
+        unaryPairs = sorted(rules)
+
+        # every symbol has its empty pair, so both groupings cover all ids
+        byTop = np.argsort(top, kind='stable')
+        byBottom = np.argsort(bottom, kind='stable')
+        self.chainTables = {
+            "top": top, "bottom": bottom, "prob": prob, "pairs": unaryPairs,
+            "unaryParent": np.array([self.symbolIds[a] for a, b in unaryPairs], dtype=np.int64),
+            "unaryChild": np.array([self.symbolIds[b] for a, b in unaryPairs], dtype=np.int64),
+            "unaryProb": np.array([rules[pair] for pair in unaryPairs], dtype=np.float64),
+            "byTop": byTop, "topGroups": self.groups(top[byTop]),
+            "byBottom": byBottom, "bottomGroups": self.groups(bottom[byBottom]),
+        }
+        # the binary rules grouped by left and by right child
+        for side, children in (("left", self.ruleLeft), ("right", self.ruleRight)):
+            order = np.argsort(children, kind='stable')
+            starts, group = self.groups(children[order])
+            self.chainTables[side] = (order, starts, group, children[order][starts])
+
+    '''
+    Runs the inside and outside passes over a sentence in log space (sums
+    are log-sum-exps), batched like parse(): all spans of one length at a
+    time, as array operations over the whole rule table. Sums run over the
+    same derivations CKY counts in numParses. Returns an InsideOutsideChart
+    '''
+
+    def insideOutside(self, sentence, tokens=None):
+        tokens = sentence if tokens is None else tokens
+        if self.chainTables is None:
+            self.buildChainTables()
+        n = len(sentence)
+        chart = InsideOutsideChart(n, len(self.symbols))
+        chart.symbols = self.symbols
+        chart.binaryRules = [(self.symbols[a], self.symbols[b], self.symbols[c])
+                             for a, b, c in zip(self.ruleParent, self.ruleLeft, self.ruleRight)]
+
+        for j, token in enumerate(tokens):
+            for a, prob in self.grammar.lexicon(token):
+                chart.base[j, j + 1, a] = np.logaddexp(chart.base[j, j + 1, a], prob)
+        self.insideClosure(chart, np.arange(0, n), np.arange(1, n + 1))
+        for length in range(2, n + 1):
+            starts = np.arange(0, n - length + 1)
+            if len(self.groupStart):
+                self.insideSpans(chart, starts, length)
+            self.insideClosure(chart, starts, starts + length)
+
+        if n == 0 or TOP not in self.symbolIds:
+            return chart
+        chart.logZ = float(chart.inside[0, n, self.symbolIds[TOP]])
+        if chart.logZ == -np.inf:
+            return chart
+
+        chart.outside[0, n, self.symbolIds[TOP]] = 0.0
+        chart.binaryCounts = np.zeros(len(self.ruleParent))
+        unary = np.zeros(len(self.chainTables["pairs"]))
+        for length in range(n, 0, -1):
+            starts = np.arange(0, n - length + 1)
+            unary += self.outsideClosure(chart, starts, starts + length)
+            if length > 1 and len(self.groupStart):
+                self.outsideSpans(chart, starts, length)
+
+        # lexical rules, from the outside of the leaf items
+        for j, token in enumerate(tokens):
+            for a, prob in self.grammar.lexicon(token):
+                key = (self.symbols[a], token)
+                count = float(np.exp(chart.outsideBase[j, j + 1, a] + prob - chart.logZ))
+                chart.lexicalCounts[key] = chart.lexicalCounts.get(key, 0.0) + count
+        chart.unaryCounts = dict((pair, float(count)) for pair, count in zip(self.chainTables["pairs"], unary)
+                                 if count > 0)
+        return chart
+
+    def insideSpans(self, chart, starts, length):
+        ends = starts + length
+        total = np.full((len(starts), len(self.groupStart)), -np.inf)
+        for offset in range(1, length):
+            mids = starts + offset
+            cand = (self.ruleProb + chart.inside[starts, mids][:, self.ruleLeft]) + \
+                chart.inside[mids, ends][:, self.ruleRight]
+            total = np.logaddexp(total, groupedLogSumExp(cand, self.groupStart, self.ruleGroup))
+        chart.base[starts[:, None], ends[:, None], self.groupParent[None, :]] = total
+
+    # inside of the closed items: sum over the chains down to a base item
+    def insideClosure(self, chart, starts, ends):
+        tables = self.chainTables
+        if not len(starts):
+            return
+        byTop = tables["byTop"]
+        cand = tables["prob"][byTop] + chart.base[starts, ends][:, tables["bottom"][byTop]]
+        chart.inside[starts, ends] = groupedLogSumExp(cand, *tables["topGroups"])
+
+    '''
+    Outside of the base items from the outside of the closed items, and the
+    posteriors of the cells (starts[x], ends[x]). Returns the expected number
+    of uses of every unary rule over those cells. As the chains are acyclic,
+    a label or rule is on a chain at most once, so the chains through it
+    split into the part above it (the outside of its base item) and the part
+    below (the inside of its closed item)
+    '''
+
+    def outsideClosure(self, chart, starts, ends):
+        tables = self.chainTables
+        outside = chart.outside[starts, ends]
+        byBottom = tables["byBottom"]
+        cand = tables["prob"][byBottom] + outside[:, tables["top"][byBottom]]
+        outsideBase = groupedLogSumExp(cand, *tables["bottomGroups"])
+        chart.outsideBase[starts, ends] = outsideBase
+
+        inside = chart.inside[starts, ends]
+        chart.labelPosteriors[starts, ends] = np.exp(outsideBase + inside - chart.logZ)
+        chart.spanPosteriors[starts, ends] = np.exp(outside + inside - chart.logZ).sum(axis=1)
+        uses = np.exp(outsideBase[:, tables["unaryParent"]] + tables["unaryProb"] +
+                      inside[:, tables["unaryChild"]] - chart.logZ)
+        return uses.sum(axis=0)
+
+    '''
+    Passes the outside of the base items of the cells (i, i + length) down
+    to their children, and adds up the expected counts of the binary rules
+    '''
+
+    def outsideSpans(self, chart, starts, length):
+        ends = starts + length
+        parent = self.ruleProb + chart.outsideBase[starts, ends][:, self.ruleParent]
+        for offset in range(1, length):
+            mids = starts + offset
+            left = chart.inside[starts, mids][:, self.ruleLeft]
+            right = chart.inside[mids, ends][:, self.ruleRight]
+            chart.binaryCounts += np.exp(parent + left + right - chart.logZ).sum(axis=0)
+            for side, value, rows, cols in (("left", parent + right, starts, mids),
+                                            ("right", parent + left, mids, ends)):
+                order, groupStart, group, labels = self.chainTables[side]
+                sums = groupedLogSumExp(value[:, order], groupStart, group)
+                cells = (rows[:, None], cols[:, None], labels[None, :])
+                chart.outside[cells] = np.logaddexp(chart.outside[cells], sums)
@@ -0,0 +1,53 @@
+import os
+import sys
+import hw3_pcfg
+from hw3_pcfg_testing import HERE, assertSameTree, goldSentences, randomCases, runTests, scratchDirectory, writeGrammar
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+'''
+Tests of the numpy engine (hw3_pcfg_numpy.py): it must return CKY's trees,
+probs and numParses, ties and unary chains included, and its int64 counts
+must give way to exact integers before they overflow. They need numpy, and
+pass trivially without it
+'''
+
+# A cell of this grammar holds X with a huge count next to Y and S with
+# small ones, so the count bound of a cell must be the max over every label
+WIDE_COUNT_GRAMMAR = """1.0 TOP -> S
+1.0 S -> X Y
+0.5 X -> X X
+0.5 X -> a
+1.0 Y -> b
+"""
+
+
+def testNumpyAgrees():
+    if numpy is None:
+        return
+    toy = hw3_pcfg.PCFG(os.path.join(HERE, 'toygrammar.pcfg'))
+    for path, pcfg, sentences in [(None, toy, goldSentences())] + list(randomCases()):
+        for sentence in sentences:
+            assertSameTree(pcfg.CKY(sentence, engine='numpy'), pcfg.CKY(sentence), path, sentence)
+
+
+def testNumpyLargeCounts():
+    if numpy is None:
+        return
+    with scratchDirectory() as directory:
+        pcfg = hw3_pcfg.PCFG(writeGrammar(directory, "wide.pcfg", WIDE_COUNT_GRAMMAR))
+        # the number of parses of a^n b is the Catalan number C(n - 1),
+        # which passes 2^63 at n = 37
+        for n in (1, 2, 10, 36, 37, 38, 40, 45, 60):
+            sentence = ['a'] * n + ['b']
+            reference = pcfg.CKY(sentence)
+            tree = pcfg.CKY(sentence, engine='numpy')
+            assert tree.numParses == reference.numParses, (n, tree.numParses, reference.numParses)
+        assert pcfg.CKY(['a'] * 40 + ['b']).numParses > 2 ** 63
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
@@ -0,0 +1,97 @@
+import argparse
+import json
+import sys
+import hw3_pcfg
+import hw3_pcfg_metrics
+from hw3_pcfg_batch import parseStream
+
+'''
+Streaming command-line parser: reads one tokenized (whitespace-separated)
+sentence per line from a file or stdin, and writes one JSON record per
+sentence to stdout, flushed as soon as the sentence is parsed:
+
+    {"index": 0, "sentence": "the man eats the sushi", "tree": "( TOP ... )",
+     "logprob": -6.774, "numParses": 1, "glue": 0, "seconds": 0.0004, "error": null}
+
+tree and logprob are null on a parse failure; error is set if the parse
+raised. With --max-span, glue is the number of pieces joined under TOP when
+the sentence had no parse within the limit (numParses is then null).
+With --metrics FILE, the parse statistics (phase times, chart counters) of
+the sentences are rolled up into percentiles in a text metrics file (see
+hw3_pcfg_metrics.py), rewritten every 100 sentences and at the end.
+Example:
+
+    python hw3_pcfg_parse.py toygrammar.pcfg sentences.txt > parses.jsonl
+'''
+
+
+def readSentences(stream):
+    for line in stream:
+        words = line.split()
+        if words:
+            yield words
+
+
+def toRecord(result):
+    tree = result.tree
+    return {
+        "index": result.index,
+        "sentence": " ".join(result.sentence),
+        "tree": tree.toString() if tree is not None else None,
+        "logprob": tree.prob if tree is not None else None,
+        "numParses": tree.numParses if tree is not None else 0,
+        "glue": result.stats.glue if result.stats is not None else 0,
+        "seconds": round(result.seconds, 6),
+        "error": result.error,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse sentences with a PCFG, one JSON record per line")
+    parser.add_argument("grammar", help="grammar file (.pcfg)")
+    parser.add_argument("input", nargs="?", default="-", help="sentence file, one per line (default: stdin)")
+    parser.add_argument("--engine", default="python", choices=["python", "scan", "numpy", "astar"])
+    parser.add_argument("--cache", action="store_true", help="use the compiled grammar cache")
+    parser.add_argument("--signatures", action="store_true",
+                        help="back off from unknown words to word-shape classes (UNK-CAP, UNK-S, ...)")
+    parser.add_argument("--renormalize", action="store_true",
+                        help="scale the rules of every parent so that their probabilities sum to 1")
+    parser.add_argument("--workers", type=int, default=1, help="number of parser processes")
+    parser.add_argument("--beam", type=int, default=None, help="keep the best N items per cell")
+    parser.add_argument("--threshold", type=float, default=None,
+                        help="drop items more than this many nats below the best of their cell")
+    parser.add_argument("--max-span", type=int, default=None,
+                        help="only build constituents of up to N words, gluing the pieces under TOP")
+    parser.add_argument("--result-cache", default=None, metavar="FILE",
+                        help="remember parses in this SQLite file across runs (see hw3_pcfg_cache.py)")
+    parser.add_argument("--metrics", default=None, metavar="FILE",
+                        help="write parse metrics (percentiles of phase times and chart counters) to this file")
+    args = parser.parse_args(argv)
+
+    pcfg = hw3_pcfg.PCFG(args.grammar, engine=args.engine, cache=args.cache,
+                          signatures=args.signatures, renormalize=args.renormalize)
+    if args.result_cache is not None:
+        pcfg.enableResultCache(path=args.result_cache)
+    # the stats come back from the workers with the results, so they are
+    # recorded here rather than by CKY in each worker
+    metrics = hw3_pcfg_metrics.MetricsAggregator(args.metrics) if args.metrics is not None else None
+    stream = sys.stdin if args.input == "-" else open(args.input, "r")
+    try:
+        results = parseStream(pcfg, readSentences(stream), workers=args.workers,
+                              beam=args.beam, threshold=args.threshold, max_span=args.max_span)
+        for result in results:
+            sys.stdout.write(json.dumps(toRecord(result)) + "\n")
+            sys.stdout.flush()
+            if metrics is not None and result.stats is not None:
+                metrics.record(result.stats)
+                if "tree" in result.stats.phases:
+                    metrics.observe("phase_seconds", result.stats.phases["tree"], phase="tree")
+    finally:
+        if metrics is not None:
+            metrics.flush()
+        if stream is not sys.stdin:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
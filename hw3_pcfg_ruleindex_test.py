@@ -0,0 +1,48 @@
+import os
+import sys
+import hw3_pcfg
+from hw3_pcfg_testing import HERE, assertSameTree, goldSentences, randomCases, runTests, scratchDirectory, writeGrammar
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+'''
+Tests of the binary rule lookup: CKY through the left-child rule index
+and the label bitsets must build the same chart as the scan over every
+rule, and rules tied on prob must be ranked by their line in the grammar
+file, in every engine
+'''
+
+# "w w" has two parses of the same prob, S -> X Y and S -> Y X
+TIED_GRAMMAR = """1.0 TOP -> S
+0.5 S -> X Y
+0.5 S -> Y X
+1.0 X -> w
+1.0 Y -> w
+"""
+
+
+def testIndexMatchesScan():
+    toy = hw3_pcfg.PCFG(os.path.join(HERE, 'toygrammar.pcfg'))
+    for path, pcfg, sentences in [(None, toy, goldSentences())] + list(randomCases()):
+        for sentence in sentences:
+            assertSameTree(pcfg.CKY(sentence), pcfg.CKY(sentence, engine='scan'), path, sentence)
+
+
+def testTiesGoToTheFirstLine():
+    engines = ['python', 'scan', 'astar'] + (['numpy'] if numpy is not None else [])
+    lines = TIED_GRAMMAR.splitlines(True)
+    swapped = "".join(lines[:1] + [lines[2], lines[1]] + lines[3:])
+    with scratchDirectory() as directory:
+        for name, text, expected in (("tied.pcfg", TIED_GRAMMAR, "( S ( X w ) ( Y w ) )"),
+                                     ("swapped.pcfg", swapped, "( S ( Y w ) ( X w ) )")):
+            pcfg = hw3_pcfg.PCFG(writeGrammar(directory, name, text))
+            for engine in engines:
+                tree = pcfg.CKY(["w", "w"], engine=engine)
+                assert tree.toString() == "( TOP %s )" % expected, (name, engine, tree.toString())
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
@@ -0,0 +1,252 @@
+import math
+import operator
+from hw3_pcfg import TOP
+
+'''
+Semiring-generic CKY: PCFG.fillChart's (i, k, j) loop run on a semiring,
+computing for every cell and label the semiring sum over all derivations of
+the product of their rule weights. The semiring decides what that means:
+
+    MAX_PLUS      the Viterbi log prob (what CKY returns as prob)
+    COUNT         the exact number of parses (CKY's numParses)
+    LOG_SUM_EXP   the inside log prob; at the root, the sentence's log
+                  likelihood (NumpyCKY.insideOutside's logZ)
+
+A ProductSemiring runs several at once, on tuples, so
+
+    chart = pcfg.semiringParse(sentence)   # all three, by default
+    viterbi, count, inside = chart.total()
+
+gets all three out of one pass instead of three. That default product runs
+on ViterbiCountInsideCKY, which sums a cell's derivations into plain
+accumulators; other semirings and products go through the generic
+SemiringCKY, whose tuple operations cost several times more. Unary chains
+are summed as CKY sums them: the closed value of A over a span is its own
+value there plus the value of every acyclic chain A -> ... -> B times the
+value B had before the closure (see UnaryClosure.chainSums). There is no
+pruning: the sums are over every derivation
+'''
+
+
+def logAddExp(a, b):
+    if a < b:
+        a, b = b, a
+    if b == float('-inf'):
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+
+'''
+A Semiring: zero and one, plus and times, and weight(logProb), the value of
+a rule of log prob logProb (times of weights is the weight of the sum of log
+probs, so a unary chain's weight comes from its summed log prob)
+'''
+
+
+class Semiring:
+    def __init__(self, name, zero, one, plus, times, weight):
+        self.name = name
+        self.zero = zero
+        self.one = one
+        self.plus = plus
+        self.times = times
+        self.weight = weight
+
+    def __repr__(self):
+        return "Semiring(%s)" % self.name
+
+
+MAX_PLUS = Semiring('viterbi', float('-inf'), 0.0, max, operator.add, lambda logProb: logProb)
+COUNT = Semiring('count', 0, 1, operator.add, operator.mul, lambda logProb: 1)
+LOG_SUM_EXP = Semiring('inside', float('-inf'), 0.0, logAddExp, operator.add, lambda logProb: logProb)
+
+
+'''
+The product of semirings: values are tuples with one value per component,
+added and multiplied component by component
+'''
+
+
+class ProductSemiring(Semiring):
+    def __init__(self, *components):
+        pluses = [component.plus for component in components]
+        timeses = [component.times for component in components]
+        weights = [component.weight for component in components]
+        Semiring.__init__(self, "*".join(component.name for component in components),
+                          tuple(component.zero for component in components),
+                          tuple(component.one for component in components),
+                          lambda a, b: tuple(plus(x, y) for plus, x, y in zip(pluses, a, b)),
+                          lambda a, b: tuple(times(x, y) for times, x, y in zip(timeses, a, b)),
+                          lambda logProb: tuple(weight(logProb) for weight in weights))
+        self.components = components
+
+    # name -> value of each component of a product value
+    def split(self, value):
+        return dict((component.name, x) for component, x in zip(self.components, value))
+
+
+# Viterbi log prob, parse count and inside log prob together
+VITERBI_COUNT_INSIDE = ProductSemiring(MAX_PLUS, COUNT, LOG_SUM_EXP)
+
+
+'''
+A SemiringChart holds the values of one pass: cells[i * (n + 1) + j] maps
+each label with a derivation over (i, j) to its (closed) value. It has the
+cell methods of a Chart that PCFG.fillColumn uses, with dicts for cells
+'''
+
+
+class SemiringChart:
+    __slots__ = ('n', 'words', 'tokens', 'semiring', 'cells')
+
+    def __init__(self, sentence, semiring, tokens=None):
+        self.n = len(sentence)
+        self.words = list(sentence)
+        self.tokens = self.words if tokens is None else tokens
+        self.semiring = semiring
+        self.cells = [None] * ((self.n + 1) * (self.n + 1))
+
+    def getCell(self, i, j):
+        return self.cells[i * (self.n + 1) + j] or {}
+
+    def newCell(self):
+        return {}
+
+    def setCell(self, i, j, cell):
+        if cell:
+            self.cells[i * (self.n + 1) + j] = cell
+
+    def value(self, i, j, label):
+        return self.getCell(i, j).get(label, self.semiring.zero)
+
+    # The value of TOP over the whole sentence (the semiring's zero if the
+    # sentence has no parse)
+    def total(self):
+        if self.n == 0:
+            return self.semiring.zero
+        return self.value(0, self.n, TOP)
+
+
+'''
+The pass itself, for one grammar and semiring, in the form PCFG.fillColumn
+takes (see ViterbiCKY): the binary rules by left child as (right child,
+parent, weight), and the unary chains by bottom as (top, weight), each
+weight the semiring sum over the chains from the top to the bottom
+'''
+
+
+class SemiringCKY:
+    def __init__(self, pcfg, semiring):
+        self.pcfg = pcfg
+        self.semiring = semiring
+        self.leftRules = {}
+        for B, rules in pcfg.ruleIndex()[2].items():
+            self.leftRules[B] = [(C, parent, semiring.weight(prob)) for C, mask, parent, prob, rank, back in rules]
+        chains = pcfg.closure.chainSums(semiring.zero, semiring.plus, semiring.times, semiring.weight)
+        self.unaries = {}
+        for (parent, child), weight in sorted(chains.items(), key=lambda item: (item[0][1], item[0][0])):
+            self.unaries.setdefault(child, []).append((parent, weight))
+
+    def newChart(self, sentence, tokens=None):
+        return SemiringChart(sentence, self.semiring, tokens)
+
+    def leaves(self, cell, labels, probs):
+        plus, weight = self.semiring.plus, self.semiring.weight
+        for label, prob in zip(labels, probs):
+            value = weight(prob)
+            cell[label] = plus(cell[label], value) if label in cell else value
+
+    # Adds the derivations over split point k to cell; returns (rule
+    # applications, 0)
+    def binary(self, cell, left, right, k):
+        plus, times = self.semiring.plus, self.semiring.times
+        applications = 0
+        for B, bValue in left.items():
+            for C, parent, weight in self.leftRules.get(B, ()):
+                cValue = right.get(C)
+                if cValue is None:
+                    continue
+                applications += 1
+                value = times(times(weight, bValue), cValue)
+                cell[parent] = plus(cell[parent], value) if parent in cell else value
+        return applications, 0
+
+    # The unary closure of a cell, from the values its binary (or lexical)
+    # rules left
+    def close(self, cell):
+        if not self.unaries or not cell:
+            return
+        plus, times = self.semiring.plus, self.semiring.times
+        for B, bValue in list(cell.items()):
+            for parent, weight in self.unaries.get(B, ()):
+                value = times(weight, bValue)
+                cell[parent] = plus(cell[parent], value) if parent in cell else value
+
+
+'''
+SemiringCKY for VITERBI_COUNT_INSIDE, with the product written out: a value
+is a (Viterbi log prob, count, inside log prob) tuple as in the generic
+pass, but until close() a cell sums its derivations into [max, count,
+inside max, scaled sum] accumulators (see add()), so the max, the count and
+the log-sum-exp build no tuples per derivation. The inside sum is kept
+relative to the largest inside term so far, one exp per derivation, and
+closed with one log per label
+'''
+
+
+class ViterbiCountInsideCKY(SemiringCKY):
+    def __init__(self, pcfg):
+        SemiringCKY.__init__(self, pcfg, VITERBI_COUNT_INSIDE)
+        # a rule's tuple weight is (prob, 1, prob): keep prob alone
+        for B, rules in self.leftRules.items():
+            self.leftRules[B] = [(C, parent, weight[0]) for C, parent, weight in rules]
+
+    def leaves(self, cell, labels, probs):
+        for label, prob in zip(labels, probs):
+            self.add(cell, label, prob, 1, prob)
+
+    def binary(self, cell, left, right, k):
+        add = self.add
+        applications = 0
+        for B, (bMax, bCount, bInside) in left.items():
+            for C, parent, prob in self.leftRules.get(B, ()):
+                cValue = right.get(C)
+                if cValue is None:
+                    continue
+                applications += 1
+                add(cell, parent, prob + bMax + cValue[0], bCount * cValue[1], prob + bInside + cValue[2])
+        return applications, 0
+
+    # Adds one derivation to the accumulator of a label
+    @staticmethod
+    def add(sums, label, best, count, inside):
+        running = sums.get(label)
+        if running is None:
+            sums[label] = [best, count, inside, 1.0]
+            return
+        if best > running[0]:
+            running[0] = best
+        running[1] += count
+        if inside > running[2]:
+            running[2], running[3] = inside, running[3] * math.exp(running[2] - inside) + 1.0
+        else:
+            running[3] += math.exp(inside - running[2])
+
+    # The values of a cell's accumulators
+    @staticmethod
+    def total(sums):
+        return dict((label, (best, count, inside + math.log(scaled)))
+                    for label, (best, count, inside, scaled) in sums.items())
+
+    # Turns the accumulators of a complete cell into values, and applies the
+    # unary closure to them
+    def close(self, cell):
+        values = self.total(cell)
+        if self.unaries and values:
+            sums = dict((label, [best, count, inside, 1.0]) for label, (best, count, inside) in values.items())
+            for B, (bMax, bCount, bInside) in values.items():
+                for parent, (wMax, wCount, wInside) in self.unaries.get(B, ()):
+                    self.add(sums, parent, wMax + bMax, wCount * bCount, wInside + bInside)
+            values = self.total(sums)
+        cell.clear()
+        cell.update(values)
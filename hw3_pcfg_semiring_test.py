@@ -0,0 +1,52 @@
+import sys
+from hw3_pcfg_semiring import COUNT, VITERBI_COUNT_INSIDE, SemiringCKY
+from hw3_pcfg_testing import allParses, close, logSumExp, randomCases, runTests
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+'''
+Tests of the semiring chart pass (hw3_pcfg_semiring.py): the Viterbi log
+prob, count and inside log prob of the default product must be CKY's prob
+and numParses and the sum over a brute-force enumeration of every parse, and
+ViterbiCountInsideCKY must fill the cells the generic SemiringCKY does
+'''
+
+
+def testSemiringsAgree():
+    for path, pcfg, sentences in randomCases():
+        for sentence in sentences:
+            parses = allParses(path, sentence)
+            tree = pcfg.CKY(sentence)
+            numParses = tree.numParses if tree is not None else 0
+            assert pcfg.semiringParse(sentence, COUNT).total() == numParses, (path, sentence)
+            viterbi, count, inside = pcfg.semiringParse(sentence).total()
+            assert count == numParses, (path, sentence)
+            if parses:
+                assert close(viterbi, tree.prob), (path, sentence)
+                assert close(inside, logSumExp([prob for prob, _ in parses])), (path, sentence)
+                if numpy is not None:
+                    assert close(pcfg.insideOutside(sentence).logZ, inside), (path, sentence)
+            else:
+                assert viterbi == inside == float('-inf'), (path, sentence)
+
+
+def testProductMatchesGeneric():
+    for path, pcfg, sentences in randomCases(seeds=2):
+        generic = SemiringCKY(pcfg, VITERBI_COUNT_INSIDE)
+        for sentence in sentences:
+            tokens, _ = pcfg.lexicon.tokens(sentence)
+            reference, _ = pcfg.fillChart(sentence, tokens=tokens, semiring=generic)
+            chart = pcfg.semiringParse(sentence)
+            for cell, expected in zip(chart.cells, reference.cells):
+                cell, expected = cell or {}, expected or {}
+                assert cell.keys() == expected.keys(), (path, sentence)
+                for label, (viterbi, count, inside) in cell.items():
+                    assert viterbi == expected[label][0] and count == expected[label][1], (path, sentence, label)
+                    assert close(inside, expected[label][2]), (path, sentence, label)
+
+
+if __name__ == "__main__":
+    sys.exit(runTests(globals()))
@@ -1,6 +1,13 @@
 import os
+import sys
+import tracemalloc
 import hw3_pcfg
 
+# Peak memory budget (bytes) for parsing a 60-word sentence, per engine; the
+# A* parse includes growing its outside estimate tables to the longer sentence
+PEAK_MEMORY_LIMIT = {'python': 512 * 1024, 'scan': 512 * 1024, 'numpy': 16 * 1024 * 1024,
+                     'astar': 4 * 1024 * 1024}
+
 
 def readFile(inputFile):
     if os.path.isfile(inputFile):
@@ -20,7 +27,10 @@ def readViterbiScores(inputFile):
         return scores
 
 if __name__ == "__main__":
-    pcfg = hw3_pcfg.PCFG('toygrammar.pcfg')
+    # optional argument: the CKY engine to test ('python', 'scan', 'numpy'
+    # or 'astar')
+    engine = sys.argv[1] if len(sys.argv) > 1 else 'python'
+    pcfg = hw3_pcfg.PCFG('toygrammar.pcfg', engine=engine)
 
     # parse the sentences, trees, scores, and parses from the
     # gold file
@@ -60,7 +70,8 @@ if __name__ == "__main__":
                 matchedGold = False
             if vitTreeScore != scores[i]:
                 matchedScore = False
-            if vitTreeParses != parses[i]:
+            # the A* engine does not count parses (numParses is None)
+            if vitTreeParses is not None and vitTreeParses != parses[i]:
                 matchedParses = False
 
             if not matchedGold and matchedScore:
@@ -83,3 +94,18 @@ if __name__ == "__main__":
 
             if matchedGold and matchedScore and matchedParses:
                 print("Nice job, CKY produces correct viterbi parses and scores!")
+
+    # tracks the peak memory of one long parse, which is mostly the chart
+    longSentence = ("the man eats the tuna " + "and the woman eats the sushi " * 8 +
+                    "and eats the tuna with a fork").split()
+    tracemalloc.start()
+    vitTree = pcfg.CKY(longSentence)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if vitTree is None:
+        print("PARSE FAILURE: ".ljust(25) + "%d-word sentence" % len(longSentence))
+    elif peak > PEAK_MEMORY_LIMIT[engine]:
+        print("ERROR: peak memory of a %d-word parse is %d KB (limit %d KB)"
+              % (len(longSentence), peak // 1024, PEAK_MEMORY_LIMIT[engine] // 1024))
+    else:
+        print("Nice job, peak memory of a %d-word parse is %d KB" % (len(longSentence), peak // 1024))
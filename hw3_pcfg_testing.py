@@ -0,0 +1,183 @@
+import contextlib
+import math
+import os
+import random
+import shutil
+import tempfile
+import hw3_pcfg
+
+'''
+Helpers shared by the *_test.py modules beside this one: small random
+grammars (with unary chains, and with every rule tied for the tie-breaking)
+and a brute-force enumeration of every parse of a sentence to check the
+parser against. The test modules run under pytest, or as scripts like
+hw3_pcfg_test.py:
+
+    python hw3_pcfg_kbest_test.py
+'''
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# log probs computed in different orders agree to this much
+TOLERANCE = 1e-9
+
+
+'''
+Writes a random grammar of `labels` nonterminals (S and X1...) to path:
+binary rules, acyclic unary rules (from a label to a later one) and two
+preterminals per word. With tie, every rule has the same prob, so only the
+tie-breaking decides the Viterbi tree. Returns the words
+'''
+
+
+def randomGrammar(path, seed, tie=False, labels=6, binary=30, unary=6, words=6):
+    r = random.Random(seed)
+    names = ['S'] + ['X%d' % a for a in range(1, labels)]
+
+    def prob():
+        return 0.05 if tie else r.random() / 10
+
+    rules = {}
+    for _ in range(binary):
+        rules[(r.choice(names), r.choice(names), r.choice(names))] = prob()
+    for _ in range(unary):
+        a, b = sorted(r.sample(range(labels), 2))
+        rules[(names[a], names[b])] = prob()
+    for w in range(words):
+        for label in r.sample(names, 2):
+            rules[(label, 'w%d' % w)] = prob()
+    with open(path, "w") as file:
+        file.write("1.0 TOP -> S\n")
+        for rule, p in rules.items():
+            file.write("%r %s -> %s\n" % (p, rule[0], " ".join(rule[1:])))
+    return ['w%d' % w for w in range(words)]
+
+
+def randomSentences(words, count, maxLength, seed):
+    r = random.Random(seed)
+    return [[r.choice(words) for _ in range(r.randint(1, maxLength))] for _ in range(count)]
+
+
+# A scratch directory, removed afterwards
+@contextlib.contextmanager
+def scratchDirectory():
+    directory = tempfile.mkdtemp()
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory)
+
+
+# Writes a grammar's text to a file of a scratch directory and returns its path
+def writeGrammar(directory, name, text):
+    path = os.path.join(directory, name)
+    with open(path, "w") as file:
+        file.write(text)
+    return path
+
+
+'''
+Yields (grammar file, PCFG, sentences) for the random grammars, tied and
+not, in a scratch directory removed afterwards
+'''
+
+
+def randomCases(seeds=3, count=12, maxLength=5):
+    with scratchDirectory() as directory:
+        for seed in range(seeds):
+            for tie in (False, True):
+                path = os.path.join(directory, "random%d%s.pcfg" % (seed, "tie" if tie else ""))
+                words = randomGrammar(path, seed, tie)
+                yield path, hw3_pcfg.PCFG(path), randomSentences(words, count, maxLength, seed)
+
+
+# The sentences of the gold file next to the toy grammar
+def goldSentences():
+    with open(os.path.join(HERE, 'pcfg_test_gold.txt'), "r") as file:
+        return [line.split('|')[2].split() for line in file if line.strip()]
+
+
+'''
+Every parse of a sentence under the grammar in a text file, by brute force
+over the rules as written (n-ary rules included): a list of (log prob, tree
+string in the format of toString) for TOP over the whole sentence. The
+grammar must have no unary cycles
+'''
+
+
+def allParses(grammarFile, words):
+    rules = {}
+    with open(grammarFile, "r") as file:
+        for line in file:
+            fields = line.split()
+            if fields:
+                rules.setdefault(fields[1], []).append((math.log(float(fields[0])), fields[3:]))
+    memo = {}
+
+    def splits(i, j, parts):
+        if parts == 1:
+            yield [(i, j)]
+            return
+        for k in range(i + 1, j - parts + 2):
+            for rest in splits(k, j, parts - 1):
+                yield [(i, k)] + rest
+
+    def parses(label, i, j):
+        if (label, i, j) in memo:
+            return memo[(label, i, j)]
+        found = []
+        for prob, children in rules.get(label, ()):
+            if len(children) == 1 and children[0] not in rules:
+                if j == i + 1 and words[i] == children[0]:
+                    found.append((prob, "( %s %s )" % (label, words[i])))
+                continue
+            if j - i < len(children):
+                continue
+            for spans in splits(i, j, len(children)):
+                partial = [(prob, [])]
+                for child, (a, b) in zip(children, spans):
+                    partial = [(p + q, strings + [s]) for p, strings in partial for q, s in parses(child, a, b)]
+                found.extend((p, "( %s %s )" % (label, " ".join(strings))) for p, strings in partial)
+        memo[(label, i, j)] = found
+        return found
+
+    return parses(hw3_pcfg.TOP, 0, len(words))
+
+
+def logSumExp(values):
+    top = max(values)
+    return top + math.log(sum(math.exp(value - top) for value in values))
+
+
+def close(a, b):
+    return abs(a - b) <= TOLERANCE * max(1.0, abs(a))
+
+
+# Asserts that two parse results are the same tree with the same prob (to
+# TOLERANCE) and numParses
+def assertSameTree(tree, reference, *context):
+    assert (tree is None) == (reference is None), context
+    if tree is not None:
+        assert tree.toString() == reference.toString(), context
+        assert close(tree.prob, reference.prob), context
+        assert tree.numParses == reference.numParses, context
+
+
+'''
+Runs the test functions of a test module's namespace (its globals()), in
+the manner of hw3_pcfg_test.py; returns the exit status
+'''
+
+
+def runTests(namespace):
+    failed = 0
+    for name, test in sorted(namespace.items()):
+        if not name.startswith('test') or not callable(test):
+            continue
+        try:
+            test()
+            print("Nice job, %s passes!" % name)
+        except AssertionError as e:
+            failed += 1
+            print("ERROR: %s failed: %s" % (name, e))
+    return 1 if failed else 0
@@ -0,0 +1,191 @@
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+from hw3_pcfg import InternalItem, readTree
+from hw3_pcfg_grammar import UnaryClosure, UnaryCycleError
+
+'''
+Treebank trainer: estimates a PCFG from bracketed trees (the format of
+InternalItem.toString, one tree per line) by relative frequency, and writes
+it in the text format PCFG.readGrammar reads:
+
+    python hw3_pcfg_train.py treebank.txt grammar.pcfg --workers 8
+
+Lines of the gold file format (score | parses | sentence | tree) are read
+for their tree. Counting is map-reduce: the input is read lazily in chunks
+of lines, each chunk is counted by a worker process, and the partial counts
+are merged as they come back, so the work scales with the number of workers
+while memory stays bounded by the number of distinct rules
+'''
+
+# lines per task handed to a worker
+CHUNK_LINES = 2000
+
+# malformed lines kept (with their messages) for the report
+MAX_ERRORS = 100
+
+
+'''
+RuleCounts are the counts of one chunk of the treebank, or of all of it:
+rules maps (parent, children tuple) to the number of times the rule is used,
+trees counts the trees read and malformed the lines that were not trees,
+the first MAX_ERRORS of them in errors as (line number, message)
+'''
+
+
+class RuleCounts:
+    def __init__(self):
+        self.rules = collections.Counter()
+        self.trees = 0
+        self.malformed = 0
+        self.errors = []
+
+    def merge(self, other):
+        self.rules.update(other.rules)
+        self.trees += other.trees
+        self.malformed += other.malformed
+        self.errors.extend(other.errors[:MAX_ERRORS - len(self.errors)])
+        return self
+
+    def add(self, tree):
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            self.rules[(node.label, tuple(child.label for child in node.children))] += 1
+            stack.extend(child for child in node.children if isinstance(child, InternalItem))
+        self.trees += 1
+
+    '''
+    Returns the rules with their relative frequency (count over the count of
+    all rules of the same parent) as (parent, children, prob), sorted by
+    parent and then by decreasing count, so the commonest rule of a parent
+    comes first in the grammar (and wins ties between equal parses)
+    '''
+
+    def probabilities(self):
+        totals = collections.Counter()
+        for (parent, children), count in self.rules.items():
+            totals[parent] += count
+        rules = sorted(self.rules.items(), key=lambda item: (item[0][0], -item[1], item[0][1]))
+        return [(parent, children, count / totals[parent]) for (parent, children), count in rules]
+
+    '''
+    The parser needs the unary rules between nonterminals to be acyclic (see
+    UnaryClosure), but a treebank can use both A -> B and B -> A. Drops the
+    least frequent rule of each unary cycle until there are none, and
+    returns the dropped rules as (parent, child, count)
+    '''
+
+    def breakUnaryCycles(self):
+        parents = set(parent for parent, children in self.rules)
+        edges = {}
+        for (parent, children), count in self.rules.items():
+            if len(children) == 1 and children[0] in parents:
+                edges.setdefault(parent, []).append((children[0], count))
+        dropped = []
+        while True:
+            try:
+                UnaryClosure.topologicalOrder(edges)
+                return dropped
+            except UnaryCycleError as e:
+                rules = [(dict(edges[parent])[child], parent, child) for parent, child in zip(e.cycle, e.cycle[1:])]
+                count, parent, child = min(rules)
+                edges[parent].remove((child, count))
+                del self.rules[(parent, (child,))]
+                dropped.append((parent, child, count))
+
+
+# Counts the rules of a chunk of (line number, line) pairs
+def countChunk(chunk):
+    counts = RuleCounts()
+    for number, line in chunk:
+        fields = line.split('|')
+        if len(fields) == 4:
+            line = fields[3]
+        try:
+            counts.add(readTree(line))
+        except ValueError as e:
+            counts.malformed += 1
+            if len(counts.errors) < MAX_ERRORS:
+                counts.errors.append((number, str(e)))
+    return counts
+
+
+# Groups the non-blank lines of a stream into chunks of (line number, line)
+def readChunks(stream, size=CHUNK_LINES):
+    chunk = []
+    for number, line in enumerate(stream, 1):
+        if line.strip():
+            chunk.append((number, line))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+'''
+Counts the rules of the trees in a stream of lines over `workers`
+processes (default: one per CPU) and returns the merged RuleCounts. At most
+`window` chunks per worker are in flight, so a treebank of any size is
+read at the pace the workers count it
+'''
+
+
+def countRules(stream, workers=None, window=4, chunkLines=CHUNK_LINES):
+    workers = workers or os.cpu_count() or 1
+    counts = RuleCounts()
+    chunks = readChunks(stream, chunkLines)
+    if workers == 1:
+        for chunk in chunks:
+            counts.merge(countChunk(chunk))
+        return counts
+
+    pool = multiprocessing.Pool(workers)
+    pending = collections.deque()
+    try:
+        for chunk in chunks:
+            pending.append(pool.apply_async(countChunk, (chunk,)))
+            if len(pending) >= workers * window:
+                counts.merge(pending.popleft().get())
+        while pending:
+            counts.merge(pending.popleft().get())
+    finally:
+        pool.close()
+        pool.join()
+    return counts
+
+
+def writeGrammar(counts, path):
+    with open(path, "w") as file:
+        for parent, children, prob in counts.probabilities():
+            file.write("%r %s -> %s\n" % (prob, parent, " ".join(children)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate a PCFG from a treebank of bracketed trees")
+    parser.add_argument("treebank", help="trees, one per line ('-' for stdin)")
+    parser.add_argument("grammar", help="grammar file (.pcfg) to write")
+    parser.add_argument("--workers", type=int, default=None, help="number of counting processes")
+    parser.add_argument("--chunk", type=int, default=CHUNK_LINES, help="lines per worker task")
+    args = parser.parse_args(argv)
+
+    stream = sys.stdin if args.treebank == "-" else open(args.treebank, "r")
+    try:
+        counts = countRules(stream, args.workers, chunkLines=args.chunk)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+    for number, message in counts.errors:
+        sys.stderr.write("%s:%d: %s\n" % (args.treebank, number, message))
+    for parent, child, count in counts.breakUnaryCycles():
+        sys.stderr.write("dropped %s -> %s (used %d times) to break a unary cycle\n" % (parent, child, count))
+    writeGrammar(counts, args.grammar)
+    sys.stderr.write("%d trees, %d rules, %d malformed lines -> %s\n"
+                     % (counts.trees, len(counts.rules), counts.malformed, args.grammar))
+
+
+if __name__ == "__main__":
+    main()